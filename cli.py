@@ -0,0 +1,197 @@
+"""
+Single entry point for the conversions of this repository.
+
+python cli.py export [--check] [xmi files]             # Inception export (or single XMI files) to Standard XML
+python cli.py inline std_xml/*.xml --outfolder inline/   # Standard XML to inline XML
+python cli.py iob | conllu | nne | exp-evts            # training data, see the create_*_training.py scripts
+python cli.py exp-evts --sweep sweep.json              # several exp-evts configs in one pass, see create_exp_training.py
+python cli.py exp std_xml/*.xml --config config.json   # experimental nested format (transformation/to_exp.py)
+python cli.py multi --jobs jobs.json                   # several training formats in one pass, see create_multi_training.py
+python cli.py gt                                       # ground truth for the evaluation, see create_gt.py
+python cli.py from-inference                           # model output to Standard XML
+
+Options which are not given fall back to the settings at the top of the respective script.
+Every subcommand only imports the modules it needs (lxml and the schema are loaded on demand),
+so short invocations stay fast. utils/import_benchmark.py checks that this stays the case.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+
+
+def run_export(args):
+    import postprocess
+    postprocess.TEXT_ENCODING = args.text_encoding
+    postprocess.CROSSING_SPAN_POLICY = args.crossing_policy
+    if args.infiles:
+        postprocess.read_schema()
+        # the same default as running postprocess.py with files
+        postprocess.OUTFOLDER = args.outfolder or postprocess.INFILES_OUTFOLDER
+        all_valid = True
+        for infile in args.infiles:
+            if args.check:
+                report = postprocess.check_xmi(infile)
+                all_valid = all_valid and report["valid"]
+                print(json.dumps(report, ensure_ascii=False))
+            else:
+                postprocess.process_xmi(infile)
+        return all_valid
+
+    import process_export
+    return process_export.main(check=args.check, infolders=args.infolder, outfolder=args.outfolder)
+
+
+def run_inline(args):
+    from transformation import to_inline
+
+    pathlib.Path(args.outfolder).mkdir(parents=True, exist_ok=True)
+    for infile in args.infiles:
+        print(infile)
+        inline = to_inline.process_document(infile)
+        to_inline.write_document(os.path.join(args.outfolder, os.path.basename(infile)), inline)
+
+
+def run_iob(args):
+    import create_iob_training
+    create_iob_training.main(infolder=args.infolder, outfolder=args.outfolder)
+
+
+def run_conllu(args):
+    import create_conllu_training
+    create_conllu_training.main(infolder=args.infolder, outfolder=args.outfolder, consistent_data_file=args.consistent_data)
+
+
+def run_nne(args):
+    import create_nne_training
+    create_nne_training.main(infolder=args.infolder, outfolder=args.outfolder, consistent_data_file=args.consistent_data)
+
+
+def run_exp(args):
+    from transformation import to_exp
+    from transformation.config_compiler import compile_exp_config
+
+    with open(args.config, mode="r", encoding="utf8") as inf:
+        config = compile_exp_config(json.load(inf))
+    pathlib.Path(args.outfolder).mkdir(parents=True, exist_ok=True)
+    for infile in args.infiles:
+        print(f"Processing {infile}...")
+        annotations = to_exp.process_document(infile, config)
+        outname = os.path.basename(infile).replace(".xml", ".txt")
+        with open(os.path.join(args.outfolder, outname), mode="w", encoding="utf8") as outf:
+            for anno in annotations:
+                for token, tag in anno:
+                    outf.write(f"{token}\t{tag}\n")
+                outf.write("\n")
+
+
+def run_exp_evts(args):
+    import create_exp_training
+    if args.sweep:
+        with open(args.sweep, mode="r", encoding="utf8") as inf:
+            jobs = json.load(inf)
+        create_exp_training.sweep(infolder=args.infolder, consistent_data_file=args.consistent_data, jobs=jobs)
+        return
+    create_exp_training.main(infolder=args.infolder, outfolder=args.outfolder, consistent_data_file=args.consistent_data, order_file=args.config)
+
+
+def run_multi(args):
+    import create_multi_training
+    jobs = None
+    if args.jobs:
+        with open(args.jobs, mode="r", encoding="utf8") as inf:
+            jobs = json.load(inf)
+    create_multi_training.main(infolder=args.infolder, consistent_data_file=args.consistent_data, jobs=jobs)
+
+
+def run_gt(args):
+    import create_gt
+    create_gt.main(infiles=args.infiles, outfile=args.outfile, consistent_data_file=args.consistent_data, workers=args.workers,
+                   window=args.window)
+
+
+def run_from_inference(args):
+    from from_inference import postprocess as from_inference
+    kwargs = {}
+    if args.outfolder:
+        kwargs["outfolder"] = args.outfolder
+    if args.data_folder:
+        kwargs["data_folder"] = args.data_folder
+    from_inference.main(**kwargs)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Conversions from and to the Standard XML format.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="convert Inception exports (or XMI files) to Standard XML")
+    export.add_argument("infiles", nargs="*", help="XMI files to convert, if not given the export folders are processed")
+    export.add_argument("--infolder", action="append", help="Inception export folder (may be given multiple times)")
+    export.add_argument("--outfolder", help="default: ./data/std_xml/test/ for XMI files, the OUTFOLDER of process_export.py for the export folders")
+    export.add_argument("--check", action="store_true", help="only validate, print one JSON report per document")
+    export.add_argument("--text-encoding", choices=["tokens", "compact"], default="tokens", help="compact writes one string per line instead of one element per token")
+    export.add_argument("--crossing-policy", choices=["sibling", "shrink", "drop"], default="sibling", help="how crossing spans are repaired, see postprocess.resolve_crossing_spans (default: %(default)s)")
+    export.set_defaults(func=run_export)
+
+    inline = subparsers.add_parser("inline", help="convert Standard XML to inline XML")
+    inline.add_argument("infiles", nargs="+")
+    inline.add_argument("--outfolder", required=True)
+    inline.set_defaults(func=run_inline)
+
+    iob = subparsers.add_parser("iob", help="create IOB training data")
+    iob.add_argument("--infolder")
+    iob.add_argument("--outfolder")
+    iob.set_defaults(func=run_iob)
+
+    for name, func, help in [
+            ("conllu", run_conllu, "create CoNLL-U training data"),
+            ("nne", run_nne, "create nested NER training data"),
+            ("exp-evts", run_exp_evts, "create training data with events and roles")]:
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.add_argument("--infolder")
+        subparser.add_argument("--outfolder")
+        subparser.add_argument("--consistent-data", help="json with the train/dev/test split")
+        if name == "exp-evts":
+            subparser.add_argument("--config", help="transformation config (json)")
+            subparser.add_argument("--sweep", help="json list of variants (config, outfolder), all created in one pass")
+        subparser.set_defaults(func=func)
+
+    exp = subparsers.add_parser("exp", help="experimental nested transformation")
+    exp.add_argument("infiles", nargs="+")
+    exp.add_argument("--config", required=True, help="transformation config (json)")
+    exp.add_argument("--outfolder", required=True)
+    exp.set_defaults(func=run_exp)
+
+    multi = subparsers.add_parser("multi", help="create training data for several formats in one pass")
+    multi.add_argument("--infolder")
+    multi.add_argument("--consistent-data", help="json with the train/dev/test split")
+    multi.add_argument("--jobs", help="json list of jobs (format, config, outfolder), see transformation/export_engine.py")
+    multi.set_defaults(func=run_multi)
+
+    gt = subparsers.add_parser("gt", help="create the ground truth for the evaluation")
+    gt.add_argument("--infiles", help="glob of the Standard XML files")
+    gt.add_argument("--outfile")
+    gt.add_argument("--consistent-data", help="json with the train/dev/test split")
+    gt.add_argument("--workers", type=int, help="number of worker processes, 1 (default) to transform in the main process")
+    gt.add_argument("--window", type=int, help="max. number of unwritten documents per worker")
+    gt.set_defaults(func=run_gt)
+
+    from_inference = subparsers.add_parser("from-inference", help="convert model output to Standard XML")
+    from_inference.add_argument("--outfolder")
+    from_inference.add_argument("--data-folder")
+    from_inference.set_defaults(func=run_from_inference)
+
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    result = args.func(args)
+    # only export returns something (False if a document is invalid)
+    return 1 if result is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,12 @@
-import json
 import csv
 import os
 from glob import glob
-from transformation.to_conllu import process_document, construct_metadata, write_outstring
 
 ### SETTINGS ###
 INFOLDER = "outfiles/"  # The folder where all the standoff xml are
 USER_RANKING = ["kfuchs", "admin", "bhitz"]  # left is preferred
 OUTFOLDER = "trainingdata_conllu/A/"
+CONSISTENT_DATA = "consistent_data.json"
 CONFIG = {
             "mode": "heads",
             "filter": {
@@ -20,40 +19,48 @@ CONFIG = {
         }
 
 
+def main(infolder=None, outfolder=None, consistent_data_file=None):
+    from transformation.to_conllu import process_root, construct_metadata_from_root, write_conllu
+    from transformation.config_compiler import compile_iob_order
+    from transformation.export_engine import SPLITS, load_split_registry, get_split
+    from transformation.text_encoding import parse
+
+    # fail on an invalid config before any document is read
+    config = compile_iob_order(CONFIG, "CONFIG")
+
+    infolder = infolder or INFOLDER
+    outfolder = outfolder or OUTFOLDER
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+
+    infiles = glob(os.path.join(infolder, "*.xml"))
+
+    consistent_data = load_split_registry(consistent_data_file)
+
+    outfiles = {}
+    for split in SPLITS:
+        outfiles[split] = open(os.path.join(outfolder, f"{split}.txt"), mode="w", encoding="utf8")
+        outfiles[split].write("# global.columns = id form ner\n")
+
+    try:
+        # for each file
+        for i, infile in enumerate(infiles):
+            print(f"Processing {infile}...")
+            split = get_split(os.path.basename(infile), consistent_data)
+            if split is None:
+                print(f"WARNING! {infile} was not found in consistent training registry!")
+                continue
+
+            # the document is parsed once for the annotations and the metadata
+            root = parse(infile)
+            token_list, annotations = process_root(root, config)
+            metadata = construct_metadata_from_root(root, i, token_list)
+
+            write_conllu(outfiles[split], token_list, annotations, metadata)
+            outfiles[split].write("\n")
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+
+
 if __name__ == "__main__":
-    infiles = glob(INFOLDER + "*.xml")
-
-    trainfile = open(OUTFOLDER + "train.txt", mode="w", encoding="utf8")
-    trainfile.write("# global.columns = id form ner\n")
-    devfile = open(OUTFOLDER + "dev.txt", mode="w", encoding="utf8")
-    devfile.write("# global.columns = id form ner\n")
-    testfile = open(OUTFOLDER + "test.txt", mode="w", encoding="utf8")
-    testfile.write("# global.columns = id form ner\n")
-    
-    # for each file
-    for i, infile in enumerate(infiles):
-        print(f"Processing {infile}...")
-        token_list, annotations = process_document(infile, CONFIG)
-        metadata = construct_metadata(infile, i)
-
-        with open("consistent_data.json", mode="r", encoding="utf8") as cons:
-            consistent_data = json.load(cons)
-
-        basename = os.path.basename(infile)
-        
-        if basename in consistent_data["test"]:
-            writer = testfile
-        elif basename in consistent_data["dev"]:
-            writer = devfile
-        elif basename in consistent_data["train"]:
-            writer = trainfile
-        else:
-            print(f"WARNING! {infile} was not found in consistent training registry!")
-            continue
-
-        writer.write(write_outstring(token_list, annotations, metadata))
-        writer.write("\n")
-
-    trainfile.close()
-    devfile.close()
-    testfile.close()
+    main()
@@ -13,6 +13,10 @@ Mind you the script uses randomness to decide where to put any respective docume
 and may especially vary if the dataset is small.
 
 For more order examples, check to_iob.py in the transformation subfolder.
+
+Several variants of the config (e.g. different cols or span_modifications) can be created in one pass with sweep:
+the spans of every document are extracted once and shared by all configs, so every further variant
+only costs the rendering of its samples (see transformation/export_engine.py).
 """
 
 import json
@@ -20,7 +24,6 @@ import csv
 import os
 from glob import glob
 import pathlib
-from transformation.to_exp_evts import process_document
 
 
 ### SETTINGS ###
@@ -29,28 +32,42 @@ OUTFOLDER = "./data/rec_training/ner_rec/24_07_24_role_detect_fixed"
 #OUTFOLDER = "./data/rec_training/ner_rec/ner_rec_24_07_01"
 CONSISTENT_DATA = "./data/training_data_json/ner_rec/only_evts_24_07_01.json"
 #CONSISTENT_DATA = "./data/training_data_json/ner_rec/ner_rec_24_07_01.json"
-ORDER = json.load(open("./data/transformation_configs/ner_nested/ner_nested_plus_roles.json", mode="r", encoding="utf8"))
+ORDER_FILE = "./data/transformation_configs/ner_nested/ner_nested_plus_roles.json"
+# the variants for sweep, each with its config file (or the config itself) and outfolder
+SWEEP_JOBS = [
+    {"config": ORDER_FILE, "outfolder": OUTFOLDER},
+]
 
-if __name__ == "__main__":
-    pathlib.Path(OUTFOLDER).mkdir(parents=True, exist_ok=True) 
 
-    infiles = sorted(glob(INFOLDER + "*.xml"))
+def main(infolder=None, outfolder=None, consistent_data_file=None, order_file=None):
+    from transformation.to_exp_evts import process_document, write_samples
+    from transformation.config_compiler import compile_evts_config
+
+    infolder = infolder or INFOLDER
+    outfolder = outfolder or OUTFOLDER
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+    with open(order_file or ORDER_FILE, mode="r", encoding="utf8") as order_f:
+        # fail on an invalid order before any document is read
+        order = compile_evts_config(json.load(order_f))
+
+    pathlib.Path(outfolder).mkdir(parents=True, exist_ok=True) 
 
-    trainfile = open(os.path.join(OUTFOLDER, "train.txt"), mode="w", encoding="utf8")
-    devfile = open(os.path.join(OUTFOLDER, "dev.txt"), mode="w", encoding="utf8")
-    testfile = open(os.path.join(OUTFOLDER, "test.txt"), mode="w", encoding="utf8")
+    infiles = sorted(glob(os.path.join(infolder, "*.xml")))
+
+    trainfile = open(os.path.join(outfolder, "train.txt"), mode="w", encoding="utf8")
+    devfile = open(os.path.join(outfolder, "dev.txt"), mode="w", encoding="utf8")
+    testfile = open(os.path.join(outfolder, "test.txt"), mode="w", encoding="utf8")
 
     #trainwriter = csv.writer(trainfile, delimiter="\t", lineterminator="\n")
     #devwriter = csv.writer(devfile, delimiter="\t", lineterminator="\n")
     #testwriter = csv.writer(testfile, delimiter="\t", lineterminator="\n")
 
-    with open(CONSISTENT_DATA, mode="r", encoding="utf8") as cons:
+    with open(consistent_data_file, mode="r", encoding="utf8") as cons:
         consistent_data = json.load(cons)
 
     # for each file
     for infile in infiles:
         print(f"Processing {infile}...")
-        outstring = process_document(infile, ORDER)
         basename = os.path.basename(infile)
         
         if basename in consistent_data["test"]:
@@ -63,11 +80,8 @@ if __name__ == "__main__":
             print(f"WARNING! {infile} was not found in consistent training registry!")
             continue
 
-        # write the filename as a comment (flair ignores these in ColumnCorpus)
-        if outstring:
-            writer.write(f"# {os.path.basename(infile)}\n")
-            writer.write(outstring)
-            writer.write("\n")
+        # the samples are rendered while they are written, write the filename as a comment
+        write_samples(writer, process_document(infile, order), comment=basename)
         """
         for anno in annotations:
             for token, tag in anno:
@@ -78,3 +92,27 @@ if __name__ == "__main__":
     trainfile.close()
     devfile.close()
     testfile.close()
+
+
+def sweep(infolder=None, consistent_data_file=None, jobs=None):
+    from transformation import export_engine
+
+    infolder = infolder or INFOLDER
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+    jobs = jobs or SWEEP_JOBS
+
+    engine_jobs = []
+    for job in jobs:
+        config = job["config"]
+        if isinstance(config, str):
+            with open(config, mode="r", encoding="utf8") as order_f:
+                config = json.load(order_f)
+        engine_jobs.append({"format": "exp_evts", "config": config, "outfolder": job["outfolder"]})
+
+    infiles = sorted(glob(os.path.join(infolder, "*.xml")))
+    # all configs are compiled before the first document is read (see export_engine.run)
+    export_engine.run(infiles, engine_jobs, export_engine.load_split_registry(consistent_data_file))
+
+
+if __name__ == "__main__":
+    main()
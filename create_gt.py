@@ -1,29 +1,80 @@
 """
 Creates ground truth as required by the new evaluation algorithm.
+
+The test documents are transformed (see to_anno_tree.transform) and streamed into the output file one after
+another, in the order of their file names. With more than one worker they are transformed by a process pool,
+at most WINDOW * WORKERS documents are transformed but not yet written at any time (see
+transformation/parallel.py), so the memory use does not grow with the size of the corpus.
 """
 
-from transformation import to_anno_tree
+import argparse
 import glob, os, json
-from lxml import etree as et
 import pathlib
 
 
 INFILES = "./data/std_xml/24_07_01/*.xml"
 OUTFILE = "./data/gt/gt_24_07_01.xml"
 CONSISTENT_DATA = "./data/training_data_json/ner_rec/ner_rec_24_07_01.json"
+WORKERS = 1  # number of worker processes, 1 transforms in the main process
+WINDOW = 64  # max. number of documents per worker which are transformed but not yet written
 
 
-if __name__ == "__main__":
-    with open(CONSISTENT_DATA, mode="r", encoding="utf8") as cons:
-        consistent_data = json.load(cons)
+def transform_document(infile):
+    """
+    Returns the serialized annotation tree of infile (run in the worker processes).
+    """
+    from lxml import etree as et
+    from transformation import to_anno_tree
+    return et.tostring(to_anno_tree.transform(infile))
+
+
+def main(infiles=None, outfile=None, consistent_data_file=None, workers=None, window=None):
+    from lxml import etree as et
+    from transformation import to_anno_tree
+    from transformation.parallel import imap_ordered
+
+    infiles = infiles or INFILES
+    outfile = outfile or OUTFILE
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+    workers = workers or WORKERS
+    window = window or WINDOW
+
+    with open(consistent_data_file, mode="r", encoding="utf8") as cons:
+        test_files = set(json.load(cons)["test"])
+
+    infiles = [infile for infile in sorted(glob.glob(infiles)) if os.path.basename(infile) in test_files]
 
-    out = et.Element("Corpus")
-    for infile in sorted(glob.glob(INFILES)):
-        outname = os.path.basename(infile)
-        if outname in consistent_data["test"]:
+    def announce():
+        for infile in infiles:
             print(infile)
-            root = to_anno_tree.transform(infile)
-            out.append(root)
-    out_tree = et.ElementTree(out)
-    pathlib.Path(OUTFILE).parent.mkdir(parents=True, exist_ok=True)
-    out_tree.write(OUTFILE, xml_declaration=True, pretty_print=True, encoding="utf8")
\ No newline at end of file
+            yield infile
+
+    if workers <= 1:
+        documents = imap_ordered(to_anno_tree.transform, announce())
+    else:
+        documents = (et.fromstring(result) for result in imap_ordered(transform_document, announce(), workers, window))
+
+    pathlib.Path(outfile).parent.mkdir(parents=True, exist_ok=True)
+    with open(outfile, mode="wb") as outf:
+        with et.xmlfile(outf, encoding="UTF8") as xf:
+            xf.write_declaration()
+            with xf.element("Corpus"):
+
+                for i, document in enumerate(documents):
+                    # the same indentation as a pretty printed Corpus element
+                    xf.write("\n  " if i == 0 else "  ")
+                    xf.write(document, pretty_print=True)
+        outf.write(b"\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the ground truth for the evaluation.")
+    parser.add_argument("--infiles", default=INFILES, help="glob of the Standard XML files")
+    parser.add_argument("--outfile", default=OUTFILE)
+    parser.add_argument("--consistent-data", default=CONSISTENT_DATA, help="json with the train/dev/test split")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of worker processes, 1 to transform in the main process")
+    parser.add_argument("--window", type=int, default=WINDOW, help="max. number of unwritten documents per worker")
+    args = parser.parse_args()
+
+    main(infiles=args.infiles, outfile=args.outfile, consistent_data_file=args.consistent_data,
+         workers=args.workers, window=args.window)
@@ -20,7 +20,6 @@ import os
 from collections import defaultdict, Counter
 from glob import glob
 import random
-from transformation.to_iob import process_document
 
 
 ### SETTINGS ###
@@ -108,14 +107,16 @@ def check_for_duplicates(infiles):
         print(duplicates)
 
 
-def validate_data_flair():
+def validate_data_flair(outfolder):
+    from flair.datasets import ColumnCorpus
+
     columns = {0: "text"}
     labels = []
     for i, order in enumerate(reversed(ORDERS)):
         columns[i+1] = order["name"]
         labels.append(order["name"])
 
-    corpus = ColumnCorpus(OUTFOLDER, columns,
+    corpus = ColumnCorpus(outfolder, columns,
                           train_file="train.txt",
                           test_file="test.txt",
                           dev_file="dev.txt")
@@ -125,8 +126,16 @@ def validate_data_flair():
         print(label_dict)
 
 
-if __name__ == "__main__":
-    infiles = glob(INFOLDER + "*.xml")
+def main(infolder=None, outfolder=None):
+    from transformation.to_iob import process_document, write_training_document
+    from transformation.config_compiler import compile_iob_orders
+
+    # fail on an invalid order before any document is read
+    orders = compile_iob_orders(ORDERS)
+    infolder = infolder or INFOLDER
+    outfolder = outfolder or OUTFOLDER
+
+    infiles = glob(os.path.join(infolder, "*.xml"))
 
     # sort out duplicates
     infiles = sort_out_duplicates(infiles)
@@ -134,9 +143,9 @@ if __name__ == "__main__":
     # do a last check to weed out any possible duplicates that might skew training
     check_for_duplicates(infiles)
 
-    trainfile = open(OUTFOLDER + "train.txt", mode="w", encoding="utf8")
-    devfile = open(OUTFOLDER + "dev.txt", mode="w", encoding="utf8")
-    testfile = open(OUTFOLDER + "test.txt", mode="w", encoding="utf8")
+    trainfile = open(os.path.join(outfolder, "train.txt"), mode="w", encoding="utf8")
+    devfile = open(os.path.join(outfolder, "dev.txt"), mode="w", encoding="utf8")
+    testfile = open(os.path.join(outfolder, "test.txt"), mode="w", encoding="utf8")
 
     trainwriter = csv.writer(trainfile, delimiter="\t", lineterminator="\n")
     devwriter = csv.writer(devfile, delimiter="\t", lineterminator="\n")
@@ -145,7 +154,7 @@ if __name__ == "__main__":
     # for each file
     for _, (_, infile) in infiles.items():
         print(f"Processing {infile}...")
-        token_list, annotation_cols = process_document(infile, ORDERS)
+        token_list, annotation_cols = process_document(infile, orders)
 
         r = random.random()
         if r < DATA_RATIO[2]:
@@ -155,11 +164,7 @@ if __name__ == "__main__":
         else:
             writer = trainwriter
 
-        # write the filename as a comment (flair ignores these in ColumnCorpus)
-        writer.writerow([f"# {os.path.basename(infile)}"])
-        for token, *order in zip(token_list, list(zip(*annotation_cols[::-1]))):
-            writer.writerow([token] + list(order[0]))
-        writer.writerow([])
+        write_training_document(writer, os.path.basename(infile), token_list, annotation_cols)
 
 
     trainfile.close()
@@ -168,7 +173,10 @@ if __name__ == "__main__":
 
     # only use this if flair is installed
     try:
-        from flair.datasets import ColumnCorpus
-        validate_data_flair()
+        validate_data_flair(outfolder)
     except ImportError as e:
-        print("Did not validate IOB with flair because no flair module was found.")
\ No newline at end of file
+        print("Did not validate IOB with flair because no flair module was found.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Use this script to generate the training data for several formats in one pass.
+Every document is parsed (and transformed to inline XML) only once, see transformation/export_engine.py.
+The configs are the same as in the single create_*_training.py scripts,
+the split into train/dev/test is taken from the consistent training registry for all formats.
+"""
+
+import os
+from glob import glob
+
+### SETTINGS ###
+INFOLDER = "outfiles/"  # The folder where all the standoff xml are
+CONSISTENT_DATA = "consistent_data.json"
+JOBS = [
+    {
+        "format": "iob",
+        "outfolder": "trainingdata/",
+        "config": [
+            {
+                "name": "ner",
+                "mode": "heads",
+                "filter": {
+                    "mention_type": ["nam"],
+                },
+                "tags": {
+                    "entity_type|desc_type|value_type": ["date", "per", "loc", "money", "gpe", "org"]
+                },
+                "depth": 1,
+                "tag_granularity": 1,
+            },
+        ],
+    },
+    {
+        "format": "conllu",
+        "outfolder": "trainingdata_conllu/A/",
+        "config": {
+            "mode": "heads",
+            "filter": {
+            },
+            "tags": {
+                "entity_type": []
+            },
+            "depth": 1,
+            "tag_granularity": 1
+        },
+    },
+    {
+        "format": "nne",
+        "outfolder": "trainingdata_nne/",
+        "config": {
+            "tags": {
+                "Reference": {"tag": "ref", "entity_type": {"include": [], "prefix": "ent"}},
+                "Attribute": {"tag": "ref", "entity_type": {"include": [], "prefix": "ent"}},
+                "Value": {"tag": "val", "value_type": {"include": [], "prefix": "val"}},
+            },
+            "tag_granularity": 1,
+        },
+    },
+]
+
+
+def main(infolder=None, consistent_data_file=None, jobs=None):
+    from transformation import export_engine
+
+    infolder = infolder or INFOLDER
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+    jobs = jobs or JOBS
+
+    infiles = sorted(glob(os.path.join(infolder, "*.xml")))
+
+    export_engine.run(infiles, jobs, export_engine.load_split_registry(consistent_data_file))
+
+
+if __name__ == "__main__":
+    main()
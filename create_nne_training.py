@@ -2,7 +2,6 @@ import os
 from collections import Counter
 from glob import glob
 import json
-from transformation.to_nne import process_document
 import pathlib
 
 ### SETTINGS ###
@@ -44,21 +43,31 @@ ORDER = {
         }
 
 
-if __name__ == "__main__":
-    pathlib.Path(OUTFOLDER).mkdir(parents=True, exist_ok=True) 
+def main(infolder=None, outfolder=None, consistent_data_file=None):
+    from transformation.to_nne import process_document
+    from transformation.config_compiler import compile_nne_config
+
+    # fail on an invalid order before any document is read
+    order = compile_nne_config(ORDER)
+
+    infolder = infolder or INFOLDER
+    outfolder = outfolder or OUTFOLDER
+    consistent_data_file = consistent_data_file or CONSISTENT_DATA
+
+    pathlib.Path(outfolder).mkdir(parents=True, exist_ok=True) 
+
+    infiles = glob(os.path.join(infolder, "*.xml"))
 
-    infiles = glob(INFOLDER + "*.xml")
+    with open(consistent_data_file, mode="r", encoding="utf8") as cons:
+        consistent_data = json.load(cons)
 
-    trainfile = open(os.path.join(OUTFOLDER, "train.txt"), mode="w", encoding="utf8")
-    devfile = open(os.path.join(OUTFOLDER, "dev.txt"), mode="w", encoding="utf8")
-    testfile = open(os.path.join(OUTFOLDER, "test.txt"), mode="w", encoding="utf8")
+    trainfile = open(os.path.join(outfolder, "train.txt"), mode="w", encoding="utf8")
+    devfile = open(os.path.join(outfolder, "dev.txt"), mode="w", encoding="utf8")
+    testfile = open(os.path.join(outfolder, "test.txt"), mode="w", encoding="utf8")
 
     for infile in infiles:
         print(f"Processing {infile}...")
-        text, annotations = process_document(infile, ORDER)
-
-        with open(CONSISTENT_DATA, mode="r", encoding="utf8") as cons:
-            consistent_data = json.load(cons)
+        text, annotations = process_document(infile, order)
 
         basename = os.path.basename(infile)
         
@@ -79,3 +88,7 @@ if __name__ == "__main__":
     trainfile.close()
     devfile.close()
     testfile.close()
+
+
+if __name__ == "__main__":
+    main()
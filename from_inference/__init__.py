@@ -0,0 +1,3 @@
+"""
+Transformations from model output back to Standard XML.
+"""
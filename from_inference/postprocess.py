@@ -293,14 +293,11 @@ def add_metadata(xmltree, metadata):
     change.text = "Postprocessing of automatically annotated document. Annotation was performed by using Flair Recursive Algorithm developed by IP, using model 'specific_full'."
 
 
-if __name__ == "__main__":
-    outfolder = "./out/hgb_specific_full/"
-
-    data_folder = "./data/hgb_corpus/"
+def main(outfolder="./out/hgb_specific_full/", data_folder="./data/hgb_corpus/"):
     #sentence_file = "../data/from_rec_flair/test_data_plain.txt"
-    corpus_file = data_folder + "hgb_corpus.json"
-    anntation_file = data_folder + "annotated.jsonl"
-    conversion_file = data_folder + "conv_specific_full.json"
+    corpus_file = os.path.join(data_folder, "hgb_corpus.json")
+    anntation_file = os.path.join(data_folder, "annotated.jsonl")
+    conversion_file = os.path.join(data_folder, "conv_specific_full.json")
 
     if corpus_file.endswith(".json"):
         meta_sents = read_sentences_from_pd_json(corpus_file)  # maybe also immediately read metadata from here
@@ -321,4 +318,8 @@ if __name__ == "__main__":
 
         add_metadata(std_xml, m)
 
-        std_xml.write(outpath, pretty_print=True, xml_declaration=True, encoding='UTF-8')
\ No newline at end of file
+        std_xml.write(outpath, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+
+
+if __name__ == "__main__":
+    main()
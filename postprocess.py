@@ -1,14 +1,23 @@
 # Read XMI standoff annotation file and convert it into a XML file similar to TEI with standoff annotation for relationships
 # Export the files from Inception as UIMA CAS XMI (XML 1.1) and put them (unzipped!) in the folder named unter "infiles"
-# Important: This code assumes no intersecting entities!
+# Important: Intersecting (crossing) entities are reported and resolved by CROSSING_SPAN_POLICY before the node tree is built!
+# Only "shrink" and "drop" guarantee properly nested spans in the output, "sibling" keeps the crossing offsets.
+# Run with --check to only validate the annotations without writing any output (see check_general).
 
+import argparse
+import contextlib
 import glob
+import heapq
+import io
 import json
 import os
 import re
+import sys
 from lxml import etree as et
 from utils.text_modification import modify_text
 from utils.small_corrections import small_corrects
+from transformation.text_encoding import tokenize_text, write_compact_text, elide_token_text
+from transformation.corrections import fix_att_full_coverage
 import pathlib
 import pprint as pp
 from collections import defaultdict
@@ -53,9 +62,13 @@ def convert_char_to_token_idx(start_index_dict, end_index_dict, start, end, enti
     return token_start, token_end
 
 
-def create_node_tree(in_root, document_text, start_index_dict, end_index_dict):
+def collect_spans(in_root, document_text, start_index_dict, end_index_dict):
     """
-    This node tree is mostly just as a help, but the code may probably easily be adopted to port everything to a TEI-format.
+    Classifies all spans of the CAS and converts their character indices to token indices.
+    Spans which are not relevant for the node tree (e.g. htr-tags) are skipped.
+
+    Returns a list of dicts sorted by (token_start, -token_end), so containing spans always come
+    before the spans they contain. NOTE: token_end is exclusive here, as in the output.
     """
     spans = in_root.findall(".//custom:Span", namespaces={"custom":"http:///custom.ecore"})
     # note which entity and which tag, start or end, needs to be inserted at this point
@@ -63,9 +76,8 @@ def create_node_tree(in_root, document_text, start_index_dict, end_index_dict):
     for ent in spans:
         sorted_spans.append((ent, int(ent.get("begin")), int(ent.get("end")), get_node_priority(ent)))
     sorted_spans.sort(key=lambda x: (x[1], -x[2], x[3]))
-    work_root = et.Element("XML", nsmap={"custom":"http:///custom.ecore", "cas":"http:///uima/cas.ecore"})
-    parent_node = work_root
-    for entity, start, end, _ in sorted_spans:
+    out = []
+    for entity, start, end, priority in sorted_spans:
         # classify if span is entity, attribute or description
         label = entity.get('label')
         if label == None:
@@ -119,16 +131,141 @@ def create_node_tree(in_root, document_text, start_index_dict, end_index_dict):
 
         token_start, token_end = convert_char_to_token_idx(start_index_dict, end_index_dict, start, end, entity)
 
+        out.append({
+            "id": entity.get("{http://www.omg.org/XMI}id"),
+            "span_type": span_type,
+            "label": label,
+            "role": role,
+            # NOTE: We increase token_end by 1 to match common span annotation schemes (which usually mark a span of length 1 as x to x+1)
+            "token_start": token_start,
+            "token_end": token_end + 1,
+            "start": start,
+            "end": end,
+            "priority": priority,
+        })
+
+    # an annotation ending inside a token is stretched to the token end, so we sort again on the token indices
+    # (the sort is stable, so this only changes something for stretched spans)
+    out.sort(key=lambda x: (x["token_start"], -x["token_end"]))
+    return out
+
+
+def find_crossing_spans(spans):
+    """
+    Sweep-line over the spans sorted by (token_start, -token_end).
+    Returns all pairs (earlier, later) of spans which partially overlap, i.e.
+    earlier.start < later.start < earlier.end < later.end.
+
+    The spans which are still open at the current position are kept in a heap by their end,
+    closed spans are popped from the top and the open spans ending inside of the current one are found
+    by walking down the heap only as long as the ends are smaller (the children of a node never end earlier).
+    So the whole pass takes O(n log n + k log k) for k crossings.
+    """
+    crossings = []
+    active = []  # heap of (end, position in spans, span)
+    for i, span in enumerate(spans):
+        start, end = span["token_start"], span["token_end"]
+        # spans ending before the current one starts are closed
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        # all open spans started at or before start. Those starting at start end after end (because of the sorting),
+        # so every open span ending inside of the current span is crossing it.
+        found = []
+        todo = [0] if active and active[0][0] < end else []
+        while todo:
+            k = todo.pop()
+            found.append(active[k])
+            for child in (2 * k + 1, 2 * k + 2):
+                if child < len(active) and active[child][0] < end:
+                    todo.append(child)
+        # report them by their end, as they are found in the document
+        for _, _, other in sorted(found, key=lambda entry: entry[:2]):
+            crossings.append((other, span))
+        heapq.heappush(active, (end, i, span))
+    return crossings
+
+
+def resolve_crossing_spans(spans, end_index_dict, policy):
+    """
+    Detects crossing spans and repairs them according to the policy:
+    - "sibling": keep both spans, the later span is promoted to be a sibling of the span it crosses
+                 (it is put below the nearest span which contains it completely)
+                 NOTE: only the hierarchy is nested then, the offsets of both spans still cross each other,
+                 so the Standard XML is not properly nested.
+                 Use "shrink" or "drop" if the output has to be properly nested.
+    - "shrink": the end of the later span is moved to the end of the span it crosses, so it becomes nested
+    - "drop": the later span is removed
+
+    Every crossing is reported with the XMI ids of both spans.
+    Returns the remaining spans (still sorted) and the list of crossings as dicts.
+    """
+    if policy not in CROSSING_SPAN_POLICIES:
+        raise ValueError(f"Unknown crossing span policy '{policy}', use one of {', '.join(CROSSING_SPAN_POLICIES)}.")
+
+    report = []
+    token_to_char_end = None
+    crossings = find_crossing_spans(spans)
+    while crossings:
+        for earlier, later in crossings:
+            print(f"ERROR: The span with id {later['id']} crosses the span with id {earlier['id']}. Resolving it by policy '{policy}'.")
+            report.append({"id": later["id"], "other_id": earlier["id"], "resolution": policy})
+        if policy == "sibling":
+            # nothing to change, create_node_tree puts the span below the nearest span which contains it
+            break
+        elif policy == "drop":
+            dropped = set(id(later) for _, later in crossings)
+            spans = [span for span in spans if id(span) not in dropped]
+        elif policy == "shrink":
+            if token_to_char_end is None:
+                token_to_char_end = {token: char for char, token in end_index_dict.items()}
+            for earlier, later in crossings:
+                if earlier["token_end"] < later["token_end"]:
+                    later["token_end"] = earlier["token_end"]
+                    later["end"] = token_to_char_end[earlier["token_end"] - 1]
+            spans.sort(key=lambda x: (x["token_start"], -x["token_end"], x["start"], -x["end"], x["priority"]))
+        # shrinking may reveal new crossings with spans that were nested before, so we repeat until nothing crosses anymore
+        crossings = find_crossing_spans(spans)
+
+    return spans, report
+
+
+def create_node_tree(in_root, document_text, start_index_dict, end_index_dict, crossing_policy=None, crossing_report=None):
+    """
+    This node tree is mostly just as a help, but the code may probably easily be adopted to port everything to a TEI-format.
+
+    Crossing spans are resolved before the tree is built (see resolve_crossing_spans), so every node
+    is contained in its parent. If a list is given as crossing_report, the crossings are added to it.
+    """
+    if crossing_policy is None:
+        crossing_policy = CROSSING_SPAN_POLICY
+    spans = collect_spans(in_root, document_text, start_index_dict, end_index_dict)
+    spans, crossings = resolve_crossing_spans(spans, end_index_dict, crossing_policy)
+    if crossing_report is not None:
+        crossing_report.extend(crossings)
+
+    work_root = et.Element("XML", nsmap={"custom":"http:///custom.ecore", "cas":"http:///uima/cas.ecore"})
+    parent_node = work_root
+    for span in spans:
+        token_start, token_end = span["token_start"], span["token_end"]
+        attributes = {
+            "id": span["id"],
+            "span_type": span["span_type"],
+            "label": span["label"],
+            "role": span["role"],
+            "start": str(token_start),
+            "end": str(token_end),
+            "text": document_text[span["start"]:span["end"]],
+        }
+
         # We need to check all parent nodes above if they contain the current node
-        # NOTE: We increase token_end by 1 to match common span annotation schemes (which usually mark a span of length 1 as x to x+1)
         while(parent_node != work_root):
-            if token_end <= int(parent_node.get("end"))-1:
-                current_node = et.SubElement(parent_node, "Entity", id=entity.get("{http://www.omg.org/XMI}id"), span_type=span_type, label=label, role=role, start=str(token_start), end=str(token_end+1), text=document_text[start:end])
+            if token_end <= int(parent_node.get("end")):
+                current_node = et.SubElement(parent_node, "Entity", attributes)
                 break
             else:
                 parent_node = parent_node.getparent()
         else:
-            current_node = et.SubElement(work_root, "Entity", id=entity.get("{http://www.omg.org/XMI}id"), span_type=span_type, label=label, role=role, start=str(token_start), end=str(token_end+1), text=document_text[start:end])
+            current_node = et.SubElement(work_root, "Entity", attributes)
         parent_node = current_node
 
     # We get relations from three sources: relation layer, att and desc
@@ -172,13 +309,13 @@ def process_others(other_info, mention_id):
     return numerus, spec, tempus
 
 def apply_entity_type_conversions(entity_type):
-    for o, r in SCHEMA_INFO["conversions"]["entity_types"].items():
-        entity_type = re.sub(o, r, entity_type)
+    for o, r in ENTITY_TYPE_CONVERSIONS:
+        entity_type = o.sub(r, entity_type)
     return entity_type
 
 def apply_role_name_conversions(entity_type):
-    for o, r in SCHEMA_INFO["conversions"]["role_names"].items():
-        entity_type = re.sub(o, r, entity_type)
+    for o, r in ROLE_NAME_CONVERSIONS:
+        entity_type = o.sub(r, entity_type)
     return entity_type
 
 old_to_new_ids = {}
@@ -1006,29 +1143,162 @@ def write_text(text_elem, text):
 
     NOTE: THIS DOES NOT PERFORM ANY "PROPER" PREPROCESSING!
     """
-    lines = text.split("\n")
     start_index_dict = {}
     end_index_dict = {}
-    current_index = 0
     j = 0
-    for i, line in enumerate(lines):
-        if not line and i+1 == len(lines):  # remove empty trailing strings
-            continue
+    for i, tokens in tokenize_text(text):
         line_elem = et.SubElement(text_elem, "L", line_id=str(i))
-        tokens = line.split(" ")
-        for token in tokens:
-            if not token:
-                current_index += 1  # for the whitespace we removed earlier
-                continue
-            start_index_dict[current_index] = j
+        for char_start, token in tokens:
+            start_index_dict[char_start] = j
             token_elem = et.SubElement(line_elem, "T", token_id=str(j))
             token_elem.text = token
-            current_index += len(token)
-            end_index_dict[current_index] = j
-            current_index += 1  # for the whitespace we removed earlier
+            end_index_dict[char_start + len(token)] = j
+            j += 1
+    return start_index_dict, end_index_dict
+
+
+def index_text(text):
+    """
+    Same as write_text, but only returns the start and end dictionaries
+    without creating any token elements.
+    """
+    start_index_dict = {}
+    end_index_dict = {}
+    j = 0
+    for _, tokens in tokenize_text(text):
+        for char_start, token in tokens:
+            start_index_dict[char_start] = j
+            end_index_dict[char_start + len(token)] = j
             j += 1
     return start_index_dict, end_index_dict
 
+
+def collect_messages(func, *args, **kwargs):
+    """
+    Calls func and captures everything it prints (our warnings and errors)
+    instead of writing it to stdout. Returns the result and the list of printed lines.
+    """
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = func(*args, **kwargs)
+    return result, [line for line in buffer.getvalue().splitlines() if line.strip()]
+
+
+def get_event_ids(container):
+    """
+    Returns the ids of all events that can claim roles from the children of container
+    (mirrors how write_events collects its roles). An empty string stands for an event without id.
+    """
+    event_ids = set()
+    if container.get("span_type") == "evspan":
+        event_id = container.get("label").split(".")[0]
+        event_ids.add(event_id[6:] if len(event_id) >= 7 else "")
+    triggers = [c for c in container.iterchildren("Entity") if c.get("span_type") == "evtrigger"]
+    for trigger in triggers:
+        event_id = trigger.get("label").split(".")[0]
+        event_ids.add(event_id[2:] if len(event_id) >= 3 else "")
+    return event_ids
+
+
+def check_consistency(work_root):
+    """
+    Runs the consistency checks on the node tree without creating any output.
+    Returns a list of error dicts (type, id of the XMI span and a message).
+    The ids are the xmi:ids, so the spans can easily be found in Inception.
+    Crossing spans are already resolved in the node tree, they are reported by create_node_tree.
+    """
+    errors = []
+
+    coref_targets = {}
+    for relation in work_root.iterchildren("Relation"):
+        if relation.get("label").lower().split(".")[0] == "coref":
+            coref_targets[relation.get("from_entity")] = relation.get("to_entity")
+    entities = {entity.get("id"): entity for entity in work_root.iter("Entity")}
+
+    for entity in work_root.iter("Entity"):
+        span_type = entity.get("span_type")
+        label = entity.get("label").lower().split(".")
+        parent = entity.getparent()
+
+        # attributes always need a mention they belong to
+        if span_type == "att" and parent.tag == "XML":
+            errors.append({"type": "orphan_attribute", "id": entity.get("id"), "message": f"Attribute {entity.get('id')} is not child of another mention."})
+        elif span_type == "att" and parent.get("span_type") == "head":
+            errors.append({"type": "orphan_attribute", "id": entity.get("id"), "message": f"Attribute {entity.get('id')} has a head-Element as parent."})
+
+        # PRO and SELF without further tags need a coreference chain ending in a full mention
+        if span_type == "ent" and label[0] in ["pro", "self"] and len(label) == 1:
+            current = entity
+            visited = set()
+            while True:
+                visited.add(current.get("id"))
+                target_id = coref_targets.get(current.get("id"))
+                if target_id is None:
+                    errors.append({"type": "pro_without_coref", "id": entity.get("id"), "message": f"PRO mention {entity.get('id')} has no further tags and no coreference to resolve them (stuck at span {current.get('id')})."})
+                    break
+                target = entities.get(target_id)
+                if target is None:
+                    errors.append({"type": "pro_without_coref", "id": entity.get("id"), "message": f"The coreference of PRO mention {entity.get('id')} points to an invalid annotation {target_id}."})
+                    break
+                if target.get("span_type") == "head":
+                    target = target.getparent()
+                target_label = target.get("label").lower().split(".")
+                if target_id in visited or target.get("id") in visited:
+                    errors.append({"type": "pro_without_coref", "id": entity.get("id"), "message": f"The coreference chain of PRO mention {entity.get('id')} is circular."})
+                    break
+                if target_label[0] in ["pro", "self"] and len(target_label) == 1:
+                    current = target
+                    continue
+                break
+
+        # heads should not contain other spans and every mention has at most one head
+        if span_type == "head":
+            if parent.tag == "XML" or parent.get("span_type") not in ["ent", "att"]:
+                errors.append({"type": "head_conflict", "id": entity.get("id"), "message": f"Head {entity.get('id')} is not inside a reference or attribute."})
+            if len(entity) > 0:
+                errors.append({"type": "head_conflict", "id": entity.get("id"), "message": f"Head {entity.get('id')} contains other spans: {', '.join(c.get('id') for c in entity)}."})
+        elif span_type in ["ent", "att"]:
+            heads = [c for c in entity.iterchildren("Entity") if c.get("span_type") == "head"]
+            if len(heads) > 1:
+                errors.append({"type": "head_conflict", "id": entity.get("id"), "message": f"Mention {entity.get('id')} has {len(heads)} heads."})
+
+        # roles need an event they can be assigned to
+        if entity.get("role"):
+            # roles of lists are given to their children, so we look at the span containing the list
+            container = parent
+            while container.get("span_type") == "lst":
+                container = container.getparent()
+            event_ids = get_event_ids(container)
+            roleinfos = extract_role_field(entity) or []
+            for roleinfo in roleinfos:
+                if "" not in event_ids and roleinfo["id"][0] not in event_ids:
+                    errors.append({"type": "role_without_event", "id": entity.get("id"), "message": f"The span {entity.get('id')} with role '{roleinfo['type']}' couldn't be matched to an event."})
+
+    return errors
+
+
+def check_xmi_zip(filename, xmi_file):
+    """
+    Check-only version of process_xmi_zip. Returns the error report
+    or None if the document doesn't contain annotations.
+    """
+    in_root = et.fromstring(xmi_file)
+
+    at_least_one_span = in_root.find("./custom:Span", namespaces={"custom":"http:///custom.ecore"})
+    if at_least_one_span is None:
+        return None
+
+    return check_general(in_root, filename)
+
+
+def check_xmi(xmi_file):
+    """
+    Check-only version of process_xmi. Returns the error report for the file.
+    """
+    in_root = et.parse(xmi_file).getroot()
+    return check_general(in_root, xmi_file)
+
+
 def process_xmi_zip(filename, xmi_file):
     in_root = et.fromstring(xmi_file)
 
@@ -1082,9 +1352,15 @@ def apply_special_operation(special_operation, root):
                 hierarchy.remove(old_h_elem)
                 et.SubElement(hierarchy, "H", parent=loc_mention.get('id'), child=desc_id)
                 et.SubElement(hierarchy, "H", parent=desc_id, child=to_elem.get('id'))
+    elif special_operation == "fix_att_full_coverage":
+        # an attribute with exactly the span of a reference is removed, the reference gets its head
+        # (done here once, so the transformations don't have to repeat it for every export)
+        fix_att_full_coverage(root, redirect_references=True)
 
 
 def process_general(in_root, outname, debug=False):
+    if SCHEMA_INFO is None:
+        read_schema()
 
     # Modify the CAS XMI according to htr.xy tags
     in_root = modify_text(in_root)
@@ -1098,7 +1374,10 @@ def process_general(in_root, outname, debug=False):
     # TODO: Write DocumentMetaData
     out_root = et.Element("XML")
     out_text = et.SubElement(out_root, "Text")
-    start_index_dict, end_index_dict = write_text(out_text, document_text)
+    if TEXT_ENCODING == "compact":
+        start_index_dict, end_index_dict = write_compact_text(out_text, document_text)
+    else:
+        start_index_dict, end_index_dict = write_text(out_text, document_text)
 
     work_root = create_node_tree(in_root, document_text, start_index_dict, end_index_dict)
    
@@ -1116,27 +1395,113 @@ def process_general(in_root, outname, debug=False):
     for special_operation in SCHEMA_INFO["special_operations"]:
         apply_special_operation(special_operation, out_root)
 
+    if TEXT_ENCODING == "compact":
+        elide_token_text(out_root)
+
     out_tree = et.ElementTree(out_root)
     pathlib.Path(OUTFOLDER).mkdir(parents=True, exist_ok=True) 
     out_tree.write(os.path.join(OUTFOLDER, outname), xml_declaration=True, pretty_print=True, encoding="utf8")
 
     return out_tree
 
+def check_general(in_root, name):
+    """
+    Runs only the parsing, the tree building and the consistency checks of process_general.
+    No output is constructed and nothing is written to disk.
+
+    Returns a machine-readable report:
+    {"document": name, "valid": bool, "errors": [...], "messages": [...]}
+    where messages are the warnings and errors printed along the way.
+    """
+    if SCHEMA_INFO is None:
+        read_schema()
+
+    def run_checks(in_root):
+        in_root = modify_text(in_root)
+        in_root = small_corrects(in_root)
+
+        text_node = in_root.find("./cas:Sofa", namespaces={"cas":"http:///uima/cas.ecore"})
+        document_text = text_node.get("sofaString")
+        start_index_dict, end_index_dict = index_text(document_text)
+
+        crossings = []
+        work_root = create_node_tree(in_root, document_text, start_index_dict, end_index_dict, crossing_report=crossings)
+        errors = [{
+            "type": "crossing_spans",
+            "id": crossing["id"],
+            "other_id": crossing["other_id"],
+            "message": f"Span {crossing['id']} intersects with span {crossing['other_id']}.",
+        } for crossing in crossings]
+        return errors + check_consistency(work_root)
+
+    try:
+        errors, messages = collect_messages(run_checks, in_root)
+    except Exception as e:
+        # the full conversion would crash on this document as well
+        errors, messages = [{"type": "exception", "id": None, "message": repr(e)}], []
+
+    return {
+        "document": name,
+        "valid": not errors,
+        "errors": errors,
+        "messages": messages,
+    }
+
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_info.json")
 SCHEMA_INFO = None
-def read_schema():
-    global SCHEMA_INFO
+ENTITY_TYPE_CONVERSIONS = []
+ROLE_NAME_CONVERSIONS = []
+def read_schema(schema_file=None):
+    """
+    Loads the schema info (by default the schema_info.json next to this file).
+    This is not done on import anymore, process_general and check_general call it
+    if no schema was loaded yet. Call it explicitly to use another schema.
+    """
+    global SCHEMA_INFO, ENTITY_TYPE_CONVERSIONS, ROLE_NAME_CONVERSIONS
 
-    with open("schema_info.json", mode="r", encoding="utf8") as inf:
+    if schema_file is None:
+        schema_file = SCHEMA_FILE
+    with open(schema_file, mode="r", encoding="utf8") as inf:
         SCHEMA_INFO = json.load(inf)
 
-read_schema()
+    # the conversions are applied to every mention and role, so we compile them only once
+    ENTITY_TYPE_CONVERSIONS = [(re.compile(o), r) for o, r in SCHEMA_INFO["conversions"]["entity_types"].items()]
+    ROLE_NAME_CONVERSIONS = [(re.compile(o), r) for o, r in SCHEMA_INFO["conversions"]["role_names"].items()]
+
 OUTFOLDER = "./data/outfiles/"
+# where the documents given on the command line are written
+INFILES_OUTFOLDER = "./data/std_xml/test/"
 DEBUGFOLDER = "./data/debug/"
+# How crossing spans are repaired, see resolve_crossing_spans ("sibling" doesn't guarantee properly nested spans)
+CROSSING_SPAN_POLICIES = ["sibling", "shrink", "drop"]
+CROSSING_SPAN_POLICY = "sibling"
+# "tokens" writes one <T> per token, "compact" one string per line with the token offsets (see transformation/text_encoding.py)
+TEXT_ENCODINGS = ["tokens", "compact"]
+TEXT_ENCODING = "tokens"
 
 if __name__ == "__main__":
-
-    infiles = sorted(glob.glob("./data/exported/test/*.xmi"))
-    OUTFOLDER = "./data/std_xml/test/"
+    parser = argparse.ArgumentParser(description="Convert UIMA CAS XMI files to Standard XML.")
+    parser.add_argument("infiles", nargs="*", help="XMI files to process (default: ./data/exported/test/*.xmi)")
+    parser.add_argument("--check", action="store_true", help="only run the consistency checks and print one JSON report per document, nothing is written")
+    parser.add_argument("--crossing-policy", choices=CROSSING_SPAN_POLICIES, default=CROSSING_SPAN_POLICY, help="how crossing spans are repaired (default: %(default)s)")
+    parser.add_argument("--schema", default=SCHEMA_FILE, help="schema info to use (default: %(default)s)")
+    parser.add_argument("--text-encoding", choices=TEXT_ENCODINGS, default=TEXT_ENCODING, help="how the text is written (default: %(default)s)")
+    args = parser.parse_args()
+    CROSSING_SPAN_POLICY = args.crossing_policy
+    TEXT_ENCODING = args.text_encoding
+    read_schema(args.schema)
+
+    infiles = args.infiles or sorted(glob.glob("./data/exported/test/*.xmi"))
+    OUTFOLDER = INFILES_OUTFOLDER
+
+    if args.check:
+        all_valid = True
+        for infile in infiles:
+            report = check_xmi(infile)
+            all_valid = all_valid and report["valid"]
+            print(json.dumps(report, ensure_ascii=False))
+        sys.exit(0 if all_valid else 1)
 
     for infile in infiles:
         out_tree = process_xmi(infile, debug=True)
@@ -0,0 +1,227 @@
+"""
+Long-running worker mode for postprocess.py.
+Interpreter startup, the lxml import and reading schema_info.json happen only once per worker process,
+afterwards every request is handled with warm processes.
+
+Requests are JSON-lines, one document per line:
+{"id": "any id", "path": "./data/exported/test/doc.xmi"}
+{"id": "any id", "name": "doc.xmi", "xmi": "<?xml ...>"}       # XMI as a string
+{"id": "any id", "name": "doc.xmi", "xmi_b64": "PD94bWwg..."}  # XMI as base64 encoded bytes
+Optional fields are "outfolder" (default: OUTFOLDER), "check" (only validate, see postprocess.check_general),
+"crossing_policy" (one of postprocess.CROSSING_SPAN_POLICIES) and "text_encoding" (one of postprocess.TEXT_ENCODINGS),
+the last two default to the settings of postprocess.py.
+
+For every request one JSON-line is sent back as soon as the document is finished (so not necessarily in order):
+{"id": "any id", "ok": true, "output": "./data/std_xml/test/doc.xml", "diagnostics": ["WARNING: ...", ...]}
+In check mode "output" is null and the report is added as "report".
+If the conversion crashes, "ok" is false and "error" contains the exception.
+
+Run with
+python postprocess_worker.py --workers 4                        # requests from stdin, responses to stdout
+python postprocess_worker.py --socket /tmp/postprocess.sock     # requests over a local unix socket
+See utils/worker_client.py for a small client.
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+
+# Settings
+OUTFOLDER = "./data/std_xml/test/"
+WORKERS = os.cpu_count() or 1
+
+
+def init_worker(outfolder):
+    """
+    Runs once in every worker process, loads lxml and the schema (incl. the compiled conversions).
+    """
+    global postprocess, OUTFOLDER, DEFAULT_SETTINGS
+    import postprocess
+    postprocess.read_schema()
+    OUTFOLDER = outfolder
+    # a request only changes the settings for itself, the next one starts from these again
+    DEFAULT_SETTINGS = {"crossing_policy": postprocess.CROSSING_SPAN_POLICY, "text_encoding": postprocess.TEXT_ENCODING}
+
+
+def get_outname(name):
+    name = os.path.basename(name)
+    for ext in [".xmi", ".txt"]:
+        if name.endswith(ext):
+            return name[:-len(ext)] + ".xml"
+    return name + ".xml"
+
+
+def run_request(request):
+    """
+    Handles one request inside of a worker process. Everything printed by postprocess is collected as diagnostics.
+    """
+    from lxml import etree as et
+
+    response = {"id": request.get("id"), "ok": False, "output": None, "diagnostics": []}
+    # the collected types are module state of postprocess, they would otherwise grow with every request
+    postprocess.mention_subtypes.clear()
+    postprocess.desc_types.clear()
+    try:
+        if "path" in request:
+            name = request["path"]
+            in_root = et.parse(request["path"]).getroot()
+        elif "xmi" in request:
+            name = request.get("name", str(request.get("id")))
+            in_root = et.fromstring(request["xmi"].encode("utf8"))
+        elif "xmi_b64" in request:
+            name = request.get("name", str(request.get("id")))
+            in_root = et.fromstring(base64.b64decode(request["xmi_b64"]))
+        else:
+            response["error"] = "Request needs one of the fields 'path', 'xmi' or 'xmi_b64'."
+            return response
+
+        crossing_policy = request.get("crossing_policy", DEFAULT_SETTINGS["crossing_policy"])
+        if crossing_policy not in postprocess.CROSSING_SPAN_POLICIES:
+            response["error"] = f"Unknown crossing_policy '{crossing_policy}', use one of {', '.join(postprocess.CROSSING_SPAN_POLICIES)}."
+            return response
+        text_encoding = request.get("text_encoding", DEFAULT_SETTINGS["text_encoding"])
+        if text_encoding not in postprocess.TEXT_ENCODINGS:
+            response["error"] = f"Unknown text_encoding '{text_encoding}', use one of {', '.join(postprocess.TEXT_ENCODINGS)}."
+            return response
+        # like the outfolder these are module settings of postprocess, a worker only handles one request at a time
+        postprocess.CROSSING_SPAN_POLICY = crossing_policy
+        postprocess.TEXT_ENCODING = text_encoding
+
+        if request.get("check"):
+            report = postprocess.check_general(in_root, name)
+            response["ok"] = True
+            response["report"] = report
+            response["diagnostics"] = report["messages"]
+            return response
+
+        # the outfolder is a module setting of postprocess, a worker only handles one request at a time
+        postprocess.OUTFOLDER = request.get("outfolder", OUTFOLDER)
+        outname = get_outname(name)
+        buffer = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buffer):
+                postprocess.process_general(in_root, outname)
+        finally:
+            # keep the messages up to a crash, they usually explain it
+            response["diagnostics"] = [line for line in buffer.getvalue().splitlines() if line.strip()]
+        response["output"] = os.path.join(postprocess.OUTFOLDER, outname)
+        response["ok"] = True
+    except Exception as e:
+        response["error"] = repr(e)
+    return response
+
+
+def submit(pool, line, respond):
+    """
+    Parses a request line and hands it to the pool. respond is called with the response dict once it's done.
+    """
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        respond({"id": None, "ok": False, "output": None, "diagnostics": [], "error": f"Invalid request: {e}"})
+        return None
+    future = pool.submit(run_request, request)
+
+    def done(future):
+        try:
+            response = future.result()
+        except Exception as e:
+            # e.g. a worker process died
+            response = {"id": request.get("id"), "ok": False, "output": None, "diagnostics": [], "error": repr(e)}
+        respond(response)
+
+    future.add_done_callback(done)
+    return future
+
+
+def serve_stdin(pool, infile=sys.stdin, outfile=sys.stdout):
+    lock = threading.Lock()
+
+    def respond(response):
+        with lock:
+            outfile.write(json.dumps(response, ensure_ascii=False) + "\n")
+            outfile.flush()
+
+    futures = []
+    for line in infile:
+        if not line.strip():
+            continue
+        future = submit(pool, line, respond)
+        if future is not None:
+            futures.append(future)
+    concurrent.futures.wait(futures)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Every connection can send any number of requests, the responses are written back on the same connection.
+    """
+    def handle(self):
+        lock = threading.Lock()
+
+        def respond(response):
+            with lock:
+                try:
+                    self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf8"))
+                    self.wfile.flush()
+                except (BrokenPipeError, ValueError):
+                    # client is gone
+                    pass
+
+        futures = []
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            future = submit(self.server.pool, line.decode("utf8"), respond)
+            if future is not None:
+                futures.append(future)
+        # keep the connection open until all answers are sent
+        concurrent.futures.wait(futures)
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        super().__init__(path, RequestHandler)
+
+
+def serve_socket(pool, path):
+    if os.path.exists(path):
+        os.remove(path)
+    with WorkerServer(path, pool) as server:
+        print(f"Listening on {path}.", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep postprocess.py warm and convert documents on request.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of documents processed at the same time (default: %(default)s)")
+    parser.add_argument("--socket", help="path of a unix socket to listen on, if not given the requests are read from stdin")
+    parser.add_argument("--outfolder", default=OUTFOLDER, help="default outfolder if a request doesn't name one (default: %(default)s)")
+    args = parser.parse_args()
+
+    # the workers are started right away, so the first request doesn't pay for the imports
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.outfolder,))
+    concurrent.futures.wait([pool.submit(os.getpid) for _ in range(args.workers)])
+
+    try:
+        if args.socket:
+            serve_socket(pool, args.socket)
+        else:
+            serve_stdin(pool)
+    finally:
+        pool.shutdown()
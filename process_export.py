@@ -2,11 +2,17 @@
 This is a helper script working with postprocess.py to read the export folder provided by inception.
 Important: 
 We will skip any files which do not contain at least one <Span>-Node!
+
+Run with --check to only validate the annotations. Instead of writing Standard XML,
+one JSON report per document is printed (see postprocess.check_general).
 """
 
+import argparse
 import glob
+import json
 import postprocess
 import os
+import sys
 import zipfile
 import pprint as pp
 
@@ -21,8 +27,19 @@ postprocess.OUTFOLDER = OUTFOLDER
 ANNOTATORS = ["kfuchs", "bhitz", "admin"]
 
 
-if __name__ == "__main__":
-    for infolder in INFOLDERS:
+def main(check=False, infolders=None, outfolder=None):
+    """
+    Converts (or with check=True only validates) all annotations in the export folders.
+    Returns False if check is set and at least one document is invalid.
+    """
+    if infolders is None:
+        infolders = INFOLDERS
+    if outfolder is not None:
+        postprocess.OUTFOLDER = outfolder
+    postprocess.read_schema()
+
+    all_valid = True
+    for infolder in infolders:
         annotation_folder = os.path.join(infolder, "annotation")
 
         filefolders = sorted(glob.glob(os.path.join(annotation_folder, "*")))
@@ -39,7 +56,25 @@ if __name__ == "__main__":
                 archive = zipfile.ZipFile(userfolder, 'r')
                 xmi = archive.read(username + ".xmi")
 
+                if check:
+                    report = postprocess.check_xmi_zip(username + "_" + os.path.basename(filefolder), xmi)
+                    if report is not None:
+                        all_valid = all_valid and report["valid"]
+                        print(json.dumps(report, ensure_ascii=False))
+                    continue
+
                 postprocess.process_xmi_zip(username + "_" + os.path.basename(filefolder), xmi)
+
+    return all_valid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an Inception export folder to Standard XML.")
+    parser.add_argument("--check", action="store_true", help="only run the consistency checks and print one JSON report per document, nothing is written")
+    args = parser.parse_args()
+
+    if not main(check=args.check):
+        sys.exit(1)
     
     """
     pp.pprint("Finished processing all files.")
@@ -0,0 +1,88 @@
+import pytest
+from lxml import etree as et
+
+from transformation import config_compiler
+from transformation.config_compiler import ConfigError, compile_evts_config, compile_iob_order, compile_iob_orders, compile_nne_config
+
+ORDER = {
+    "mode": "full",
+    "depth": 1,
+    "tags": {"entity_type|value_type": ["per", "loc"]},
+    "filter": {"mention_type": ["nam"]},
+    "filter_strict": {"numerus": ["sgl"]},
+}
+
+
+def test_granularity():
+    granularity = config_compiler.Granularity(2)
+    assert granularity("loc_fac_x") == "loc_fac"
+    assert granularity("per") == "per"
+    assert config_compiler.Granularity(None)("loc_fac_x") == "loc_fac_x"
+
+
+def test_compiled_configs_are_returned_unchanged():
+    order = compile_iob_order(ORDER)
+    assert compile_iob_order(order) is order
+    assert compile_iob_orders([order])[0] is order
+
+
+def test_get_tags_uses_the_first_attribute_given():
+    order = compile_iob_order(ORDER)
+    assert order.get_tags({"entity_type": "per", "value_type": "money", "mention_type": "nam"}.get) == ({"entity_type": "per"}, {"mention_type": "nam"})
+    assert order.get_tags({"value_type": "loc"}.get) == ({"value_type": "loc"}, {})
+    # only the included values are tags
+    assert order.get_tags({"entity_type": "org"}.get) == ({}, {})
+
+
+def test_is_filtered():
+    order = compile_iob_order(ORDER)
+    assert not order.is_filtered({"mention_type": "nam", "numerus": "sgl"})
+    assert order.is_filtered({"mention_type": "nom", "numerus": "sgl"})
+    # filter_strict needs the attribute, filter only checks it if it's there
+    assert order.is_filtered({"mention_type": "nam"})
+    assert not order.is_filtered({"numerus": "sgl"})
+
+
+@pytest.mark.parametrize("order, path", [
+    ({"depth": 1, "tags": {}}, "order"),
+    ({"mode": "inline", "depth": 1, "tags": {}}, "order.mode"),
+    ({"mode": "full", "depth": "1", "tags": {}}, "order.depth"),
+    ({"mode": "full", "depth": 1, "tags": {"entity_type": "per"}}, "order.tags.entity_type"),
+    ({"mode": "full", "depth": 1, "tags": {}, "tag_granularity": True}, "order.tag_granularity"),
+])
+def test_invalid_iob_order(order, path):
+    with pytest.raises(ConfigError, match=f"^{path}:"):
+        compile_iob_order(order)
+
+
+def test_invalid_order_in_list_names_its_position():
+    with pytest.raises(ConfigError, match=r"^orders\[1\]\.mode:"):
+        compile_iob_orders([ORDER, dict(ORDER, mode="inline")])
+
+
+def test_nne_label():
+    config = compile_nne_config({"tags": {"Reference": {"tag": "ref", "entity_type": {"prefix": "ent"}}}, "tag_granularity": 1})
+    assert config.label(et.Element("Reference", entity_type="loc_fac")) == "tag:ref;ent:loc"
+    with pytest.raises(ConfigError, match=r"^config\.tags\.Value:"):
+        compile_nne_config({"tags": {"Value": {}}, "tag_granularity": 1})
+
+
+def test_evts_config():
+    config = compile_evts_config({
+        "include_spans": {"tags": ["Reference"]},
+        "include_tags": {"cols": {"ner": {"Reference": {"tag": "ref", "entity_type": {"prefix": "ent"}}}}, "tag_granularity": {"ner": 1}},
+    })
+    assert config.span_tags == {"Reference"}
+    assert config.column_order == ["ner"]
+    with pytest.raises(ConfigError, match="unknown span modification"):
+        compile_evts_config({
+            "include_spans": {"tags": []},
+            "include_tags": {"cols": {}, "span_modifications": ["shorten_everything"]},
+        })
+
+
+def test_evts_span_modifications_come_from_the_registry():
+    from transformation import to_exp_evts
+    names = list(to_exp_evts.SPAN_MODIFICATIONS) + [prefix + "evts" for prefix in to_exp_evts.SPAN_MODIFICATION_PREFIXES]
+    config = compile_evts_config({"include_spans": {"tags": []}, "include_tags": {"cols": {}, "span_modifications": names}})
+    assert config.span_modifications == names
@@ -0,0 +1,61 @@
+from lxml import etree as et
+
+from transformation.corrections import ATT_FULL_COVERAGE_MESSAGE, find_att_full_coverage, fix_att_full_coverage
+
+DOCUMENT = """<XML>
+<Mentions>
+<Reference id="1" start="0" end="3" head_start="1" head_end="2" head_text="b"/>
+<Attribute id="6" start="0" end="3" head_start="" head_end=""/>
+<Reference id="2" start="5" end="7" head_start="5" head_end="6" head_text="x"/>
+<Attribute id="7" start="5" end="7" head_start="6" head_end="7" head_text="y"/>
+<Attribute id="8" start="5" end="6" head_start="5" head_end="6" head_text="x"/>
+</Mentions>
+<Hierarchy><H parent="doc" child="1"/><H parent="1" child="6"/><H parent="doc" child="2"/><H parent="2" child="7"/><H parent="2" child="8"/></Hierarchy>
+<Relations>
+<Relation from_mention="1" to_mention="6" rel_type="coref"/>
+<Relation from_mention="2" to_mention="7" rel_type="owner"/>
+<Relation from_mention="6" to_mention="2" rel_type="x"/>
+<Relation from_mention="1" to_mention="2" rel_type="x"/>
+<Relation from_mention="8" to_mention="7" rel_type="y"/>
+</Relations>
+<Events><Event id="9" anchor="7"><Subevent id="9.0"><Role type="a" ref="8"/><Role type="b" ref="6"/><Role type="b" ref="1"/><Role type="c" ref="7"/></Subevent></Event></Events>
+</XML>"""
+
+
+def get_ids(root, path):
+    return [elem.get("id") for elem in root.iterfind(path)]
+
+
+def test_find_att_full_coverage():
+    root = et.fromstring(DOCUMENT)
+    assert [(ref.get("id"), att.get("id")) for ref, att in find_att_full_coverage(root)] == [("1", "6"), ("2", "7")]
+    assert get_ids(root, "./Mentions/*") == ["1", "6", "2", "7", "8"]
+
+
+def test_fix_att_full_coverage(capsys):
+    root = et.fromstring(DOCUMENT)
+    report = fix_att_full_coverage(root)
+    assert report == [
+        {"reference": "1", "attribute": "6", "head_start": "1", "head_end": "2"},
+        {"reference": "2", "attribute": "7", "head_start": "6", "head_end": "7"},
+    ]
+    assert capsys.readouterr().out == (ATT_FULL_COVERAGE_MESSAGE + "\n") * 2
+    assert get_ids(root, "./Mentions/*") == ["1", "2", "8"]
+    # an empty head doesn't replace the head of the reference
+    assert root.find("./Mentions/Reference[@id='1']").attrib == {"id": "1", "start": "0", "end": "3", "head_start": "1", "head_end": "2", "head_text": "b"}
+    assert root.find("./Mentions/Reference[@id='2']").attrib == {"id": "2", "start": "5", "end": "7", "head_start": "6", "head_end": "7", "head_text": "y"}
+    # without redirect_references nothing else is touched
+    assert len(root.find("./Relations")) == 5
+
+
+def test_redirect_references():
+    root = et.fromstring(DOCUMENT)
+    fix_att_full_coverage(root, redirect_references=True)
+    assert [(h.get("parent"), h.get("child")) for h in root.iterfind("./Hierarchy/H")] == [("doc", "1"), ("doc", "2"), ("2", "8")]
+    # self-loops and duplicates are dropped
+    assert [(r.get("from_mention"), r.get("to_mention"), r.get("rel_type")) for r in root.iterfind("./Relations/Relation")] == [
+        ("1", "2", "x"), ("8", "2", "y")]
+    event = root.find("./Events/Event")
+    assert event.get("anchor") == "2"
+    # the role pointing to the span of its own event and the duplicate role are dropped
+    assert [(r.get("type"), r.get("ref")) for r in event.iterfind("./Subevent/Role")] == [("a", "8"), ("b", "1")]
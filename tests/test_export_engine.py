@@ -0,0 +1,84 @@
+import pytest
+
+from transformation import export_engine
+from transformation.config_compiler import ConfigError
+
+DOCUMENT = """<?xml version='1.0' encoding='UTF8'?>
+<XML>
+  <Text>
+    <L line_id="0"><T token_id="0">Item</T> <T token_id="1">Rudolf</T> <T token_id="2">Bär</T> <T token_id="3">kauft</T> <T token_id="4">für</T> <T token_id="5">20</T> <T token_id="6">Pfund</T></L>
+  </Text>
+  <Mentions>
+    <Reference id="0" mention_type="nam" entity_type="per" start="1" end="3" head_start="1" head_end="3" head_text="Rudolf Bär"/>
+  </Mentions>
+  <Descriptors/>
+  <Values>
+    <Value id="1" value_type="money" start="5" end="7" text="20 Pfund"/>
+  </Values>
+  <Events/>
+  <Relations/>
+  <Hierarchy>
+    <H parent="doc" child="0"/>
+    <H parent="doc" child="1"/>
+  </Hierarchy>
+</XML>
+"""
+
+ORDER = {"mode": "full", "depth": 1, "tags": {"entity_type|value_type": []}}
+
+
+@pytest.fixture
+def infiles(tmp_path):
+    paths = []
+    for name in ["a.xml", "b.xml"]:
+        path = tmp_path / "std_xml" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(DOCUMENT, encoding="utf8")
+        paths.append(str(path))
+    return paths
+
+
+def read_splits(outfolder):
+    return {split: (outfolder / f"{split}.txt").read_text(encoding="utf8") for split in export_engine.SPLITS}
+
+
+def test_run_writes_every_job_and_split(tmp_path, infiles, capsys):
+    jobs = [
+        {"format": "iob", "config": [ORDER], "outfolder": str(tmp_path / "iob")},
+        {"format": "conllu", "config": ORDER, "outfolder": str(tmp_path / "conllu")},
+        {"format": "nne_old", "config": {"tags": ["Reference", "Value"], "attribs": ["entity_type", "value_type"], "tag_granularity": -1}, "outfolder": str(tmp_path / "nne_old")},
+    ]
+    export_engine.run(infiles + [str(tmp_path / "c.xml")], jobs, {"train": ["a.xml"], "dev": [], "test": ["b.xml"]})
+    assert "c.xml was not found in consistent training registry" in capsys.readouterr().out
+
+    iob = read_splits(tmp_path / "iob")
+    assert iob["train"] == "# a.xml\nItem\tO\nRudolf\tB-per\nBär\tI-per\nkauft\tO\nfür\tO\n20\tB-money\nPfund\tI-money\n\n"
+    assert iob["test"] == iob["train"].replace("a.xml", "b.xml")
+    assert iob["dev"] == ""
+
+    conllu = read_splits(tmp_path / "conllu")
+    assert conllu["dev"] == "# global.columns = id form ner\n"
+    assert conllu["train"].startswith("# global.columns = id form ner\n# sentence_id = 0\n# text = Item Rudolf Bär kauft für 20 Pfund\n1 Item O\n2 Rudolf B-per\n")
+    assert "# sentence_id = 1\n" in conllu["test"]
+
+    assert read_splits(tmp_path / "nne_old")["train"] == "Item Rudolf Bär kauft für 20 Pfund\n1,3 per|5,7 money\n\n"
+
+
+def test_split_registry():
+    registry = export_engine.to_split_registry({"train": ["a.xml"], "dev": ["b.xml"], "test": ["c.xml"], "other": []})
+    assert registry == {"train": {"a.xml"}, "dev": {"b.xml"}, "test": {"c.xml"}}
+    assert export_engine.get_split("b.xml", registry) == "dev"
+    assert export_engine.get_split("d.xml", registry) is None
+
+
+def test_invalid_jobs_fail_before_anything_is_written(tmp_path, infiles):
+    with pytest.raises(ValueError, match="Unknown export format 'csv'"):
+        export_engine.run(infiles, [{"format": "csv", "config": {}, "outfolder": str(tmp_path / "csv")}], {"train": [], "dev": [], "test": []})
+    jobs = [
+        {"format": "iob", "config": [ORDER], "outfolder": str(tmp_path / "iob")},
+        {"format": "conllu", "config": dict(ORDER, mode="inline"), "outfolder": str(tmp_path / "conllu")},
+    ]
+    with pytest.raises(ConfigError):
+        export_engine.run(infiles, jobs, {"train": [], "dev": [], "test": []})
+    assert not (tmp_path / "iob").exists()
+    assert not (tmp_path / "csv").exists()
@@ -0,0 +1,99 @@
+import copy
+
+import pytest
+from lxml import etree as et
+
+from transformation import corrections, iob_encoder, to_inline, to_iob
+from transformation.corrections import ATT_FULL_COVERAGE_MESSAGE
+
+TOKENS = ["Item", "Rudolf", "Bär", "kauft", "ein", "Haus", "an", "der", "Gasse", "für", "20", "Pfund"]
+
+ORDERS = [
+    {"mode": "full", "depth": 2, "tags": {"entity_type|value_type": []}},
+    {"mode": "heads", "depth": 1, "tags": {"mention_type": []}},
+]
+
+
+def make_document(mentions, values=""):
+    tokens = "".join(f'<T token_id="{i}">{token}</T>' for i, token in enumerate(TOKENS))
+    return et.fromstring(f'<XML><Text><L line_id="0">{tokens}</L></Text><Mentions>{mentions}</Mentions><Descriptors/>'
+                         f'<Values>{values}</Values><Events/><Relations/><Hierarchy/></XML>')
+
+
+NESTED = make_document(
+    '<Reference id="0" mention_type="nam" entity_type="per" start="1" end="3" head_start="1" head_end="3"/>'
+    '<Reference id="1" mention_type="nom" entity_type="loc" start="4" end="9" head_start="5" head_end="6"/>'
+    '<Reference id="2" mention_type="nom" entity_type="loc" start="7" end="9" head_start="7" head_end="9"/>',
+    '<Value id="3" value_type="money" start="10" end="12"/>',
+)
+
+
+def test_encode_full_and_heads():
+    token_list, columns = iob_encoder.encode(NESTED, ORDERS)
+    assert token_list == TOKENS
+    assert columns == [
+        ["O", "B-per", "I-per", "O", "B-loc", "I-loc", "I-loc", "B-loc.loc", "I-loc.loc", "O", "B-money", "I-money"],
+        ["O", "B-nam", "I-nam", "O", "O", "B-nom", "O", "B-nom", "I-nom", "O", "O", "O"],
+    ]
+
+
+def test_encode_matches_inline_path():
+    before = et.tostring(NESTED)
+    encoded = iob_encoder.encode(NESTED, ORDERS)
+    assert et.tostring(NESTED) == before
+    assert encoded == to_iob.process_inline(to_inline.process_root(copy.deepcopy(NESTED)), ORDERS)
+
+
+def test_crossing_spans_are_not_encoded():
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="loc" start="4" end="7" head_start="5" head_end="6"/>'
+        '<Reference id="1" mention_type="nom" entity_type="loc" start="6" end="9" head_start="8" head_end="9"/>'
+    )
+    assert iob_encoder.encode(root, ORDERS) is None
+
+
+@pytest.fixture
+def legacy_fix(monkeypatch):
+    monkeypatch.setattr(corrections, "LEGACY_FIX_ON_EXPORT", True)
+
+
+def test_covered_attribute_is_kept_by_default(capsys):
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="per" start="4" end="9" head_start="5" head_end="6"/>'
+        '<Attribute id="1" mention_type="nom" entity_type="occ" start="4" end="9" head_start="" head_end=""/>'
+    )
+    _, columns = iob_encoder.encode(root, [dict(ORDERS[0], depth=2)])
+    assert columns[0][4:9] == ["B-occ.per", "I-occ.per", "I-occ.per", "I-occ.per", "I-occ.per"]
+    assert capsys.readouterr().out == ""
+    assert columns == to_iob.process_inline(to_inline.process_root(copy.deepcopy(root)), [dict(ORDERS[0], depth=2)])[1]
+
+
+def test_covered_attribute_gives_its_head_to_the_reference(legacy_fix):
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="per" start="4" end="9" head_start="" head_end=""/>'
+        '<Attribute id="1" mention_type="nom" entity_type="occ" start="4" end="9" head_start="5" head_end="6"/>'
+    )
+    _, columns = iob_encoder.encode(root, ORDERS)
+    assert columns[0][4:9] == ["B-per", "I-per", "I-per", "I-per", "I-per"]
+    assert columns[1][4:9] == ["O", "B-nom", "O", "O", "O"]
+
+
+def test_covered_attribute_without_head_keeps_the_reference_head(legacy_fix):
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="per" start="4" end="9" head_start="5" head_end="6"/>'
+        '<Attribute id="1" mention_type="nom" entity_type="occ" start="4" end="9" head_start="" head_end=""/>'
+    )
+    _, columns = iob_encoder.encode(root, ORDERS)
+    assert columns[1][4:9] == ["O", "B-nom", "O", "O", "O"]
+    assert columns == to_iob.process_inline(to_inline.process_root(copy.deepcopy(root)), ORDERS)[1]
+
+
+def test_covered_attribute_is_reported_like_in_the_inline_path(legacy_fix, capsys):
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="per" start="4" end="9" head_start="5" head_end="6"/>'
+        '<Attribute id="1" mention_type="nom" entity_type="occ" start="4" end="9" head_start="" head_end=""/>'
+    )
+    iob_encoder.encode(root, ORDERS)
+    encoded = capsys.readouterr().out
+    to_iob.process_inline(to_inline.process_root(copy.deepcopy(root)), ORDERS)
+    assert encoded == capsys.readouterr().out == ATT_FULL_COVERAGE_MESSAGE + "\n"
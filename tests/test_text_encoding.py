@@ -0,0 +1,60 @@
+import copy
+
+from lxml import etree as et
+
+from transformation import iob_encoder, text_encoding
+
+TEXT = "Item Rudolf Bär kauft\nfür 20 Pfund\n"
+
+ANNOTATIONS = """<Mentions>
+<Reference id="0" mention_type="nam" entity_type="per" start="1" end="3" head_start="1" head_end="3" head_text="Rudolf Bär"/>
+</Mentions>
+<Descriptors>
+<Descriptor id="2" desc_type="owner" start="4" end="7"/>
+</Descriptors>
+<Values>
+<Value id="1" value_type="money" start="5" end="7" text="20 Pfund"/>
+</Values>"""
+
+
+def make_documents():
+    tokens = et.fromstring(f"<XML><Text/>{ANNOTATIONS}</XML>")
+    j = 0
+    for line_id, line_tokens in text_encoding.tokenize_text(TEXT):
+        line = et.SubElement(tokens.find("Text"), "L", line_id=str(line_id))
+        for _, token in line_tokens:
+            et.SubElement(line, "T", token_id=str(j)).text = token
+            j += 1
+    compact = et.fromstring(f"<XML><Text/>{ANNOTATIONS}</XML>")
+    text_encoding.write_compact_text(compact.find("Text"), TEXT)
+    text_encoding.elide_token_text(compact)
+    return tokens, compact
+
+
+def test_elide_marks_only_the_left_out_attributes():
+    _, compact = make_documents()
+    assert compact.find("./Mentions/Reference").attrib.get("elided") == "head_text"
+    assert compact.find("./Values/Value").attrib.get("elided") == "text"
+    # the descriptor never had a text
+    assert "elided" not in compact.find("./Descriptors/Descriptor").attrib
+
+
+def test_expand_text_restores_the_tokens_encoding():
+    tokens, compact = make_documents()
+    text_encoding.expand_text(compact)
+    assert text_encoding.get_tokens(compact) == text_encoding.get_tokens(tokens)
+    for path in ["./Mentions/Reference", "./Descriptors/Descriptor", "./Values/Value"]:
+        assert compact.find(path).attrib == tokens.find(path).attrib
+
+
+def test_load_keeps_the_compact_text(tmp_path):
+    tokens, compact = make_documents()
+    path = tmp_path / "compact.xml"
+    et.ElementTree(compact).write(str(path), xml_declaration=True, encoding="utf8")
+    loaded = text_encoding.load(str(path))
+    assert text_encoding.is_compact(loaded)
+    assert loaded.find(".//T") is None
+    assert text_encoding.get_tokens(loaded) == ["Item", "Rudolf", "Bär", "kauft", "für", "20", "Pfund"]
+    assert loaded.find("./Mentions/Reference").attrib == tokens.find("./Mentions/Reference").attrib
+    orders = [{"mode": "full", "depth": 1, "tags": {"entity_type|value_type": []}}]
+    assert iob_encoder.encode(loaded, orders) == iob_encoder.encode(copy.deepcopy(tokens), orders)
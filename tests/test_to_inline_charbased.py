@@ -0,0 +1,26 @@
+from lxml import etree as et
+
+from transformation import to_inline_charbased
+
+
+def build(units, nodes):
+    nodes = [et.fromstring(node) for node in nodes]
+    return et.tostring(to_inline_charbased.build_text(units, to_inline_charbased.get_spans(nodes, len(units))), encoding="unicode")
+
+
+def test_nested_spans_with_head():
+    nodes = ['<Reference id="1" start="0" end="3" head_start="1" head_end="2"/>', '<Value id="2" start="2" end="3"/>']
+    assert build(["Hans", "Müller", "Wirt"], nodes) == '<Text><Reference id="1">Hans <Head>Müller</Head> <Value id="2">Wirt</Value></Reference></Text>'
+
+
+def test_empty_span_at_the_start():
+    assert build(["a", "b"], ['<Reference id="1" start="0" end="0"/>']) == '<Text><Reference id="1"/>a b</Text>'
+
+
+def test_empty_span_in_the_middle():
+    assert build(["a", "b"], ['<Reference id="1" start="1" end="1"/>']) == '<Text>a <Reference id="1"/>b</Text>'
+
+
+def test_empty_span_at_the_end():
+    nodes = ['<Value id="1" start="0" end="2"/>', '<Reference id="2" start="2" end="2"/>']
+    assert build(["a", "b"], nodes) == '<Text><Value id="1">a b</Value><Reference id="2"/></Text>'
@@ -0,0 +1,69 @@
+import copy
+
+import pytest
+from lxml import etree as et
+
+from transformation import to_inline, to_nne_old
+
+TOKENS = ["Item", "Rudolf", "Bär", "kauft", "ein", "Haus", "an", "der", "Gasse", "für", "20", "Pfund"]
+
+CONFIG = {
+    "add_span_type": True,
+    "tags": ["Reference", "Attribute", "Value", "Descriptor"],
+    "attribs": ["entity_type", "value_type", "desc_type"],
+    "split_labels": False,
+    "tag_granularity": 1,
+    "add_heads": False,
+    "add_heads2": False,
+    "add_lists": False,
+    "assume_pretagged_heads": False,
+    "assume_pretagged_first_layer": False,
+}
+
+
+def make_document(mentions, descriptors="", values=""):
+    tokens = "".join(f'<T token_id="{i}">{token}</T>' for i, token in enumerate(TOKENS))
+    return et.fromstring(f'<XML><Text><L line_id="0">{tokens}</L></Text><Mentions>{mentions}</Mentions>'
+                         f'<Descriptors>{descriptors}</Descriptors><Values>{values}</Values>'
+                         f'<Events/><Relations/><Hierarchy/></XML>')
+
+
+NESTED = make_document(
+    '<Reference id="0" mention_type="nam" entity_type="per_ind" start="1" end="3" head_start="1" head_end="3"/>'
+    '<Reference id="1" mention_type="nom" entity_type="loc_fac" start="4" end="9" head_start="5" head_end="6"/>'
+    '<Reference id="2" mention_type="nom" entity_type="loc" start="7" end="9" head_start="8" head_end="9"/>',
+    '<Descriptor id="3" desc_type="rel" start="6" end="7"/>',
+    '<Value id="4" value_type="money" start="10" end="12"/>',
+)
+
+
+def inline_result(root, config):
+    return to_nne_old.process_inline(to_inline.process_root(copy.deepcopy(root)), config)
+
+
+@pytest.mark.parametrize("changes", [
+    {"assume_pretagged_heads": True},
+    {"assume_pretagged_heads": True, "add_heads": True},
+    {"assume_pretagged_first_layer": True},
+    {"assume_pretagged_first_layer": True, "tags": ["Value", "Reference", "Reference"]},
+    {"assume_pretagged_heads": True, "assume_pretagged_first_layer": True},
+    {"add_heads2": True},
+    {"add_heads2": True, "split_labels": True, "tag_granularity": -1},
+    {"add_heads2": True, "add_span_type": False, "assume_pretagged_heads": True},
+])
+def test_encode_offsets_matches_inline_path(changes):
+    config = dict(CONFIG, **changes)
+    before = et.tostring(NESTED)
+    encoded = to_nne_old.encode_offsets(NESTED, config)
+    assert et.tostring(NESTED) == before
+    assert encoded is not None
+    assert encoded == inline_result(NESTED, config)
+
+
+def test_crossing_spans_fall_back_to_the_inline_tree():
+    root = make_document(
+        '<Reference id="0" mention_type="nom" entity_type="loc" start="4" end="7" head_start="5" head_end="6"/>'
+        '<Reference id="1" mention_type="nom" entity_type="loc" start="6" end="9" head_start="8" head_end="9"/>'
+    )
+    assert to_nne_old.encode_offsets(root, CONFIG) is None
+    assert to_nne_old.process_root(root, CONFIG) == inline_result(root, CONFIG)
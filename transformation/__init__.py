@@ -0,0 +1,4 @@
+"""
+Transformations from Standard XML to other formats (inline XML, IOB, CoNLL-U, ...).
+The modules are imported on demand, e.g. `from transformation import to_inline`.
+"""
@@ -0,0 +1,436 @@
+"""
+Validates the configs (orders) of the transformations once and compiles them into lookups
+that are cheap to apply on every token and span:
+- "entity_type|desc_type|value_type" is split once into a tuple of attribute fallbacks,
+- include/exclude/filter lists become sets,
+- the tag granularity ("_".join(value.split("_")[:n])) is computed once per distinct value,
+- the settings of every tag are turned into a list of entries in the order of the config.
+
+compile_iob_orders   to_iob, to_conllu (and iob_encoder)
+compile_exp_config   to_exp
+compile_nne_config   to_nne
+compile_evts_config  to_exp_evts
+
+All compile functions return an already compiled config unchanged, so the transformations can compile
+whatever they get, while the scripts compile their configs up front: an invalid config raises a ConfigError
+before any document is read.
+"""
+
+IOB_MODES = ["full", "heads"]
+DEPTH_ANNOS = [None, "Binary", "Ordinal"]
+PARENT_TAGS = {"ref": "Reference", "att": "Attribute", "val": "Value", "lst": "List", "desc": "Descriptor"}
+EVTS_TAG_OPTIONS = ["if_event_use_trigger_instead", "dont_annotate"]
+EVTS_COLUMN_OPTIONS = ["only_head", "add_heads", "dont_print"]
+
+
+class ConfigError(ValueError):
+    """
+    An invalid transformation config, the message names the offending setting.
+    """
+
+
+def check(condition, path, message):
+    if not condition:
+        raise ConfigError(f"{path}: {message}")
+
+
+def check_dict(value, path):
+    check(isinstance(value, dict), path, f"expected a dict, got {type(value).__name__}")
+
+
+def check_list(value, path):
+    check(isinstance(value, (list, tuple, set, frozenset)), path, f"expected a list, got {type(value).__name__}")
+
+
+class Granularity:
+    """
+    Cuts label values to their first n parts ("loc_fac_x" -> "loc_fac" for n = 2), None keeps the whole value.
+    Every distinct value is only split once.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.cache = {}
+
+    def __call__(self, value):
+        try:
+            return self.cache[value]
+        except KeyError:
+            out = value if self.n is None else "_".join(value.split("_")[:self.n])
+            self.cache[value] = out
+            return out
+
+
+def check_granularity(value, path):
+    check(isinstance(value, int) and not isinstance(value, bool), path, f"tag_granularity must be an integer, got {value!r}")
+
+
+### IOB (to_iob, to_conllu) ###
+
+class IOBOrder:
+    """
+    A compiled order of to_iob / to_conllu.
+    """
+    def __init__(self, order, path="order"):
+        check_dict(order, path)
+        for key in ["mode", "depth", "tags"]:
+            check(key in order, path, f"'{key}' is missing")
+        check(order["mode"] in IOB_MODES, f"{path}.mode", f"must be one of {', '.join(IOB_MODES)}, got {order['mode']!r}")
+        check(isinstance(order["depth"], int), f"{path}.depth", f"must be an integer, got {order['depth']!r}")
+        check_dict(order["tags"], f"{path}.tags")
+        self.raw = order
+        self.name = order.get("name")
+        self.mode = order["mode"]
+        self.heads = self.mode == "heads"
+        self.depth = order["depth"]
+        self.ignore_lists = not ("ignore_lists" in order and not order["ignore_lists"])
+        tag_granularity = order.get("tag_granularity", -1)
+        check_granularity(tag_granularity, f"{path}.tag_granularity")
+        # tag granularity controls to which level tags are used, -1 keeps the whole tag
+        self.granularity = Granularity(None if tag_granularity == -1 else tag_granularity)
+
+        # (attribute fallbacks, included values or None)
+        self.tag_lookups = []
+        for key, included in order["tags"].items():
+            check_list(included, f"{path}.tags.{key}")
+            self.tag_lookups.append((tuple(key.split("|")), frozenset(included) if included else None))
+
+        self.filter = {}
+        self.filter_strict = {}
+        for option, compiled in [("filter", self.filter), ("filter_strict", self.filter_strict)]:
+            check_dict(order.get(option, {}), f"{path}.{option}")
+            for key, values in order.get(option, {}).items():
+                check_list(values, f"{path}.{option}.{key}")
+                compiled[key] = frozenset(values)
+        self.filter_lookups = [tuple(key.split("|")) for key in self.filter]
+
+    def get_tags(self, get):
+        """
+        Returns the tags and the filter values of a node, get returns the value of an attribute of the node (or None).
+        """
+        tag_dict = {}
+        for alternatives, included in self.tag_lookups:
+            # check if any of the tags do return something
+            for o in alternatives:
+                tag = get(o)
+                if tag is not None:
+                    break
+            if tag is not None:
+                tag = self.granularity(tag)
+                if included is not None and tag not in included:
+                    # only include the tags in the included_tags list
+                    continue
+                tag_dict[o] = tag
+        filter_dict = {}
+        for alternatives in self.filter_lookups:
+            for o in alternatives:
+                tag = get(o)
+                if tag is not None:
+                    filter_dict[o] = tag
+                    break
+        return tag_dict, filter_dict
+
+    def is_filtered(self, filter_dict):
+        """
+        filter_dict are the filter values of the first annotated ancestor.
+        NOTE: We only filter the first level of depth currently
+        """
+        for f, values in self.filter_strict.items():
+            if f not in filter_dict or filter_dict[f] not in values:
+                return True
+        for f, values in self.filter.items():
+            if f in filter_dict and filter_dict[f] not in values:
+                return True
+        return False
+
+
+def compile_iob_order(order, path="order"):
+    if isinstance(order, IOBOrder):
+        return order
+    return IOBOrder(order, path)
+
+
+def compile_iob_orders(orders):
+    check_list(orders, "orders")
+    return [compile_iob_order(order, f"orders[{i}]") for i, order in enumerate(orders)]
+
+
+### exp (to_exp) ###
+
+class LabelEntry:
+    """
+    One setting of a tag: either the fixed tag name (attribute is None) or an attribute to read.
+    """
+    def __init__(self, attribute=None, tag=None, prefix="", include=None, exclude=frozenset()):
+        self.attribute = attribute
+        self.tag = tag
+        self.prefix = prefix
+        self.include = include
+        self.exclude = exclude
+
+
+def compile_label_entries(settings, path, with_filters=False):
+    check_dict(settings, path)
+    entries = []
+    for key, value in settings.items():
+        if key == "tag":
+            check(isinstance(value, str), f"{path}.tag", f"must be a string, got {value!r}")
+            entries.append(LabelEntry(tag=value))
+            continue
+        check_dict(value, f"{path}.{key}")
+        check("prefix" in value, f"{path}.{key}", "'prefix' is missing")
+        if with_filters:
+            check_list(value.get("include", []), f"{path}.{key}.include")
+            check_list(value.get("exclude", []), f"{path}.{key}.exclude")
+        entries.append(LabelEntry(
+            attribute=key,
+            prefix=value["prefix"] or "",
+            include=frozenset(value["include"]) if value.get("include") else None,
+            exclude=frozenset(value.get("exclude", []))))
+    return entries
+
+
+class ExpConfig:
+    """
+    A compiled config of to_exp.
+    """
+    def __init__(self, config):
+        check_dict(config, "config")
+        check("tags" in config, "config", "'tags' is missing")
+        check_dict(config["tags"], "config.tags")
+        check("tag_granularity" in config, "config", "'tag_granularity' is missing")
+        check_granularity(config["tag_granularity"], "config.tag_granularity")
+        self.raw = config
+        self.granularity = Granularity(config["tag_granularity"])
+        self.tags = {tag: compile_label_entries(settings, f"config.tags.{tag}", with_filters=True)
+                     for tag, settings in config["tags"].items()}
+
+        self.merge_overlapping_desc_tags = bool(config.get("merge_overlapping_desc_tags", False))
+        self.depth_anno = config.get("depth_anno")
+        check(self.depth_anno in DEPTH_ANNOS, "config.depth_anno", f"must be one of {DEPTH_ANNOS}, got {self.depth_anno!r}")
+        self.tag_anno = config.get("tag_anno")
+        if self.tag_anno is not None:
+            check_list(self.tag_anno, "config.tag_anno")
+
+        # OR-conditions on the span (or "doc" for the document level)
+        self.require_parent = config.get("require_parent")
+        self.parent_tags = set()
+        self.parent_prefixes = []
+        if self.require_parent is not None:
+            check_dict(self.require_parent, "config.require_parent")
+            for key, values in self.require_parent.items():
+                check_list(values, f"config.require_parent.{key}")
+                if key == "tag":
+                    self.parent_tags.update(PARENT_TAGS[v] for v in values if v in PARENT_TAGS)
+                elif values:
+                    self.parent_prefixes.append((key, tuple(values)))
+        self.include_doc = self.require_parent is None or "doc" in self.require_parent
+        self.include_spans = self.require_parent is None or "doc" not in self.require_parent
+
+    def accepts(self, elem):
+        """
+        Whether the element is annotated at all (see to_exp.filter_ancestors).
+        """
+        entries = self.tags.get(elem.tag)
+        if entries is None:
+            return False
+        for entry in entries:
+            if entry.attribute is None:
+                return True
+            value = elem.get(entry.attribute)
+            if value is None:
+                return False
+            value = self.granularity(value)
+            if value in entry.exclude:
+                return False
+            if entry.include is not None and value not in entry.include:
+                return False
+        return True
+
+    def check_parent(self, elem):
+        """
+        Whether the span fulfills one of the conditions of require_parent.
+        """
+        if elem.tag in self.parent_tags:
+            return True
+        for key, prefixes in self.parent_prefixes:
+            value = elem.get(key)
+            if value is not None and value.startswith(prefixes):
+                return True
+        return False
+
+    def label(self, elem):
+        tag = []
+        for entry in self.tags[elem.tag]:
+            if entry.attribute is None:
+                tag.append(f"tag:{entry.tag}")
+                continue
+            if elem.get(entry.attribute):
+                prefix = entry.prefix + ":" if entry.prefix else ""
+                value = self.granularity(elem.get(entry.attribute))
+                if ":" in value or ";" in value:
+                    print("Warning: Disallowed character such as : or ; in label!")
+                    value = value.replace(":", "_").replace(";", "_")
+                tag.append(prefix + value)
+        return ";".join(tag)
+
+    def pretag(self, elem):
+        pretag = []
+        for val in self.tag_anno:
+            if val in elem.attrib:
+                pretag.append(self.granularity(elem.get(val)))
+        return ".".join(pretag)
+
+
+def compile_exp_config(config):
+    if isinstance(config, ExpConfig):
+        return config
+    return ExpConfig(config)
+
+
+### nne (to_nne) ###
+
+class NNEConfig:
+    """
+    A compiled config of to_nne.
+    """
+    def __init__(self, config):
+        check_dict(config, "config")
+        check("tags" in config, "config", "'tags' is missing")
+        check_dict(config["tags"], "config.tags")
+        check("tag_granularity" in config, "config", "'tag_granularity' is missing")
+        check_granularity(config["tag_granularity"], "config.tag_granularity")
+        self.raw = config
+        self.granularity = Granularity(config["tag_granularity"])
+        self.tags = {}
+        for tag, settings in config["tags"].items():
+            check("tag" in settings, f"config.tags.{tag}", "'tag' is missing")
+            entries = compile_label_entries(settings, f"config.tags.{tag}")
+            # the tag name always comes first
+            self.tags[tag] = (settings["tag"], [(entry.prefix, entry.attribute) for entry in entries if entry.attribute is not None])
+
+    def label(self, elem):
+        tag_name, attributes = self.tags[elem.tag]
+        tag_list = ["tag:" + tag_name]
+        for prefix, attribute in attributes:
+            tag_list.append(prefix + ":" + self.granularity(elem.get(attribute)))
+        return ";".join(tag_list)
+
+
+def compile_nne_config(config):
+    if isinstance(config, NNEConfig):
+        return config
+    return NNEConfig(config)
+
+
+### evts (to_exp_evts) ###
+
+class EvtsAttribute:
+    """
+    The settings of one attribute of a tag in to_exp_evts (see Span.get_tag).
+    """
+    def __init__(self, key, settings, path):
+        check_dict(settings, path)
+        check("prefix" in settings, path, "'prefix' is missing")
+        self.key = key
+        self.prefix = settings["prefix"]
+        self.use_xml_parent = settings.get("use_xml_parent") is True
+        self.only_freetext = bool(settings.get("only_freetext"))
+        self.include = frozenset(settings["include"]) if settings.get("include") else None
+        self.convert = None
+        self.convert_event_type = None
+        if "convert" in settings:
+            check_dict(settings["convert"], f"{path}.convert")
+            check("dict" in settings["convert"], f"{path}.convert", "'dict' is missing")
+            self.convert = settings["convert"]["dict"]
+            for cond, val in settings["convert"].get("condition", {}).items():
+                check(cond == "event_type", f"{path}.convert.condition", f"unknown condition {cond!r}")
+                self.convert_event_type = val
+        self.require_xml_grandparent = None
+        if settings.get("require_xml_grandparent"):
+            check_dict(settings["require_xml_grandparent"], f"{path}.require_xml_grandparent")
+            # an empty list accepts all
+            self.require_xml_grandparent = [(k, frozenset(v)) for k, v in settings["require_xml_grandparent"].items() if v]
+
+
+class EvtsTag:
+    """
+    The settings of a tag in a column of to_exp_evts.
+    """
+    def __init__(self, settings, path):
+        check_dict(settings, path)
+        self.dont_annotate = "dont_annotate" in settings
+        self.use_trigger = bool(settings.get("if_event_use_trigger_instead"))
+        # entries in the order of the config: a string for the tag name, EvtsAttribute for attributes
+        self.entries = []
+        for key, value in settings.items():
+            if key in EVTS_TAG_OPTIONS:
+                continue
+            if key == "tag":
+                check(isinstance(value, str), f"{path}.tag", f"must be a string, got {value!r}")
+                self.entries.append(value)
+            else:
+                self.entries.append(EvtsAttribute(key, value, f"{path}.{key}"))
+
+
+class EvtsColumn:
+    def __init__(self, name, settings, tag_granularity, path):
+        check_dict(settings, path)
+        self.name = name
+        self.only_head = bool(settings.get("only_head"))
+        self.add_heads = bool(settings.get("add_heads"))
+        self.dont_print = bool(settings.get("dont_print"))
+        self.tags = {tag: EvtsTag(value, f"{path}.{tag}") for tag, value in settings.items() if tag not in EVTS_COLUMN_OPTIONS}
+        self.granularity = None
+        if tag_granularity is not None:
+            check_granularity(tag_granularity, f"config.include_tags.tag_granularity.{name}")
+            self.granularity = Granularity(tag_granularity)
+        else:
+            check(not any(isinstance(entry, EvtsAttribute) for tag in self.tags.values() for entry in tag.entries),
+                  "config.include_tags.tag_granularity", f"no granularity for column {name!r}")
+
+
+class EvtsConfig:
+    """
+    A compiled config of to_exp_evts.
+    """
+    def __init__(self, config):
+        check_dict(config, "config")
+        for key in ["include_spans", "include_tags"]:
+            check(key in config, "config", f"'{key}' is missing")
+        include_spans = config["include_spans"]
+        include_tags = config["include_tags"]
+        check_dict(include_spans, "config.include_spans")
+        check_dict(include_tags, "config.include_tags")
+        check("tags" in include_spans, "config.include_spans", "'tags' is missing")
+        check_list(include_spans["tags"], "config.include_spans.tags")
+        check("cols" in include_tags, "config.include_tags", "'cols' is missing")
+        check_dict(include_tags["cols"], "config.include_tags.cols")
+        tag_granularity = include_tags.get("tag_granularity", {})
+        check_dict(tag_granularity, "config.include_tags.tag_granularity")
+
+        self.raw = config
+        self.span_tags = frozenset(include_spans["tags"])
+        self.samples_based_on = include_spans.get("create_samples_based_on_")
+        if self.samples_based_on is not None:
+            check_dict(self.samples_based_on, "config.include_spans.create_samples_based_on_")
+            for key in ["column", "source", "event_type", "type", "use_subevent"]:
+                check(key in self.samples_based_on, "config.include_spans.create_samples_based_on_", f"'{key}' is missing")
+
+        self.cols = {col: EvtsColumn(col, settings, tag_granularity.get(col), f"config.include_tags.cols.{col}")
+                     for col, settings in include_tags["cols"].items()}
+        self.column_order = [col for col, column in self.cols.items() if not column.dont_print]
+
+        self.span_modifications = list(include_tags.get("span_modifications", []))
+        check_list(self.span_modifications, "config.include_tags.span_modifications")
+        # the names are checked against the registry of to_exp_evts (which imports this module, so only here)
+        try:
+            from .to_exp_evts import compile_span_modifications
+        except ImportError:
+            from to_exp_evts import compile_span_modifications
+        compile_span_modifications(self.span_modifications)
+
+
+def compile_evts_config(config):
+    if isinstance(config, EvtsConfig):
+        return config
+    return EvtsConfig(config)
@@ -0,0 +1,144 @@
+"""
+Corrections of annotation errors on Standard XML, shared by the postprocessing and the transformations.
+"""
+
+# The postprocessing fixes covered attributes once (special operation "fix_att_full_coverage" in schema_info.json),
+# so the transformations don't repeat it. Set this for Standard XML written before, then they fix it on every export.
+LEGACY_FIX_ON_EXPORT = False
+
+ATT_FULL_COVERAGE_MESSAGE = "ERROR: A reference and an attribute cover each other fully, meaning a head is missing. Attribute will be deleted and Reference fixed, please investigate."
+
+
+def find_att_full_coverage(root):
+    """
+    Returns the (reference, attribute) pairs with exactly the same span, without changing anything.
+    The attributes are grouped by their span, so every reference only looks at the attributes with the same span.
+    """
+    atts_by_span = {}
+    for att in root.iterfind("./Mentions/Attribute"):
+        atts_by_span.setdefault((att.get("start"), att.get("end")), []).append(att)
+    if not atts_by_span:
+        return []
+
+    pairs = []
+    for ref in root.iterfind("./Mentions/Reference"):
+        for att in atts_by_span.get((ref.get("start"), ref.get("end")), []):
+            pairs.append((ref, att))
+    return pairs
+
+
+def find_att_full_coverage_on_export(root):
+    """
+    find_att_full_coverage for the transformations, nothing is found unless LEGACY_FIX_ON_EXPORT is set.
+    """
+    if not LEGACY_FIX_ON_EXPORT:
+        return []
+    return find_att_full_coverage(root)
+
+
+def fix_att_full_coverage_on_export(root):
+    """
+    fix_att_full_coverage for the transformations, nothing is changed unless LEGACY_FIX_ON_EXPORT is set.
+    """
+    if not LEGACY_FIX_ON_EXPORT:
+        return []
+    return fix_att_full_coverage(root)
+
+
+def warn_att_full_coverage(root):
+    """
+    Prints the warning of fix_att_full_coverage_on_export for every pair, without changing anything.
+    For the encoders which apply the fix only virtually (see iob_encoder.get_spans), so they report like the inline path.
+    """
+    for _ in find_att_full_coverage_on_export(root):
+        print(ATT_FULL_COVERAGE_MESSAGE)
+
+
+def has_head(elem):
+    return bool(elem.get("head_start"))
+
+
+def fix_att_full_coverage(root, redirect_references=False):
+    """
+    If a att.xy covers exactly the same span as a reference in the same place,
+    there must be an error, as at least one of the two has a head missing.
+    Most likely, the att.xy should have been a desc.xy, but changing it now is too late,
+    so just drop a warning, remove the Attribute that is problematic and move on.
+    Also give the head of the attribute to the reference (only if the attribute has one,
+    an empty head never replaces the head of the reference).
+
+    If redirect_references is set, the hierarchy, relations, event anchors and roles pointing to a removed attribute
+    point to the reference afterwards (the postprocessing does this, the inline transformations don't need it).
+
+    Returns a report with one entry per fix: {"reference": id, "attribute": id, "head_start": ..., "head_end": ...}
+    (the head the reference has afterwards).
+    """
+    report = []
+    for ref, att in find_att_full_coverage(root):
+        print(ATT_FULL_COVERAGE_MESSAGE)
+        if has_head(att):
+            ref.set("head_start", att.get("head_start"))
+            ref.set("head_end", att.get("head_end"))
+            ref.set("head_text", att.get("head_text", ""))
+        report.append({"reference": ref.get("id"), "attribute": att.get("id"), "head_start": ref.get("head_start"), "head_end": ref.get("head_end")})
+        # the same attribute may cover several references, it is only removed once
+        if att.getparent() is not None:
+            att.getparent().remove(att)
+
+    if redirect_references and report:
+        redirect_mention_references(root, {fix["attribute"]: fix["reference"] for fix in report})
+
+    return report
+
+
+def redirect_mention_references(root, id_map):
+    """
+    Lets everything that pointed to a mention id in id_map point to the mapped id instead.
+    Hierarchy entries and relations which would connect a mention with itself or which already exist are removed,
+    just like roles which would point to the span of their own event or which already exist in their subevent.
+    """
+    hierarchy = root.find("./Hierarchy")
+    if hierarchy is not None:
+        seen = set()
+        for h in list(hierarchy):
+            parent = id_map.get(h.get("parent"), h.get("parent"))
+            child = id_map.get(h.get("child"), h.get("child"))
+            if parent == child or (parent, child) in seen:
+                hierarchy.remove(h)
+                continue
+            seen.add((parent, child))
+            h.set("parent", parent)
+            h.set("child", child)
+
+    relations = root.find("./Relations")
+    if relations is not None:
+        seen = set()
+        for relation in list(relations):
+            for att in ["from_mention", "to_mention"]:
+                if relation.get(att) in id_map:
+                    relation.set(att, id_map[relation.get(att)])
+            key = tuple(sorted(relation.attrib.items()))
+            if relation.get("from_mention") == relation.get("to_mention") or key in seen:
+                relations.remove(relation)
+                continue
+            seen.add(key)
+
+    for event in root.iterfind("./Events/Event"):
+        anchor_redirected = event.get("anchor") in id_map
+        if anchor_redirected:
+            event.set("anchor", id_map[event.get("anchor")])
+        event_span = event.get("id") if event.get("anchor") == "self" else event.get("anchor")
+        for subevent in event.iterfind("./Subevent"):
+            seen = set()
+            for role in subevent.findall("./Role"):
+                ref_redirected = role.get("ref") in id_map
+                if ref_redirected:
+                    role.set("ref", id_map[role.get("ref")])
+                if (ref_redirected or anchor_redirected) and role.get("ref") == event_span:
+                    subevent.remove(role)
+                    continue
+                key = tuple(sorted(role.attrib.items()))
+                if key in seen:
+                    subevent.remove(role)
+                    continue
+                seen.add(key)
@@ -0,0 +1,200 @@
+"""
+Parse-once export of Standard XML to several training data formats.
+
+The single create_*_training.py scripts each parse every document themselves and build the inline tree
+(create_conllu_training.py even parses the document a second time for the metadata).
+Here every document is parsed once, the inline tree is built once and shared by all jobs,
+so creating e.g. IOB, CoNLL-U and nne data for the same corpus costs about as much as creating one of them.
+Several jobs of the same format are fine as well, e.g. exp_evts jobs with different configs: the spans of
+every document are extracted once (see Document.spans) and each config only renders its samples from them.
+
+A job is a dict:
+{
+    "format": "conllu",              # a key of EXPORTERS
+    "config": {...},                 # the order/config of the respective transformation (a list of orders for iob)
+    "outfolder": "trainingdata/A/"   # train.txt, dev.txt and test.txt are written there
+}
+The documents are distributed to train/dev/test by the consistent training registry
+(json with the lists "train", "dev" and "test" of file basenames), for all jobs alike.
+The registry is read once and its lists are held as sets (see load_split_registry).
+
+The shared trees must not be modified by the exporters. Transformations which modify the inline tree
+(to_exp sets attributes) get their own copy (see Document.inline_copy).
+iob, conllu, nne and nne_old work on the Standard XML directly, for them no inline tree is built at all.
+An exporter returns the string for one document, or an iterable of strings which is written while it is produced
+(exp_evts renders its samples one at a time).
+"""
+
+import copy
+import csv
+import io
+import json
+import os
+import pathlib
+try:
+    from . import text_encoding, to_inline, to_iob, to_conllu, to_exp, to_exp_evts, to_nne, to_nne_old
+    from .config_compiler import compile_iob_orders, compile_iob_order, compile_exp_config, compile_evts_config, compile_nne_config
+except ImportError:
+    import text_encoding, to_inline, to_iob, to_conllu, to_exp, to_exp_evts, to_nne, to_nne_old
+    from config_compiler import compile_iob_orders, compile_iob_order, compile_exp_config, compile_evts_config, compile_nne_config
+
+SPLITS = ["train", "dev", "test"]
+
+
+class Document:
+    """
+    A parsed Standard XML document. The inline tree is only built if an exporter asks for it.
+    """
+    def __init__(self, docpath, index=0):
+        self.docpath = docpath
+        self.basename = os.path.basename(docpath)
+        self.index = index  # position in the corpus, used as sentence id in CoNLL-U
+        # a compact document stays compact, only the inline tree needs the token elements (see to_inline.process_root)
+        self.root = text_encoding.load(docpath)
+        self._inline = None
+        self._spans = None
+
+    @property
+    def inline(self):
+        """
+        The shared inline tree, read only.
+        """
+        if self._inline is None:
+            # to_inline moves the tokens out of the document, so the standard root stays intact for the other exporters
+            self._inline = to_inline.process_root(copy.deepcopy(self.root))
+        return self._inline
+
+    def inline_copy(self):
+        """
+        A private copy of the inline tree for transformations that modify it.
+        """
+        return copy.deepcopy(self.inline)
+
+    @property
+    def spans(self):
+        """
+        The spans of to_exp_evts, extracted once and shared by all exp_evts jobs, read only.
+        """
+        if self._spans is None:
+            self._spans = to_exp_evts.extract_spans_from_root(self.root)
+        return self._spans
+
+
+def export_iob(document, orders):
+    token_list, annotation_cols = to_iob.process_root(document.root, orders)
+    out = io.StringIO()
+    to_iob.write_training_document(csv.writer(out, delimiter="\t", lineterminator="\n"), document.basename, token_list, annotation_cols)
+    return out.getvalue()
+
+
+def export_conllu(document, config):
+    token_list, annotations = to_conllu.process_root(document.root, config)
+    metadata = to_conllu.construct_metadata_from_root(document.root, document.index, token_list)
+    yield from to_conllu.iter_conllu_lines(token_list, annotations, metadata)
+    yield "\n"
+
+
+def export_exp(document, config):
+    annotations = to_exp.process_inline(document.inline_copy(), config)
+    out = []
+    for anno in annotations:
+        for token, tag in anno:
+            out.append(f"{token}\t{tag}\n")
+        out.append("\n")
+    return "".join(out)
+
+
+def export_exp_evts(document, config):
+    return to_exp_evts.iter_sample_lines(to_exp_evts.process_spans(document.spans, config), comment=document.basename)
+
+
+def export_nne(document, config):
+    text, annotations = to_nne.process_root(document.root, config)
+    return text + "\n" + annotations + "\n\n"
+
+
+def export_nne_old(document, config):
+    token_list, tags = to_nne_old.process_root(document.root, config)
+    return to_nne_old.write_outstring(token_list, tags) + "\n"
+
+
+# format -> (header of each output file, export function returning the string (or strings) for one document)
+EXPORTERS = {
+    "iob": ("", export_iob),
+    "conllu": ("# global.columns = id form ner\n", export_conllu),
+    "exp": ("", export_exp),
+    "exp_evts": ("", export_exp_evts),
+    "nne": ("", export_nne),
+    "nne_old": ("", export_nne_old),
+}
+
+# format -> compiler validating the job config (formats without a compiler get their config as is)
+COMPILERS = {
+    "iob": compile_iob_orders,
+    "conllu": compile_iob_order,
+    "exp": compile_exp_config,
+    "exp_evts": compile_evts_config,
+    "nne": compile_nne_config,
+}
+
+
+def load_split_registry(consistent_data_file):
+    """
+    Reads the consistent training registry, the basenames of every split are held in a set.
+    """
+    with open(consistent_data_file, mode="r", encoding="utf8") as cons:
+        return to_split_registry(json.load(cons))
+
+
+def to_split_registry(consistent_data):
+    return {split: set(consistent_data[split]) for split in SPLITS}
+
+
+def get_split(basename, consistent_data):
+    for split in ["test", "dev", "train"]:
+        if basename in consistent_data[split]:
+            return split
+    return None
+
+
+def run(infiles, jobs, consistent_data):
+    """
+    Exports all infiles with all jobs in one pass over the documents.
+    consistent_data is the split registry, as loaded from the json or by load_split_registry.
+    """
+    consistent_data = to_split_registry(consistent_data)
+    for job in jobs:
+        if job["format"] not in EXPORTERS:
+            raise ValueError(f"Unknown export format '{job['format']}', choose from {', '.join(EXPORTERS)}.")
+    # compile all configs before any file is opened, an invalid config fails the whole run right away
+    jobs = [dict(job, config=COMPILERS[job["format"]](job["config"])) if job["format"] in COMPILERS else job for job in jobs]
+
+    outfiles = []
+    for job in jobs:
+        pathlib.Path(job["outfolder"]).mkdir(parents=True, exist_ok=True)
+        header = EXPORTERS[job["format"]][0]
+        files = {}
+        for split in SPLITS:
+            files[split] = open(os.path.join(job["outfolder"], f"{split}.txt"), mode="w", encoding="utf8")
+            files[split].write(header)
+        outfiles.append(files)
+
+    try:
+        for i, infile in enumerate(infiles):
+            print(f"Processing {infile}...")
+            split = get_split(os.path.basename(infile), consistent_data)
+            if split is None:
+                print(f"WARNING! {infile} was not found in consistent training registry!")
+                continue
+
+            document = Document(infile, index=i)
+            for job, files in zip(jobs, outfiles):
+                output = EXPORTERS[job["format"]][1](document, job["config"])
+                if isinstance(output, str):
+                    files[split].write(output)
+                else:
+                    files[split].writelines(output)
+    finally:
+        for files in outfiles:
+            for outfile in files.values():
+                outfile.close()
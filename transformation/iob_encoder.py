@@ -0,0 +1,208 @@
+"""
+IOB encoding directly on the token offsets of Standard XML, shared by to_iob and to_conllu.
+
+The result is the same as building the inline tree (to_inline) and walking up from every token
+(to_iob.process_inline), but no tree is built: the spans are nested once with a stack, which gives every token
+the chain of spans it is part of. The tags of a span are looked up once per order (see config_compiler.IOBOrder), and the B-/I- prefix follows
+from the start of the span (or its head), so all orders are encoded in one O(tokens + spans) pass.
+
+Only properly nested annotations can be encoded like this (no crossing spans, heads are not split by other spans),
+just like to_inline.build_inline_stack. For all other documents encode returns None
+and the caller has to fall back to the inline tree.
+"""
+
+try:
+    from . import text_encoding, to_inline
+    from .config_compiler import compile_iob_orders
+    from .corrections import find_att_full_coverage_on_export, has_head, warn_att_full_coverage
+except ImportError:
+    import text_encoding, to_inline
+    from config_compiler import compile_iob_orders
+    from corrections import find_att_full_coverage_on_export, has_head, warn_att_full_coverage
+
+# Nodes without heads cannot contain other elements or they won't be processed properly!
+# (at least in heads mode)
+NODES_WITHOUT_HEADS = ["Value"]
+
+
+class Span:
+    """
+    A node of the document with its token offsets (end exclusive) and its head, if it has one.
+    """
+    def __init__(self, node, start, end, head):
+        self.node = node
+        self.tag = node.tag
+        self.start = start
+        self.end = end
+        self.head = head  # (head_start, head_end) or None
+
+
+def get_attribute(node, name, attributes_to_include=None):
+    """
+    The attribute as the inline element of the node has it (see to_inline.add_attributes).
+    attributes_to_include replaces to_inline.ATTRIBUTES_TO_INCLUDE if given.
+    """
+    if attributes_to_include is None:
+        attributes_to_include = to_inline.ATTRIBUTES_TO_INCLUDE
+    if "_ALL_" in attributes_to_include:
+        return None if name in to_inline.ATTRIBUTES_TO_EXCLUDE else node.get(name)
+    if name not in attributes_to_include:
+        return None
+    return node.get(name)
+
+
+def get_spans(root, token_count):
+    """
+    Returns the spans in the order they are opened (by start, outer spans first), nodes with the same span
+    are nested in the order of to_inline. Nodes without tokens are left out, they can't be part of an annotation.
+    Returns None if the spans are not properly nested.
+    """
+    nodes = []
+    for c in to_inline.TO_CONVERT:
+        nodes.extend(root.findall(c))
+
+    # the same correction to_inline applies (only for legacy documents), without changing the document
+    fixed_heads = {}
+    removed = set()
+    for ref, att in find_att_full_coverage_on_export(root):
+        if has_head(att):
+            fixed_heads[ref] = (att.get("head_start"), att.get("head_end"))
+        removed.add(att)
+    if removed:
+        nodes = [node for node in nodes if node not in removed]
+
+    nodes = sorted(nodes, key=to_inline.sort_function)
+    spans = []
+    for i, node in enumerate(nodes):
+        start, end = int(node.get("start")), int(node.get("end"))
+        if start < 0 or end > token_count:
+            return None
+        head_start, head_end = fixed_heads.get(node, (node.get("head_start"), node.get("head_end")))
+        if start >= end:
+            if head_start:
+                # to_inline can't place the head of a node without tokens
+                return None
+            continue
+        head = (int(head_start), int(head_end)) if head_start else None
+        spans.append((start, -end, -i, Span(node, start, end, head)))
+    spans.sort(key=lambda x: x[:3])
+    spans = [span for _, _, _, span in spans]
+
+    open_ends = []
+    for span in spans:
+        while open_ends and open_ends[-1] <= span.start:
+            open_ends.pop()
+        if open_ends and span.end > open_ends[-1]:
+            return None
+        open_ends.append(span.end)
+    return spans
+
+
+def get_chains(spans, token_count):
+    """
+    Returns for every token the tuple of span indices containing it (outermost first).
+    Consecutive tokens in the same spans share the same tuple.
+    """
+    chains = []
+    stack = []
+    chain = ()
+    next_span = 0
+    for i in range(token_count):
+        changed = False
+        while stack and spans[stack[-1]].end <= i:
+            stack.pop()
+            changed = True
+        while next_span < len(spans) and spans[next_span].start == i:
+            stack.append(next_span)
+            next_span += 1
+            changed = True
+        if changed:
+            chain = tuple(stack)
+        chains.append(chain)
+    return chains
+
+
+def get_head_owners(spans, chains):
+    """
+    Returns for every token the index of the span whose head contains it (or None).
+    Returns None if a head is not made of direct children of its span (to_inline can't place it then).
+    """
+    owners = [None] * len(chains)
+    for j, span in enumerate(spans):
+        if span.head is None:
+            continue
+        head_start, head_end = span.head
+        if head_start >= head_end or head_start < span.start or head_end > span.end:
+            return None
+        for i in range(head_start, head_end):
+            if chains[i][-1] != j:
+                return None
+            owners[i] = j
+    return owners
+
+
+def encode_order(spans, chains, head_owners, order):
+    span_tags = {}
+    ancestor_views = {}
+    annotations = []
+    for i, chain in enumerate(chains):
+        if order.heads:
+            # the token must be directly inside a head (or a node which is its own head)
+            owner = head_owners[i]
+            if owner is not None:
+                first = i == spans[owner].head[0]
+            elif chain and spans[chain[-1]].tag in NODES_WITHOUT_HEADS:
+                first = i == spans[chain[-1]].start
+            else:
+                annotations.append("O")
+                continue
+
+        ancestors = ancestor_views.get(chain)
+        if ancestors is None:
+            ancestors = [j for j in chain if not (order.ignore_lists and spans[j].tag == "List")]
+            if order.heads:
+                ancestors.reverse()
+            ancestors = ancestors[:max(order.depth, 0)]
+            ancestor_views[chain] = ancestors
+
+        tags = []
+        first_filter = None
+        for j in ancestors:
+            if j not in span_tags:
+                node = spans[j].node
+                span_tags[j] = order.get_tags(lambda name: get_attribute(node, name))
+            tag_dict, filter_dict = span_tags[j]
+            if tag_dict:
+                if first_filter is None:
+                    first_filter = filter_dict
+                tags.append(tag_dict)
+
+        if not tags or order.is_filtered(first_filter):
+            annotations.append("O")
+            continue
+
+        if not order.heads:
+            # the deepest ancestor we looked at decides if this is the first token
+            first = i == spans[ancestors[-1]].start
+        attach = "B-" if first else "I-"
+        annotations.append(attach + ".".join([va for tag_dict in tags for ta, va in tag_dict.items()]))
+    return annotations
+
+
+def encode(root, orders):
+    """
+    Returns the token list and one annotation column per order for a Standard XML document (not modified),
+    or None if the annotations are not properly nested.
+    """
+    token_list = text_encoding.get_tokens(root)
+    spans = get_spans(root, len(token_list))
+    if spans is None:
+        return None
+    chains = get_chains(spans, len(token_list))
+    head_owners = get_head_owners(spans, chains)
+    if head_owners is None:
+        return None
+    # the same warning as for the inline tree, where to_inline fixes these
+    warn_att_full_coverage(root)
+    orders = compile_iob_orders(orders)
+    return token_list, [encode_order(spans, chains, head_owners, order) for order in orders]
@@ -0,0 +1,31 @@
+"""
+Runs a transformation over many documents with a pool of worker processes, shared by the corpus scripts
+(to_inline_corpus.convert_corpus, create_gt.py).
+"""
+
+from collections import deque
+
+WINDOW = 64  # max. number of items per worker which are submitted but not yet returned
+
+
+def imap_ordered(func, items, workers=1, window=WINDOW):
+    """
+    Yields func(item) for all items, in the order of the items.
+    With more than one worker the items are processed by a process pool (func and the items must be picklable then),
+    the caller gets the oldest result first. At most window * workers items are submitted but not yet returned,
+    so the memory use does not grow with the number of items. With one worker everything runs in this process.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            in_flight.append(pool.submit(func, item))
+            if len(in_flight) >= window * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
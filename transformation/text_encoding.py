@@ -0,0 +1,197 @@
+"""
+Reading and writing the two encodings of the <Text> element in Standard XML.
+
+Default encoding, one element per token:
+<Text>
+    <L line_id="0"><T token_id="0">Hans</T><T token_id="1">Meyer</T></L>
+</Text>
+
+Compact encoding, one string per line and the token boundaries as char offsets in the document text:
+<Text encoding="compact">
+    <L line_id="0" char_start="0" first_token="0" tokens="0-4 5-10">Hans Meyer</L>
+</Text>
+In the compact encoding the attributes which only repeat the token text
+(text of Descriptors and Values, head_text of References and Attributes) are left out,
+the elements which had one are marked with elided="text" (or "head_text").
+
+The readers which only need the token strings use load() and get_tokens(), for them a compact document
+stays compact (no element is created per token). The readers which need the <T> elements (the inline tree)
+use parse() or call expand_text() on an already parsed root, afterwards the document looks like the default encoding.
+"""
+
+from lxml import etree as et
+
+COMPACT = "compact"
+# marks the elements whose attribute was left out
+ELIDED = "elided"
+# attributes left out in the compact encoding: element tag -> (attribute, start attribute, end attribute)
+# elements without the attribute (e.g. Descriptors created by a special operation) stay without it
+ELIDED_ATTRIBUTES = {
+    "Reference": ("head_text", "head_start", "head_end"),
+    "Attribute": ("head_text", "head_start", "head_end"),
+    "Descriptor": ("text", "start", "end"),
+    "Value": ("text", "start", "end"),
+}
+
+
+def tokenize_text(text):
+    """
+    Splits the document text into lines and tokens.
+    Yields (line_id, tokens) where tokens is a list of (char_start, token) tuples.
+    Empty lines are yielded as well, only the empty trailing string is removed.
+    """
+    lines = text.split("\n")
+    current_index = 0
+    for i, line in enumerate(lines):
+        if not line and i+1 == len(lines):  # remove empty trailing strings
+            continue
+        tokens = []
+        for token in line.split(" "):
+            if token:
+                tokens.append((current_index, token))
+                current_index += len(token)
+            current_index += 1  # for the whitespace we removed earlier
+        yield i, tokens
+
+
+def write_compact_text(text_elem, text):
+    """
+    Compact version of postprocess.write_text, returns the same start and end dictionaries.
+    """
+    start_index_dict = {}
+    end_index_dict = {}
+    lines = text.split("\n")
+    line_start = 0
+    j = 0
+    for i, tokens in tokenize_text(text):
+        bounds = []
+        line_elem = et.SubElement(text_elem, "L", line_id=str(i), char_start=str(line_start), first_token=str(j))
+        line_elem.text = lines[i]
+        for char_start, token in tokens:
+            start_index_dict[char_start] = j
+            end_index_dict[char_start + len(token)] = j
+            bounds.append(f"{char_start}-{char_start + len(token)}")
+            j += 1
+        line_elem.set("tokens", " ".join(bounds))
+        line_start += len(lines[i]) + 1
+    text_elem.set("encoding", COMPACT)
+    return start_index_dict, end_index_dict
+
+
+def elide_token_text(root):
+    """
+    Removes the attributes which only repeat the token text (see ELIDED_ATTRIBUTES)
+    and marks the elements, so restore_token_text only adds them where they were.
+    """
+    for tag, (attribute, _, _) in ELIDED_ATTRIBUTES.items():
+        for elem in root.iterfind(f"./*/{tag}"):
+            if elem.attrib.pop(attribute, None) is not None:
+                elem.set(ELIDED, attribute)
+
+
+def restore_token_text(root, tokens):
+    """
+    Adds the attributes left out by elide_token_text again. tokens is the list of token strings.
+    """
+    for tag, (attribute, start, end) in ELIDED_ATTRIBUTES.items():
+        for elem in root.iterfind(f"./*/{tag}"):
+            if elem.get(ELIDED) != attribute:
+                continue
+            del elem.attrib[ELIDED]
+            if elem.get(start):
+                elem.set(attribute, " ".join(tokens[int(elem.get(start)):int(elem.get(end))]))
+            else:
+                elem.set(attribute, "")
+
+
+def is_compact(root):
+    text_elem = root.find("Text")
+    return text_elem is not None and text_elem.get("encoding") == COMPACT
+
+
+def iter_lines(root):
+    """
+    Yields (line_id, tokens) for all lines of the document, independent of the encoding.
+    tokens is a list of (token_id, token) tuples.
+    """
+    text_elem = root.find("Text")
+    if text_elem is None:
+        return
+    if text_elem.get("encoding") != COMPACT:
+        for line in text_elem.iterfind("./L"):
+            yield line.get("line_id"), [(token.get("token_id"), token.text) for token in line.iterfind("./T")]
+        return
+    for line in text_elem.iterfind("./L"):
+        tokens = []
+        if line.get("tokens"):
+            line_start = int(line.get("char_start"))
+            line_text = line.text or ""
+            for j, bounds in enumerate(line.get("tokens").split(" "), start=int(line.get("first_token"))):
+                start, end = bounds.split("-")
+                tokens.append((str(j), line_text[int(start) - line_start:int(end) - line_start]))
+        yield line.get("line_id"), tokens
+
+
+def iter_tokens(root):
+    """
+    Yields (token_id, token) for all tokens of the document, independent of the encoding.
+    """
+    for _, tokens in iter_lines(root):
+        yield from tokens
+
+
+def get_tokens(root):
+    """
+    The token strings of the document, independent of the encoding.
+    """
+    return [token for _, token in iter_tokens(root)]
+
+
+def expand_text(root):
+    """
+    Converts a document in the compact encoding to the default encoding (in place),
+    including the attributes that were left out. Documents in the default encoding are returned unchanged.
+    """
+    if not is_compact(root):
+        return root
+
+    lines = list(iter_lines(root))
+
+    # the Text element keeps its position in the document
+    text_elem = root.find("Text")
+    for line in list(text_elem):
+        text_elem.remove(line)
+    del text_elem.attrib["encoding"]
+    tokens = []
+    for line_id, line_tokens in lines:
+        line_elem = et.SubElement(text_elem, "L", line_id=line_id)
+        for token_id, token in line_tokens:
+            token_elem = et.SubElement(line_elem, "T", token_id=token_id)
+            token_elem.text = token
+            # the whitespace between the tokens is kept as tail, just like in a pretty printed document
+            # (to_inline_corpus relies on it when it strips the token tags)
+            token_elem.tail = " "
+            tokens.append(token)
+        if len(line_elem):
+            line_elem[-1].tail = "\n"
+
+    restore_token_text(root, tokens)
+    return root
+
+
+def parse(docpath):
+    """
+    Parses a Standard XML document and returns its root in the default encoding.
+    """
+    return expand_text(et.parse(docpath).getroot())
+
+
+def load(docpath):
+    """
+    Parses a Standard XML document for the readers which work on the token strings (see get_tokens):
+    a compact document keeps its encoding, only the left out attributes are restored.
+    """
+    root = et.parse(docpath).getroot()
+    if is_compact(root):
+        restore_token_text(root, get_tokens(root))
+    return root
@@ -4,49 +4,106 @@ Will probably be the base for a new to_inline script later on.
 """
 
 from lxml import etree as et
+try:
+    from . import text_encoding
+except ImportError:
+    import text_encoding
 
 
-def get_token_char_ids(root):
-    tokens = root.findall("./Text/L/T")
-    out_dict = {}
-    start_id = 0
-    document_text = []
-    for token in tokens:
-        end_id = start_id + len(token.text)
-        out_dict[token.get("token_id")] = (str(start_id), str(end_id))
-        start_id = end_id + 1
-        document_text.append(token.text)
-    return out_dict, " ".join(document_text)
+class CharOffsets:
+    """
+    The char offsets of the tokens (by their position) in the document text with single spaces between the tokens
+    (as written to the anno tree).
+    """
+    def __init__(self, tokens):
+        self.starts = []
+        self.ends = []
+        start_id = 0
+        for token in tokens:
+            self.starts.append(start_id)
+            start_id += len(token)
+            self.ends.append(start_id)
+            start_id += 1
+
+    def char_start(self, start):
+        """
+        The char start of the token at position start (an attribute value), KeyError if there is no such token.
+        """
+        if start is None or not start.isdigit() or int(start) >= len(self.starts):
+            raise KeyError(start)
+        return str(self.starts[int(start)])
 
+    def char_end(self, end):
+        """
+        The char end of the last token before position end (an attribute value, exclusive).
+        """
+        last = int(end) - 1
+        if not 0 <= last < len(self.ends):
+            raise KeyError(str(last))
+        return str(self.ends[last])
 
-def add_self_and_children(elem_id, parent, hierarchy, old_root, token_to_chars):
-    elem = old_root.xpath(f".//*[@id='{elem_id}']")[0]
 
+def get_token_char_ids(root):
+    """
+    Returns the char offsets of the tokens (see CharOffsets) and the document text.
+    """
+    document_text = [token for _, token in text_encoding.iter_tokens(root)]
+    return CharOffsets(document_text), " ".join(document_text)
+
+
+def add_char_ids(elem, char_offsets):
     # add char ids (additionally)
     try:
-        elem.set("char_start", token_to_chars[elem.get("start")][0])
-        elem.set("char_end", token_to_chars[str(int(elem.get("end"))-1)][1])
+        elem.set("char_start", char_offsets.char_start(elem.get("start")))
+        elem.set("char_end", char_offsets.char_end(elem.get("end")))
         if "head_start" in elem.attrib:
-            elem.set("head_char_start", token_to_chars[elem.get("head_start")][0])
-            elem.set("head_char_end", token_to_chars[str(int(elem.get("head_end"))-1)][1])
+            elem.set("head_char_start", char_offsets.char_start(elem.get("head_start")))
+            elem.set("head_char_end", char_offsets.char_end(elem.get("head_end")))
     except KeyError as e:
         print(e)
         print(et.tostring(elem))
 
-    parent.append(elem)
-    for h in hierarchy.findall(f"./H[@parent='{elem_id}']"):
-        add_self_and_children(h.get("child"), elem, hierarchy, old_root, token_to_chars)
+
+def add_self_and_children(elem_id, parent, children, elems_by_id, old_root, char_offsets):
+    """
+    Moves the element with elem_id and everything below it in the hierarchy to parent.
+    children maps the ids to the ids of their children in the hierarchy, elems_by_id the ids to their elements
+    (see transform). The tree is built with an explicit stack, so deeply nested documents are no problem.
+    """
+    stack = [(elem_id, parent)]
+    while stack:
+        elem_id, parent = stack.pop()
+        # the element has to be still in the old document, just like a search there would find it
+        elem = [e for e in elems_by_id.get(elem_id, []) if e.getroottree().getroot() is old_root][0]
+        add_char_ids(elem, char_offsets)
+        parent.append(elem)
+        # the children are processed in the order of the hierarchy
+        for child_id in reversed(children.get(elem_id, [])):
+            stack.append((child_id, elem))
 
 
 def transform(infile):
-    old_root = et.parse(infile)
-    hierarchy = old_root.find("./Hierarchy")
-    token_to_chars, document_text = get_token_char_ids(old_root)
+    """
+    The ids and the hierarchy are indexed once, so the cost is linear in the size of the document.
+    """
+    old_root = et.parse(infile).getroot()
+    char_offsets, document_text = get_token_char_ids(old_root)
+    if text_encoding.is_compact(old_root):
+        # no need to create the token elements, we only need the left out attributes
+        text_encoding.restore_token_text(old_root, document_text.split(" "))
+
+    elems_by_id = {}
+    for elem in old_root.iterdescendants():
+        if "id" in elem.attrib:
+            elems_by_id.setdefault(elem.get("id"), []).append(elem)
+    children = {}
+    for h in old_root.iterfind("./Hierarchy/H"):
+        children.setdefault(h.get("parent"), []).append(h.get("child"))
 
     new_root = et.Element("Document")
     new_root.set("document_text", document_text)
-    for h in hierarchy.findall(f"./H[@parent='doc']"):
-        add_self_and_children(h.get("child"), new_root, hierarchy, old_root, token_to_chars)
+    for child_id in children.get("doc", []):
+        add_self_and_children(child_id, new_root, children, elems_by_id, old_root, char_offsets)
 
     return new_root
 
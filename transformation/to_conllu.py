@@ -13,33 +13,53 @@ In theory, this algorithm should also work to extract events
 WORK IN PROGRESS
 """
 
+import copy
 import csv
 try:
     import to_inline
 except:
     import transformation.to_inline as to_inline
 from lxml import etree as et
+try:
+    from . import iob_encoder, text_encoding
+    from .config_compiler import compile_iob_order
+except ImportError:
+    import iob_encoder, text_encoding
+    from config_compiler import compile_iob_order
 import pprint as pp
 
 
 NODES_WITHOUT_HEADS = ["Value"]
 
 
-def write_outstring(token_list, annotations, metadata) -> str:
+def iter_conllu_lines(token_list, annotations, metadata):
     """
-    Writes a string in the conllu format which Flair expects.
-
-    This function gets called by the script to create the training data.
+    Yields the lines of a sentence in the conllu format which Flair expects,
+    the metadata comments first, then one row per token.
     """
+    yield f"# sentence_id = {metadata['sentence_id']}\n"
+    yield f"# text = {metadata['text']}\n"
     relation_string = "|".join([";".join([str(y) for y in x]) for x in metadata["relations"]])
     if relation_string:
-        out_string = f"""# sentence_id = {metadata["sentence_id"]}\n# text = {metadata["text"]}\n# relations = {relation_string}\n"""
-    else:
-        out_string = f"""# sentence_id = {metadata["sentence_id"]}\n# text = {metadata["text"]}\n"""
+        yield f"# relations = {relation_string}\n"
     for idx, (token, anno) in enumerate(zip(token_list, annotations), 1):
-        out_string += f"{idx} {token} {anno}\n"
+        yield f"{idx} {token} {anno}\n"
+
+
+def write_conllu(outfile, token_list, annotations, metadata):
+    """
+    Writes the sentence to outfile without building it as one string first (see iter_conllu_lines).
+
+    This function gets called by the script to create the training data.
+    """
+    outfile.writelines(iter_conllu_lines(token_list, annotations, metadata))
+
 
-    return out_string
+def write_outstring(token_list, annotations, metadata) -> str:
+    """
+    Returns the sentence as a string in the conllu format which Flair expects.
+    """
+    return "".join(iter_conllu_lines(token_list, annotations, metadata))
     
    
 def get_ancestors(node):
@@ -75,43 +95,60 @@ def check_if_first(node, ancestor, is_head=False):
         return node.getparent().index(node) == 0
     
 
-def resolve_lists(root, mention, mentions):
-    conns = root.xpath(f"./Hierarchy/H[@parent={mention.get('mention_id')}]")
-    conns = [root.find(f"./Mentions/*[@mention_id='{x.get('child')}']") for x in conns]
-    for conn in conns:
-        if conn.tag == "List":
-            resolve_lists(root, conn, mentions)
-        else:
-            mentions.append(conn)
-
-    
-def get_relations(root):
-    relation_elems = root.findall("./Relations/Relation")
+class RelationIndex:
+    """
+    The mentions of a document by their mention_id and the hierarchy, read once per document.
+    The lists are expanded to their leaf members when they are first met and kept,
+    so every relation is resolved with lookups only (see get_relations).
+    """
+    def __init__(self, root):
+        self.mentions = {}
+        for mention in root.iterfind("./Mentions/*"):
+            if mention.get("mention_id") is not None:
+                self.mentions.setdefault(mention.get("mention_id"), mention)
+        self.hierarchy = {}
+        for h in root.iterfind("./Hierarchy/H"):
+            self.hierarchy.setdefault(h.get("parent"), []).append(h.get("child"))
+        self.expansions = {}
+
+    def get_mention(self, mention_id):
+        return self.mentions.get(mention_id)
+
+    def expand(self, mention):
+        """
+        Returns the mention itself, or the leaf members of a list (lists in lists are resolved as well).
+        """
+        if mention.tag != "List":
+            return [mention]
+        members = self.expansions.get(mention)
+        if members is None:
+            members = []
+            for child_id in self.hierarchy.get(mention.get("mention_id"), []):
+                # the hierarchy also links descriptors, values etc., only mentions can be members
+                child = self.mentions.get(child_id)
+                if child is not None:
+                    members.extend(self.expand(child))
+            self.expansions[mention] = members
+        return members
+
+
+def get_relations(root, index=None):
+    index = index or RelationIndex(root)
     relations = []
-    for relation in relation_elems:
-        from_mentions = []
-        to_mentions = []
-
-        from_mention = root.find(f"./Mentions/*[@mention_id='{relation.get('from_mention')}']")
-        to_mention = root.find(f"./Mentions/*[@mention_id='{relation.get('to_mention')}']")
+    for relation in root.iterfind("./Relations/Relation"):
+        from_mention = index.get_mention(relation.get("from_mention"))
+        to_mention = index.get_mention(relation.get("to_mention"))
 
         if from_mention is None or to_mention is None:  # this filters event relations for the moment
             if from_mention is None:
-                print(f"WARING: Couldn't find mention with id {relation.get('from_mention')}")
+                print(f"WARNING: Couldn't find mention with id {relation.get('from_mention')}")
             else:
-                print(f"WARING: Couldn't find mention with id {relation.get('to_mention')}")
+                print(f"WARNING: Couldn't find mention with id {relation.get('to_mention')}")
             continue
 
         # resolve lists
-        if from_mention.tag == "List":
-            resolve_lists(root, from_mention, from_mentions)
-        else:
-            from_mentions = [from_mention]
-
-        if to_mention.tag == "List":
-            resolve_lists(root, to_mention, to_mentions)
-        else:
-            to_mentions = [to_mention]
+        from_mentions = index.expand(from_mention)
+        to_mentions = index.expand(to_mention)
         
         for from_mention in from_mentions:
             if not from_mention.get("head_start"):  # skip mentions without head
@@ -134,8 +171,19 @@ def construct_metadata(docpath, id):
     Creates a dict with elements
     Text, Sentence Id, Relations
     """
-    root = et.parse(docpath).getroot()
-    text = " ".join([t.text for t in root.findall(".//T")])
+    root = text_encoding.load(docpath)
+    return construct_metadata_from_root(root, id)
+
+
+def construct_metadata_from_root(root, id, token_list=None):
+    """
+    Same as construct_metadata for an already parsed Standard XML document.
+    token_list are the tokens of the document if they are already known (see process_root),
+    then the text is not collected from the tree again.
+    """
+    if token_list is None:
+        token_list = text_encoding.get_tokens(root)
+    text = " ".join(token_list)
 
     relations = get_relations(root)
 
@@ -143,33 +191,34 @@ def construct_metadata(docpath, id):
 
 
 def process_document(docpath, order):
-    # first transform it to inline xml so we have an easy to process hierarchy
-    texttree = to_inline.process_document(docpath)
+    return process_root(text_encoding.load(docpath), order)
+
 
+def process_root(root, order):
+    """
+    Same as process_document for an already parsed Standard XML document, the document is not modified.
+    The annotations are encoded directly from the token offsets (see iob_encoder),
+    only documents which are not properly nested go the way over the inline tree.
+    """
+    order = compile_iob_order(order)
+    encoded = iob_encoder.encode(root, [order])
+    if encoded is not None:
+        token_list, annotation_cols = encoded
+        return token_list, annotation_cols[0]
+    # transform it to inline xml so we have an easy to process hierarchy
+    return process_inline(to_inline.process_root(copy.deepcopy(root)), order)
+
+
+def process_inline(texttree, order):
+    """
+    Same as process_document for an already created inline tree, the tree is not modified.
+    """
     tokens = texttree.findall(".//T")
     # print([t.text for t in tokens])
     token_list = [t.text for t in tokens]
     ancestors_list = [get_ancestors(token) for token in tokens]
 
-    mode, depth, ordered_tags = order["mode"], order["depth"], order["tags"]
-    if "filter" in order:
-        filter = order["filter"]
-    else:
-        filter = {}
-    if "filter_strict" in order:
-        filter_strict = order["filter_strict"]
-    else:
-        filter_strict = {}
-    if "ignore_lists" in order and not order["ignore_lists"]:
-        ignore_lists = False
-    else:
-        ignore_lists = True
-    if "tag_granularity" in order:
-        # tag granularity controls to which level tags are used
-        # later i'd like also the option to set this per tag
-        tag_granularity = order["tag_granularity"]
-    else:
-        tag_granularity = -1
+    order = compile_iob_order(order)
     annotations = []
 
     # mode: decide if text is taken from the full node or only the head node
@@ -180,69 +229,34 @@ def process_document(docpath, order):
     # if depth == 1 (flat tags) we simply take the top tag
 
     for t, ancestors in zip(tokens, ancestors_list):
-        if ignore_lists:
+        if order.ignore_lists:
             ancestors = [a for a in ancestors if a.tag != "List"]
-        if mode == "heads":
+        if order.heads:
             ancestors = list(reversed(ancestors))
         tags = []
         to_filter = []
         p = None
-        if mode == "heads":
+        if order.heads:
             is_head = True if t.getparent().tag == "Head" or t.getparent().tag in NODES_WITHOUT_HEADS else False
             if not is_head:
                 tags = "O"
                 annotations.append(tags)
                 continue
-        for i in range(depth):
+        for i in range(order.depth):
             if i >= len(ancestors):
                 continue
             p = ancestors[i]
-            tag_dict = {}
-            filter_dict = {}
-            for o_t in ordered_tags:
-                # check if any of the tags do return something
-                split_o_t = o_t.split("|")
-                for o in split_o_t:
-                    tag = p.get(o)
-                    if tag != None:
-                        break
-                if tag != None:
-                    if tag_granularity != -1:
-                        tag = "_".join(tag.split("_")[:tag_granularity])
-                    if ordered_tags[o_t] and tag not in ordered_tags[o_t]:
-                        # only include the tags in the included_tags list
-                        continue
-                    tag_dict[o] = tag
-            for f_t in filter:
-                # check if any of the tags do return something
-                f_t = f_t.split("|")
-                for o in f_t:
-                    tag = p.get(o)
-                    if tag != None:
-                        break
-                if tag != None:
-                    filter_dict[o] = tag
+            tag_dict, filter_dict = order.get_tags(p.get)
             if len(tag_dict) > 0:
                 to_filter.append(filter_dict)
                 tags.append(tag_dict)
-        is_filtered = False
-        if tags:
-            for f in filter_strict:
-                if f not in to_filter[0] or to_filter[0][f] not in filter_strict[f]:
-                    is_filtered = True
-                    break
-            for f in filter:
-                # NOTE: We only filter the first level of depth currently
-                if f in to_filter[0] and to_filter[0][f] not in filter[f]:
-                    is_filtered = True
-                    break
-            if is_filtered:
-                tags = "O"
-                annotations.append(tags)
-                continue
+        if tags and order.is_filtered(to_filter[0]):
+            tags = "O"
+            annotations.append(tags)
+            continue
         # attach B or I
         if tags:
-            if check_if_first(t, p, True if mode == "heads" else False):
+            if check_if_first(t, p, order.heads):
                 attach = "B-"
             else:
                 attach = "I-"
@@ -6,8 +6,10 @@ Will probably also frequently change what it does.
 import csv
 try:
     from . import to_inline
+    from .config_compiler import compile_exp_config
 except ImportError:
     import to_inline
+    from config_compiler import compile_exp_config
 from lxml import etree as et
 import pprint as pp
 
@@ -61,89 +63,87 @@ def tokenize_tree(root, parent=None):
             tokenize_tree(child, root)
 
 
-def get_ancestors(node):
+class AncestorIndex:
     """
-    We build a list with all ancestors of the token.
-    We ignore head elements for that purpose!
+    The tokens of an inline tree with their (filtered) ancestors, computed once per document.
+    ranges maps every element containing tokens to its token range [start, end),
+    chains holds for every token the annotated ancestors (outermost first, heads included),
+    tokens with the same parent share the same list.
+    NOTE: merge_overlapping_desc_tags is applied to the tree here, before anything is filtered.
     """
-    ancestors = []
-    parent = node.getparent()
-    while parent.tag != "Body":
-        #if parent.tag != "Head":
-        ancestors.append(parent)
-        parent = parent.getparent()
-    
-    return list(reversed(ancestors))
-
-
-def check_if_first(node, ancestor, is_head=False):
-    """
-    Check if this is the first token of a full span
-    """
-    if not is_head:
-        first_child = ancestor[0]
-        while first_child.tag != "T":
-            first_child = first_child[0]
-        
-        if node == first_child:
-            return True
+    def __init__(self, texttree, config):
+        body = texttree.find("Body")
+        self.tokens = body.findall(".//T")
+        self.ranges = get_token_ranges(body)
+        if config.merge_overlapping_desc_tags:
+            merge_overlapping_desc_tags(texttree, config, self.ranges)
+
+        self.chains = []
+        stack = []
+        for event, elem in et.iterwalk(body, events=("start", "end")):
+            if elem.tag == "T":
+                if event == "start":
+                    self.chains.append(stack[-1])
+            elif event == "start":
+                chain = stack[-1] if stack else []
+                if elem is not body and filter_ancestors(elem, config, allow_heads=True):
+                    chain = chain + [elem]
+                stack.append(chain)
+            else:
+                stack.pop()
+
+    def is_first(self, i, ancestor):
+        """
+        Check if token i is the first token of the full span of ancestor
+        """
+        return self.ranges[ancestor][0] == i
+
+
+def get_token_ranges(root):
+    ranges = {}
+    starts = []
+    count = 0
+    for event, elem in et.iterwalk(root, events=("start", "end")):
+        if event == "start":
+            starts.append(count)
+            if elem.tag == "T":
+                count += 1
         else:
-            return False
-    else:
-        # heads are easy to check
-        return node.getparent().index(node) == 0
-    
+            start = starts.pop()
+            if count > start:
+                ranges[elem] = (start, count)
+    return ranges
+
 
-def check_parent(filter, annotation):
+def check_parent(config, annotation):
     """
-    Filter is a dict where the key references an attribute of the annotation.
+    config.require_parent is a dict where the key references an attribute of the annotation.
     "doc" is a special case, where spans without a parent are also included.
     The dict is considered an OR-construction for the moment, so only one condition must match.
     """
+    return config.check_parent(annotation)
+
 
-    for key, value in filter.items():
-        for v in value:
-            if key == "tag":
-                if v == "ref" and annotation.tag == "Reference":
-                    return True
-                elif v == "att" and annotation.tag == "Attribute":
-                    return True
-                elif v == "val" and annotation.tag == "Value":
-                    return True
-                elif v == "lst" and annotation.tag == "List":
-                    return True
-                elif v == "desc" and annotation.tag == "Descriptor":
-                    return True
-            elif key in annotation.attrib and annotation.get(key).startswith(v):
-                return True
-    return False
-
-
-def process_annotation(annotation, config, depth=1):
+def process_annotation(annotation, config, index, depth=1):
     more_annotations = []
 
-    if annotation.tag in config["tags"] and filter_ancestors(annotation, config):
-        if config["require_parent"] is None or check_parent(config["require_parent"], annotation): # ("entity_type" in annotation.attrib and "_".join(annotation.get("entity_type").split("_")[:config["tag_granularity"]]) in config["require_parent"]):
+    if annotation.tag in config.tags and filter_ancestors(annotation, config):
+        if config.require_parent is None or check_parent(config, annotation):
             new_tags = []
-            tokens = annotation.findall(".//T")
-            ancestors_list = [get_ancestors(token) for token in tokens]
+            start, end = index.ranges.get(annotation, (0, 0))
 
-            if config["depth_anno"] == "Binary":
+            if config.depth_anno == "Binary":
                 new_tags.append(("ENT", "B-ENT"))
-            elif config["depth_anno"] == "Ordinal":
+            elif config.depth_anno == "Ordinal":
                 new_tags.append((f"DEPTH-{depth}", "B-ENT"))
 
-            if config["tag_anno"] is not None:
-                pretag = []
-                for val in config["tag_anno"]:
-                    if val in annotation.attrib:
-                        pretag.append("_".join(annotation.get(val).split("_")[:config["tag_granularity"]]))
-                pretag = ".".join(pretag)
+            if config.tag_anno is not None:
+                pretag = config.pretag(annotation)
                 new_tags.append((f"{pretag.upper()}", f"B-PRETAG-{pretag.upper()}"))
 
 
-            for t, ancestors in zip(tokens, ancestors_list):
-                ancestors = [a for a in ancestors if filter_ancestors(a, config, allow_heads=True)]
+            for i in range(start, end):
+                ancestors = index.chains[i]
                 if depth < len(ancestors):
                     first_ancestor = ancestors[depth]
                     if first_ancestor.get("skip") is not None:
@@ -152,39 +152,25 @@ def process_annotation(annotation, config, depth=1):
                         else:
                             continue
 
-                    if check_if_first(t, first_ancestor):
+                    if index.is_first(i, first_ancestor):
                         attach = "B-"
                     else:
                         attach = "I-"
                     if first_ancestor.tag == "Head":
                         tag = "head"
                     else:
-                        tag = []
-                        for k, v in config["tags"][first_ancestor.tag].items():
-                            if k == "tag":
-                                tag.append(f"tag:{v}")
-                                continue
-                            if first_ancestor.get(k):
-                                prefix = ""
-                                if v["prefix"]:
-                                    prefix = v["prefix"] + ":"
-                                value = "_".join(first_ancestor.get(k).split("_")[:config["tag_granularity"]])
-                                if ":" in value or ";" in value:
-                                    print("Warning: Disallowed character such as : or ; in label!")
-                                    value = value.replace(":", "_").replace(";", "_")
-                                tag.append(prefix + value)
-                        tag = ";".join(tag)
+                        tag = config.label(first_ancestor)
                     tag = attach + tag
                 else:
                     tag = "O"
-                new_tags.append((t.text, tag))
+                new_tags.append((index.tokens[i].text, tag))
 
-            if config["tag_anno"] is not None:
+            if config.tag_anno is not None:
                 new_tags.append((f"{pretag.upper()}", f"B-PRETAG-{pretag.upper()}"))
 
-            if config["depth_anno"] == "Binary":
+            if config.depth_anno == "Binary":
                 new_tags.append(("ENT", "B-ENT"))
-            elif config["depth_anno"] == "Ordinal":
+            elif config.depth_anno == "Ordinal":
                 new_tags.append((f"DEPTH-{depth}", "B-ENT"))
             
             if new_tags:
@@ -194,7 +180,7 @@ def process_annotation(annotation, config, depth=1):
             depth += 1
     
     for anno in annotation.findall("./*"):
-        more_annotations.extend(process_annotation(anno, config, depth))
+        more_annotations.extend(process_annotation(anno, config, index, depth))
     return more_annotations
 
 def add_skips(elem, num):
@@ -202,104 +188,90 @@ def add_skips(elem, num):
     for child in elem:
         add_skips(child, num)
 
-def filter_ancestors(ancestor, config, allow_heads=False):
-    if allow_heads and ancestor.tag == "Head":
-        return True
-    if ancestor.tag not in config["tags"]:
-        return False
-    
-    if config["merge_overlapping_desc_tags"]:
-        # this code currently doesn't work if we have more than one tag of the same span in the hierarchy
-        # should not happen anyway with out data
-        # this is hacky as hell anyways so, stuff like this should be solved first in postprocessing anyways
+def merge_overlapping_desc_tags(texttree, config, ranges):
+    """
+    If a desc tag covers the same span as another tag (Reference or Attribute usually),
+    the desc tag is put as a mention subtype info to the entity annotation instead and the
+    spans below are marked to skip the desc level.
+    """
+    # this code currently doesn't work if we have more than one tag of the same span in the hierarchy
+    # should not happen anyway with out data
+    # this is hacky as hell anyways so, stuff like this should be solved first in postprocessing anyways
+    for ancestor in texttree.iter():
+        # elements without tokens have nothing to merge
+        if ancestor.tag not in config.tags or ancestor not in ranges:
+            continue
         parent = ancestor.getparent()
-        if parent.tag == "Descriptor" and parent.findall(".//T") == ancestor.findall(".//T"):
+        if parent.tag == "Descriptor" and ranges.get(parent) == ranges[ancestor]:
             parent.getparent().set("mention_subtype", parent.get("desc_type"))
             parent.set("skip", str(1))
             add_skips(ancestor, 1)
 
-    for key, value in config["tags"][ancestor.tag].items():
-        if key == "tag":
-            return True
-        # value is a dict with "include" where all tags to read are contained, an empty "include" means to include the tag
-        # "exclude" where all tags not to include are kept
-        include = value["include"]
-        exclude = []
-        if "exclude" in value:
-            exclude = value["exclude"]
-        if key not in ancestor.attrib:
-            return False
-        if "_".join(ancestor.get(key).split("_")[:config["tag_granularity"]]) in exclude:
-            return False
-        if include and "_".join(ancestor.get(key).split("_")[:config["tag_granularity"]]) not in include:
-            return False
-    return True
+def filter_ancestors(ancestor, config, allow_heads=False):
+    if allow_heads and ancestor.tag == "Head":
+        return True
+    # every attribute setting has an "include" where all tags to read are contained, an empty "include" means to include the tag
+    # and "exclude" where all tags not to include are kept
+    return config.accepts(ancestor)
 
 def process_document(docpath, config):
     # first transform it to inline xml so we have an easy to process hierarchy
     texttree = to_inline.process_document(docpath)
+    return process_inline(texttree, config)
+
 
+def process_inline(texttree, config):
+    """
+    Same as process_document for an already created inline tree.
+    NOTE: The inline tree may be modified (merge_overlapping_desc_tags).
+    The ancestors of every token are looked up once (see AncestorIndex), the spans only slice them,
+    so the cost is linear in the size of the output.
+    """
     to_inline.ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
+    config = compile_exp_config(config)
 
-    tokens = texttree.findall(".//T")
-    ancestors_list = [get_ancestors(token) for token in tokens]
+    index = AncestorIndex(texttree, config)
 
     annotations = []
 
-    if config["require_parent"] is None or "doc" in config["require_parent"]:
+    if config.include_doc:
         first_layer_annotation = []
 
-        if config["depth_anno"] == "Binary":
+        if config.depth_anno == "Binary":
             first_layer_annotation.append(("DOC", "B-DOC"))
-        elif config["depth_anno"] == "Ordinal":
+        elif config.depth_anno == "Ordinal":
             first_layer_annotation.append(("DEPTH-0", "B-DOC"))
-        elif config["tag_anno"] is not None:
+        elif config.tag_anno is not None:
             ## we only put a doc thing here if tag anno is activated
             first_layer_annotation.append(("DOC", "B-DOC"))
 
-        for t, ancestors in zip(tokens, ancestors_list):
+        for i, (t, ancestors) in enumerate(zip(index.tokens, index.chains)):
             # filter to only keep the annotations we're interested in
-            ancestors = [a for a in ancestors if filter_ancestors(a, config)]
+            first_ancestor = next((a for a in ancestors if filter_ancestors(a, config)), None)
             
-            if ancestors:
-                first_ancestor = ancestors[0]
-                if check_if_first(t, first_ancestor):
+            if first_ancestor is not None:
+                if index.is_first(i, first_ancestor):
                     attach = "B-"
                 else:
                     attach = "I-"
-                tag = []
-                for k, v in config["tags"][first_ancestor.tag].items():
-                    if k == "tag":
-                        tag.append(f"tag:{v}")
-                        continue
-                    if first_ancestor.get(k):
-                        prefix = ""
-                        if v["prefix"]:
-                            prefix = v["prefix"] + ":"
-                        value = "_".join(first_ancestor.get(k).split("_")[:config["tag_granularity"]])
-                        if ":" in value or ";" in value:
-                            print("Warning: Disallowed character such as : or ; in label!")
-                            value = value.replace(":", "_").replace(";", "_")
-                        tag.append(prefix + value)
-                tag = ";".join(tag)
-                tag = attach + tag
+                tag = attach + config.label(first_ancestor)
             else:
                 tag = "O"
             first_layer_annotation.append((t.text, tag))
 
-        if config["depth_anno"] == "Binary":
+        if config.depth_anno == "Binary":
             first_layer_annotation.append(("DOC", "B-DOC"))
-        elif config["depth_anno"] == "Ordinal":
+        elif config.depth_anno == "Ordinal":
             first_layer_annotation.append(("DEPTH-0", "B-DOC"))
-        elif config["tag_anno"] is not None:
+        elif config.tag_anno is not None:
             ## we only put a doc thing here if tag anno is activated
             first_layer_annotation.append(("DOC", "B-DOC"))
 
         annotations.append(first_layer_annotation)
 
-    if config["require_parent"] is None or "doc" not in config["require_parent"]:
+    if config.include_spans:
         for annotation in texttree.findall("./*"):
-            annotations.extend(process_annotation(annotation, config))
+            annotations.extend(process_annotation(annotation, config, index))
 
     return annotations
 
@@ -2,11 +2,17 @@
 Creates a sample for each span, with given tags.
 Also enables adding event roles, triggers etc.
 """
+import copy
+import functools
 from lxml import etree as et
+try:
+    from . import text_encoding
+    from .config_compiler import ConfigError, compile_evts_config
+except ImportError:
+    import text_encoding
+    from config_compiler import ConfigError, compile_evts_config
 import pprint as pp
 
-from numpy import source
-
 
 def get_id(elem):
     if elem.tag in ["Reference", "List", "Attribute"]:
@@ -24,6 +30,8 @@ def get_id(elem):
 
 
 class Token(object):
+    __slots__ = ("text", "tags", "head")
+
     def __init__(self, text, tags=None):
         self.text = text
         self.tags = {}  # col: tag
@@ -32,10 +40,8 @@ class Token(object):
         self.head = {}  # col: is_head? (bool)
 
     def print_conllu(self, order):
-        tags = []
-        for o in order:
-            tags.append(self.tags[o])
-        return "\t".join([self.text] + tags) + "\n"
+        # columns without a tag are O
+        return "\t".join([self.text] + [self.tags.get(o, "O") for o in order]) + "\n"
     
     def __str__(self):
         return self.text
@@ -44,11 +50,20 @@ class Token(object):
 class Span(object):
     """
     Holds all information for a specific sample.
+    The span only holds a view (token_start, token_end) into the token texts of the document,
+    which are shared by all spans. The Token objects with the tags are only created when the
+    sample is rendered (see create_conllu).
     """
-    def __init__(self, xml_obj, tokens, ref=None):
+    __slots__ = ("tag", "xml_obj", "texts", "token_start", "token_end", "tokens", "children", "parent",
+                 "ref", "focus_trigger", "corr_event", "corr_subevents", "overlay")
+
+    def __init__(self, xml_obj, texts, token_start, token_end, ref=None):
         self.tag = xml_obj.tag if xml_obj is not None else "doc"
         self.xml_obj = xml_obj
-        self.tokens = [Token(t.text) for t in tokens]
+        self.texts = texts  # the token texts of the whole document
+        self.token_start = token_start
+        self.token_end = token_end
+        self.tokens = None  # only set while rendering
         self.children = []
         self.parent = None
         self.ref = ref  # mainly for roles
@@ -56,9 +71,13 @@ class Span(object):
 
         self.corr_event = None  # if the element is a role or trigger, reference to the event is here
         self.corr_subevents = set()
+        self.overlay = None  # (optional, kept) indices of the children, only for samples (see create_sample)
 
     def __repr__(self):
-        return f"<Span {self.tag}: '{' '.join([str(t) for t in self.tokens])}'>"
+        return f"<Span {self.tag}: '{' '.join(self.get_texts())}'>"
+
+    def get_texts(self):
+        return self.texts[self.token_start:self.token_end]
 
     @property
     def start(self):
@@ -108,16 +127,49 @@ class Span(object):
         self.children.append(child)
         child.parent = self
 
+    def create_sample(self, children, optional=None, kept=None):
+        """
+        A sample of this span with the given (filtered) children, this span itself is not changed,
+        so the extracted spans can be filtered with any number of configs.
+        If optional is given, the optional children (indices into children) not in kept are dropped.
+        Everything else, including the token texts, is shared with this span,
+        the children of the sample are only put together when it is rendered.
+        """
+        sample = copy.copy(self)
+        sample.children = children
+        if optional is not None:
+            sample.overlay = (optional, kept)
+        return sample
+
+    def with_ref(self, ref):
+        """
+        A copy of this span which refers to ref instead, used for the triggers of roles (see filter_child).
+        """
+        span = copy.copy(self)
+        span.ref = ref
+        return span
+
+    def get_children(self):
+        if self.overlay is None:
+            return self.children
+        optional, kept = self.overlay
+        return [c for i, c in enumerate(self.children) if i not in optional or i in kept]
+
     def filter_child(self, child, column, filter, collector):
-        if child.tag in filter:
-            if "dont_annotate" in filter[child.tag]:
+        """
+        filter is the compiled column (config_compiler.EvtsColumn).
+        """
+        tag_settings = filter.tags.get(child.tag)
+        if tag_settings is not None:
+            if tag_settings.dont_annotate:
                 # we ignore children below this, but don't annotate that tag
                 return
-            if "if_event_use_trigger_instead" in filter[child.tag] and filter[child.tag]["if_event_use_trigger_instead"]:
+            if tag_settings.use_trigger:
                 if child.ref is not None and child.ref.tag == "Event":
                     new_ref = [c for c in child.ref.children if c.tag == "Trigger"]
                     if new_ref:
-                        child.ref = new_ref[0]
+                        # the role itself stays as it is, other columns and configs may not use the trigger
+                        child = child.with_ref(new_ref[0])
             collector.append((column, child))
         else:
             for c in child.children:
@@ -126,8 +178,8 @@ class Span(object):
     def filter_children(self, filter):
         filtered_children = []
         for child in self.children:
-            for col in filter:
-                self.filter_child(child, col, filter[col], filtered_children)
+            for col, column in filter.items():
+                self.filter_child(child, col, column, filtered_children)
         return filtered_children
     
     def get_child_relative_position(self, child, head_only=False):
@@ -143,58 +195,53 @@ class Span(object):
     def get_tag(self, child, column, config):
         """
         Can return an empty string to signify that the span was filtered out.
+        config is the compiled config (config_compiler.EvtsConfig).
         """
         tag = []
-        info = config["cols"][column][child.tag]
-        tag_granularity = config["tag_granularity"][column]
-        for key, settings in info.items():
-            if key == "tag":
-                if settings == "ignore":
+        column = config.cols[column]
+        for entry in column.tags[child.tag].entries:
+            if isinstance(entry, str):
+                # the tag name
+                if entry == "ignore":
                     return ""
-                tag.append("tag:"+settings)
-                continue
-            elif key in ["if_event_use_trigger_instead"]:
+                tag.append("tag:"+entry)
                 continue
 
             xml_obj = child.xml_obj
-            if "use_xml_parent" in settings and settings["use_xml_parent"] is True:
+            if entry.use_xml_parent:
                 xml_obj = child.xml_obj.getparent()
-            comp = "_".join(xml_obj.get(key).split("_")[:tag_granularity])
-            if "convert" in settings:
-                if "condition" in settings["convert"]:
-                    fulfilled_all_conditions = False
-                    for cond, val in settings["convert"]["condition"].items():
-                        if cond == "event_type":
-                            if child.corr_event.get("type") != val:
-                                break
-                    else:
-                        fulfilled_all_conditions = True
-                else:
-                    fulfilled_all_conditions = True
-                if fulfilled_all_conditions:
-                    if comp in settings["convert"]["dict"]:
-                        comp = settings["convert"]["dict"][comp]
+            comp = column.granularity(xml_obj.get(entry.key))
+            if entry.convert is not None:
+                if entry.convert_event_type is None or child.corr_event.get("type") == entry.convert_event_type:
+                    if comp in entry.convert:
+                        comp = entry.convert[comp]
             # a bit dirty, doing some filtering here as well
-            if "only_freetext" in settings and settings["only_freetext"]:
+            if entry.only_freetext:
                 if child.xml_obj.get("ref") != "#freetext":
                     return ""
-            if "include" in settings and settings["include"] and comp not in settings["include"]:
+            if entry.include is not None and comp not in entry.include:
                 return ""
-            if "require_xml_grandparent" in settings and settings["require_xml_grandparent"]:
+            if entry.require_xml_grandparent:
                 # a simplified filtering for especially for roles based on their events
                 grandparent = child.xml_obj.getparent().getparent()
-                for k, v in settings["require_xml_grandparent"].items():
-                    if not v:  # an empty list accepts all
-                        continue
-                    c = grandparent.get(k)
-                    if c not in v:
+                for k, v in entry.require_xml_grandparent:
+                    if grandparent.get(k) not in v:
                         return ""
-            tag.append(settings["prefix"] + ":" + comp)
+            tag.append(entry.prefix + ":" + comp)
         return ";".join(tag)
 
     def create_conllu(self, filter, modifications):
-        for col, child in self.children:
-            head_only = True if "only_head" in filter["cols"][col] and filter["cols"][col]["only_head"] else False
+        return "".join(self.create_rows(filter, modifications))
+
+    def create_rows(self, filter, modifications):
+        """
+        Renders the sample and returns its CoNLL-U rows (one line per token).
+        filter is the compiled config (config_compiler.EvtsConfig),
+        modifications the names of the span modifications or their compiled pipeline (see compile_span_modifications).
+        """
+        self.tokens = [Token(text) for text in self.get_texts()]
+        for col, child in self.get_children():
+            head_only = filter.cols[col].only_head
             start, end = self.get_child_relative_position(child, head_only)
             if start < 0 and end >= len(self.tokens):
                 print(f"Skipping child {child.tag} of tag {self.tag} because child is the outer span.")
@@ -208,8 +255,8 @@ class Span(object):
             # TODO: complement settings for full BIOES scheme instead of BIO
 
         # add head annotation if wanted
-        for col in filter["cols"]:
-            if "add_heads" not in filter["cols"][col] or not filter["cols"][col]["add_heads"]:
+        for col, column in filter.cols.items():
+            if not column.add_heads:
                 continue
             if self.xml_obj is not None and "head_text" in self.xml_obj.attrib and self.xml_obj.get("head_text"):
                 start, end = int(self.xml_obj.get("head_start")) - int(self.start), int(self.xml_obj.get("head_end")) - int(self.start)
@@ -221,15 +268,12 @@ class Span(object):
                     self.tokens[token].head[col] = ("I-head")
 
         # perform span modifications
-        for mod in convert_span_modifications(modifications):
-            self.tokens = mod(self, self.tokens)
-        # complement all tokens without tags with O
-        for token in self.tokens:
-            for col in filter["cols"]:
-                if col not in token.tags:
-                    token.tags[col] = "O"
-        column_order = [key for key in filter["cols"].keys() if "dont_print" not in filter["cols"][key] or not filter["cols"][key]["dont_print"]]
-        return "".join([t.print_conllu(column_order) for t in self.tokens])
+        self.tokens = compile_span_modifications(modifications).apply(self, self.tokens)
+        # all tokens without tags are complemented with O when printed
+        rows = [t.print_conllu(filter.column_order) for t in self.tokens]
+        # the tokens are only needed for rendering
+        self.tokens = None
+        return rows
 
 
 def extract_spans(infile):
@@ -237,14 +281,21 @@ def extract_spans(infile):
     Returns a list of Span objects which hold all necessary sample information.
     Evspans should only be included if they're not already covered by another span
     """
-    root = et.parse(infile).getroot() # type: ignore
-    tokens = root.xpath("./Text/L/T")
+    return extract_spans_from_root(text_encoding.load(infile))
+
+
+def extract_spans_from_root(root):
+    """
+    Same as extract_spans for an already parsed Standard XML document (not modified).
+    The spans are only read afterwards (see filter_spans), they can be shared by any number of configs.
+    """
+    texts = text_encoding.get_tokens(root)
     valid_nodes = root.xpath("./*[self::Mentions or self::Descriptors or self::Values or self::Events]/*")
     spans = {}
 
     # add document-level span
     id = "doc"
-    spans[id] = Span(None, tokens)
+    spans[id] = Span(None, texts, 0, len(texts))
 
     # add the other spans
     for node in valid_nodes:
@@ -253,18 +304,17 @@ def extract_spans(infile):
         if node.tag == "Event" and node.get("anchor") != "self":
             continue
         
-        spans[id] = Span(node, tokens[int(node.get("start")):int(node.get("end"))])
+        spans[id] = Span(node, texts, int(node.get("start")), int(node.get("end")))
 
     # establish span hierarchy
+    # spans already maps the ids of all mentions, descriptors, values and events to their span,
+    # so one pass over the hierarchy is enough
+    hierarchy = {}
+    for h in root.iterfind("./Hierarchy/H"):
+        hierarchy.setdefault(h.get("parent"), []).append(h.get("child"))
     for span_id, span in spans.items():
-        id = span_id
-        children = root.xpath(f"./Hierarchy/H[@parent='{id}']")
-        for child in children:
-            child = child.get("child")
-            child = root.xpath(f".//*[@id='{child}']")[0]
-            id = get_id(child)
-            child = spans[id]
-            span.add_child(child)
+        for child_id in hierarchy.get(span_id, []):
+            span.add_child(spans[child_id])
 
     # add role information to spans
     for event in root.xpath("./Events/Event"):
@@ -279,42 +329,36 @@ def extract_spans(infile):
             event_span = spans[event_span_id]
         trigger = event.find("Trigger")
         if trigger is not None:
-            trigger_span = Span(trigger, tokens[int(trigger.get("start")):int(trigger.get("end"))])
+            trigger_span = Span(trigger, texts, int(trigger.get("start")), int(trigger.get("end")))
             trigger_span.corr_event = event
             event_span.add_child(trigger_span)
-        role_set = []
+        # the roles of the event by their ref span and by their text span (start, end),
+        # the first role with the same text span is used for freetext roles
+        roles_by_ref = {}
+        roles_by_span = {}
         for subevent in event.findall("Subevent"):
             for role in subevent.findall("Role"):
                 if role.get("ref") != "#freetext":
                     ref = spans[role.get("ref")]
-                    role_tokens = ref.tokens
-                    # only create role if ref isn't in role_set yet
-                    already_in = False
-                    for x in role_set:
-                        if x.ref == ref:
-                            x.corr_subevents.add(subevent.get("id"))
-                            already_in = True
-                            break
-                    if already_in:
-                        continue
+                    role_view = (ref.token_start, ref.token_end)
+                    # only create role if ref isn't in the roles yet
+                    existing = roles_by_ref.get(ref)
                 else:
                     ref = None
-                    role_tokens = tokens[int(role.get("start")):int(role.get("end"))]
-                    # only create role if textspan isn't in role_set yet
-                    already_in = False
-                    for x in role_set:
-                        if x.start == role.get("start") and x.end == role.get("end"):
-                            x.corr_subevents.add(subevent.get("id"))
-                            already_in = True
-                            break
-                    if already_in:
-                        continue
-                role_span = Span(role, role_tokens, ref=ref)
+                    role_view = (int(role.get("start")), int(role.get("end")))
+                    # only create role if textspan isn't in the roles yet
+                    existing = roles_by_span.get((role.get("start"), role.get("end")))
+                if existing is not None:
+                    existing.corr_subevents.add(subevent.get("id"))
+                    continue
+                role_span = Span(role, texts, *role_view, ref=ref)
                 role_span.corr_event = event
                 role_span.corr_subevents.add(subevent.get("id"))
                 event_span.add_child(role_span)
                 
-                role_set.append(role_span)
+                if ref is not None:
+                    roles_by_ref[ref] = role_span
+                roles_by_span.setdefault((role_span.start, role_span.end), role_span)
 
     return spans.values()
 
@@ -326,84 +370,88 @@ def filter_spans(spans, config):
 
     When a span is removed because of a filter, all its child spans need to
     be moved to their parent element.
+
+    The spans are not changed, every kept span is returned as a sample with its own filtered children
+    (see Span.create_sample), so the same extracted spans can be filtered with several configs.
     """
     filtered_spans = []
     for span in spans:
-        if span.xml_obj is not None and span.tag not in config["include_spans"]["tags"]:
+        if span.xml_obj is not None and span.tag not in config.span_tags:
             continue
 
-        span.children = span.filter_children(config["include_tags"]["cols"])
+        children = span.filter_children(config.cols)
 
-        if "create_samples_based_on_" in config["include_spans"]:
-            import copy
-            valid_children = [c for c in span.children if c[0] == config["include_spans"]["create_samples_based_on_"]["column"]]
+        if config.samples_based_on is not None:
+            based_on = config.samples_based_on
+            valid_children = [c for c in children if c[0] == based_on["column"]]
+            groups = None
             
             for _, child in valid_children:
-                if child.tag == config["include_spans"]["create_samples_based_on_"]["source"] and \
-                    (child.get_event().get("type").split("_")[0] == config["include_spans"]["create_samples_based_on_"]["event_type"] or not config["include_spans"]["create_samples_based_on_"]["event_type"]) and \
-                    (child.xml_obj.get("type").split("_")[0] if child.xml_obj.get("type") else "" == config["include_spans"]["create_samples_based_on_"]["type"] or not config["include_spans"]["create_samples_based_on_"]["type"]):
-                    
-                    span_copy = copy.copy(span)
-                    span_copy.tokens = [copy.deepcopy(t) for t in span_copy.tokens]
-                    span_copy.children = [c for c in span_copy.children]
-                    # remove role children which are not of the same event as the trigger
-                    for col, chi in copy.copy(span.children):
-                        if col != config["include_spans"]["create_samples_based_on_"]["column"]:
-                            continue
-                        if chi.tag in ["Role", "Trigger"]:
-                            if config["include_spans"]["create_samples_based_on_"]["use_subevent"]:
-                                if not chi.get_subevents().intersection(child.get_subevents()):
-                                    span_copy.children.remove((col, chi))
-                            else:
-                                if chi.get_event() != child.get_event():
-                                    span_copy.children.remove((col, chi))
+                if child.tag == based_on["source"] and \
+                    (child.get_event().get("type").split("_")[0] == based_on["event_type"] or not based_on["event_type"]) and \
+                    (child.xml_obj.get("type").split("_")[0] if child.xml_obj.get("type") else "" == based_on["type"] or not based_on["type"]):
+
+                    if groups is None:
+                        optional, groups = group_sample_children(children, based_on)
+                    # remove role children which are not of the same event (or subevent) as the trigger
+                    if based_on["use_subevent"]:
+                        kept = set().union(*[groups.get(subevent, ()) for subevent in child.get_subevents()])
+                    else:
+                        kept = groups.get(child.get_event(), ())
                     
-                    filtered_spans.append(span_copy)
+                    filtered_spans.append(span.create_sample(children, optional, kept))
         else:
-            filtered_spans.append(span)
+            filtered_spans.append(span.create_sample(children))
 
     return filtered_spans
 
 
-def shorten_annotations_to_heads(span_elem, full_column="ner", head_column="ner_only_head"):
+def group_sample_children(children, based_on):
+    """
+    Returns the indices of the role and trigger children in the column of create_samples_based_on_,
+    which are only kept in the samples of their event, and these indices grouped by event (or subevent).
+    """
+    optional = set()
+    groups = {}
+    for i, (col, child) in enumerate(children):
+        if col != based_on["column"] or child.tag not in ["Role", "Trigger"]:
+            continue
+        optional.add(i)
+        keys = child.get_subevents() if based_on["use_subevent"] else [child.get_event()]
+        for key in keys:
+            groups.setdefault(key, set()).add(i)
+    return optional, groups
+
+
+def iter_shortened_to_heads(tokens, full_column="ner", head_column="ner_only_head"):
     """
     Remove all tokens which are not part of the head of the entity span they're contained within.
     If a token was originally a B-tag, the next valid token must receive the B- instead
     """
-    tokens = span_elem.tokens
-    out = []
     beginning_tag_waiting = set()
     for token in tokens:
-        if (full_column not in token.tags or token.tags[full_column] == "O") or full_column in token.head:
-            out.append(token)
+        if (full_column not in token.tags or token.tags[full_column] == "O") or full_column in token.head \
+                or head_column in token.tags:
             for col in beginning_tag_waiting:
                 token.tags[col] = "B-" + token.tags[col][2:]
             beginning_tag_waiting = set()
-                
+            yield token
         else:
-            if head_column in token.tags:
-                out.append(token)
-                for col in beginning_tag_waiting:
-                    token.tags[col] = "B-" + token.tags[col][2:]
-                beginning_tag_waiting = set()
-            else:
-                for col, tag in token.tags.items():
-                    if tag[:2] == "B-":
-                        beginning_tag_waiting.add(col)
+            for col, tag in token.tags.items():
+                if tag[:2] == "B-":
+                    beginning_tag_waiting.add(col)
 
 
-    return out
-
-
-def add_annotations(tokens, anno_col, specific_tag_conversion=None, include_anno_col=True, triggerfocus_col=None, sourcefocus_col=None):
+def iter_annotations(tokens, anno_col, specific_tag_conversion=None, include_anno_col=True, triggerfocus_col=None, sourcefocus_col=None):
     """
     Insert a special token in the token-list which marks the beginning
     or the end of an NER span.
+    Every token is finished before it is yielded, so the next modification may already work on it.
     """
     current_tag = "O"
     previous_tags = None
-    new_token_sequence = []
     for token in tokens:
+        new_tokens = []
         if anno_col in token.tags and token.tags[anno_col] != "O":
             prefix = token.tags[anno_col][:2]
             tag = token.tags[anno_col][2:]  # remove B- / I-
@@ -424,13 +472,13 @@ def add_annotations(tokens, anno_col, specific_tag_conversion=None, include_anno
         if (tag != current_tag or prefix == "B-") and tag != "O" and current_tag != "O":
             # marks ending of a span
             spec_current_tag = current_tag if specific_tag_conversion is None else specific_tag_conversion(current_tag)
-            new_token_sequence.append(
+            new_tokens.append(
                 Token(
                     "[E-" + spec_current_tag + "]",
-                    tags=previous_tags.copy()  # TODO: implement settings for BIOES system # type: ignore
+                    tags=previous_tags  # TODO: implement settings for BIOES system # type: ignore
                 )
             )
-            new_token_sequence.append(
+            new_tokens.append(
                 Token(
                     "[B-" + spec_tag + "]",
                     tags=token.tags.copy()
@@ -438,10 +486,9 @@ def add_annotations(tokens, anno_col, specific_tag_conversion=None, include_anno
             )
             for col in token.tags:
                 token.tags[col] = "I-" + token.tags[col][2:]
-            new_token_sequence.append(token)
         elif tag != current_tag and tag != "O":
             # marks beginning of a span
-            new_token_sequence.append(
+            new_tokens.append(
                 Token(
                     "[B-" + spec_tag + "]",
                     tags=token.tags.copy()
@@ -449,36 +496,33 @@ def add_annotations(tokens, anno_col, specific_tag_conversion=None, include_anno
             )
             for col in token.tags:
                 token.tags[col] = "I-" + token.tags[col][2:]
-            new_token_sequence.append(token)
         elif tag != current_tag and tag == "O":
             # marks ending of a span
-            new_token_sequence.append(
+            new_tokens.append(
                 Token(
                     "[E-" + spec_tag + "]",
-                    tags=previous_tags.copy()  # TODO: implement settings for BIOES system # type: ignore
+                    tags=previous_tags  # TODO: implement settings for BIOES system # type: ignore
                 )
             )
-            new_token_sequence.append(token)
-        else:
-            new_token_sequence.append(token)
+        new_tokens.append(token)
         current_tag = tag
-        previous_tags = token.tags
+        # the tags as they are now, the token may be changed by the next modification before we need them
+        previous_tags = token.tags.copy() if tag != "O" else None
+
+        for new_token in new_tokens:
+            if not include_anno_col and anno_col in new_token.tags:
+                del new_token.tags[anno_col]
+            yield new_token
 
     if current_tag != "O":
         # we need to finish the last tag
-        new_token_sequence.append(
-                Token(
-                    "[E-" + spec_tag + "]",
-                    tags=previous_tags.copy()  # TODO: implement settings for BIOES system # type: ignore
-                )
-            )
-
-    if not include_anno_col:
-        for token in new_token_sequence:
-            if anno_col in token.tags:
-                del token.tags[anno_col]
-
-    return new_token_sequence
+        last_token = Token(
+            "[E-" + spec_tag + "]",
+            tags=previous_tags  # TODO: implement settings for BIOES system # type: ignore
+        )
+        if not include_anno_col and anno_col in last_token.tags:
+            del last_token.tags[anno_col]
+        yield last_token
 
 
 def upper_case_tags(tag):
@@ -491,7 +535,11 @@ def upper_case_tags(tag):
     else:
         return tag.upper()
     
+@functools.lru_cache(maxsize=None)
 def upper_case_entity_values(tag):
+    """
+    Cached, the same few tags are converted for every marker token.
+    """
     if tag == "O":
         return tag
     if tag == "head":
@@ -514,68 +562,144 @@ def upper_case_entity_values(tag):
     return out.upper()
 
 
-def mod_only_beginning_tags(tokens, command):
+def iter_only_beginning_tags(tokens, column):
     """
     Remove all tags which are not Beginnings (B-).
     We use this when we only want to categorize pretags.
     """
-    column = command.split("_")[-1]
     for token in tokens:
         if column in token.tags and token.tags[column] != "O":
             prefix = token.tags[column][:2]
-            tag = token.tags[column][2:]
             if prefix != "B-":
                 token.tags[column] = "O"
-    return tokens
+        yield token
 
 
-def mod_add_parent_tag(span_obj):
+def iter_parent_tag(span_obj, tokens):
+    """
+    Encloses the tokens with the tag of the span, e.g. [REF] ... [REF].
+    """
     tag = "[" + upper_case_tags(span_obj.tag) + "]"
     token = Token(
         text=tag,
         tags={}
     )
-    span_obj.tokens.insert(0, token)
-    span_obj.tokens.append(token)
-    return span_obj.tokens
+    yield token
+    yield from tokens
+    yield token
 
 
-def process_document(infile, config) -> str:
-    spans = extract_spans(infile)
+def annotation_modification(span_obj, tokens, anno_col, **kwargs):
+    return iter_annotations(tokens, anno_col, specific_tag_conversion=upper_case_entity_values, **kwargs)
+
+
+def only_beginning_modification(span_obj, tokens, column):
+    return iter_only_beginning_tags(tokens, column)
+
+
+# Each span modification takes the span and an iterable of its tokens and returns an iterator over the modified tokens.
+SPAN_MODIFICATIONS = {
+    "add_parent_tag": iter_parent_tag,
+    "add_annotation_ner": functools.partial(annotation_modification, anno_col="ner"),
+    "add_annotation_ner_only_head": functools.partial(annotation_modification, anno_col="ner_only_head"),
+    "add_annotation_ner_only_head_triggerfocus": functools.partial(annotation_modification, anno_col="ner_only_head", triggerfocus_col="evts"),
+    "add_annotation_ner_triggerfocus": functools.partial(annotation_modification, anno_col="ner", triggerfocus_col="evts"),
+    "add_annotation_ner_sourcefocus": functools.partial(annotation_modification, anno_col="ner", sourcefocus_col="evts"),
+    "add_annotation_sbevts_sourcefocus": functools.partial(annotation_modification, anno_col="evts", sourcefocus_col="sbevts"),
+    "shorten_annotations_to_head": lambda span_obj, tokens: iter_shortened_to_heads(tokens),
+}
+# Modifications with a parameter in their name, the prefix gets the name and returns the modification.
+SPAN_MODIFICATION_PREFIXES = {
+    # the column is the last part of the name, e.g. only_beginning_tags_evts
+    "only_beginning_tags_": lambda name: functools.partial(only_beginning_modification, column=name.split("_")[-1]),
+}
+
+
+class SpanModifications(object):
+    """
+    The span modifications of a config, resolved once.
+    The modifications are chained generators, so a sample passes all of them in a single pass over its tokens.
+    """
+    __slots__ = ("names", "stages")
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.stages = []
+        for name in self.names:
+            if name in SPAN_MODIFICATIONS:
+                self.stages.append(SPAN_MODIFICATIONS[name])
+                continue
+            for prefix, create in SPAN_MODIFICATION_PREFIXES.items():
+                if name.startswith(prefix):
+                    self.stages.append(create(name))
+                    break
+            else:
+                raise ConfigError(f"config.include_tags.span_modifications: unknown span modification {name!r}")
+
+    def apply(self, span_obj, tokens):
+        if not self.stages:
+            return tokens
+        for stage in self.stages:
+            tokens = stage(span_obj, tokens)
+        return list(tokens)
+
+
+def compile_span_modifications(modifications):
+    if isinstance(modifications, SpanModifications):
+        return modifications
+    return SpanModifications(modifications)
+
+
+def process_document(infile, config):
+    """
+    Yields the samples of the document, each as a list of CoNLL-U rows.
+    The samples are rendered one at a time, when they are requested (see write_samples).
+    """
+    return process_spans(extract_spans(infile), config)
+
+
+def process_spans(spans, config):
+    """
+    Same as process_document for already extracted spans, which are not changed
+    (e.g. to create the samples of several configs from one extraction, see export_engine).
+    """
+    config = compile_evts_config(config)
+    modifications = compile_span_modifications(config.span_modifications)
     spans = filter_spans(spans, config)
-    out = []
     for span in sorted(spans, key=lambda x: (int(x.start), -int(x.end)) if x.xml_obj is not None else (0, 9999)):
-        outstring = span.create_conllu(config["include_tags"], config["include_tags"]["span_modifications"])
-        out.append(outstring)
-    return "\n".join(out)
-
-
-def convert_span_modifications(input):
-    for i in input:
-        if i == "add_parent_tag":
-            yield lambda y, x: mod_add_parent_tag(y)
-        elif i == "add_annotation_ner":
-            yield lambda y, x: add_annotations(x, "ner", specific_tag_conversion=lambda x: upper_case_entity_values(x))
-        elif i == "add_annotation_ner_only_head":
-            yield lambda y, x: add_annotations(x, "ner_only_head", specific_tag_conversion=lambda x: upper_case_entity_values(x))
-        elif i == "add_annotation_ner_only_head_triggerfocus":
-            yield lambda y, x: add_annotations(x, "ner_only_head", specific_tag_conversion=lambda x: upper_case_entity_values(x), triggerfocus_col="evts")
-        elif i == "add_annotation_ner_triggerfocus":
-            yield lambda y, x: add_annotations(x, "ner", specific_tag_conversion=lambda x: upper_case_entity_values(x), triggerfocus_col="evts")
-        elif i == "add_annotation_ner_sourcefocus":
-            yield lambda y, x: add_annotations(x, "ner", specific_tag_conversion=lambda x: upper_case_entity_values(x), sourcefocus_col="evts")
-        elif i == "add_annotation_sbevts_sourcefocus":
-            yield lambda y, x: add_annotations(x, "evts", specific_tag_conversion=lambda x: upper_case_entity_values(x), sourcefocus_col="sbevts")
-        elif i.startswith("only_beginning_tags_"):
-            yield lambda y, x: mod_only_beginning_tags(x, i)
-        elif i == "shorten_annotations_to_head":
-            yield lambda y, x: shorten_annotations_to_heads(y)
+        yield span.create_rows(config, modifications)
+
+
+def iter_sample_lines(samples, comment=None):
+    """
+    Yields the lines of the samples (lists of rows), separated by an empty line and followed by one.
+    The comment line (e.g. the filename, flair ignores these in ColumnCorpus) is only yielded
+    if the document has any output.
+    """
+    started = False
+    for i, rows in enumerate(samples):
+        if not started and (i > 0 or rows):
+            if comment is not None:
+                yield f"# {comment}\n"
+            started = True
+        if i > 0:
+            yield "\n"
+        yield from rows
+    if started:
+        yield "\n"
+
+
+def write_samples(outfile, samples, comment=None):
+    """
+    Writes the samples to outfile while they are rendered, see iter_sample_lines.
+    """
+    outfile.writelines(iter_sample_lines(samples, comment))
 
 
 if __name__ == "__main__":
     import json
     import glob
-    config = json.load(open("./data/transformation_configs/ner_nested/ner_nested_plus_roles.json", mode="r", encoding="utf8"))
+    config = compile_evts_config(json.load(open("./data/transformation_configs/ner_nested/ner_nested_plus_roles.json", mode="r", encoding="utf8")))
 
     infiles = glob.glob("./data/std_xml/test/*.xml")
     for infile in infiles:
@@ -583,5 +707,5 @@ if __name__ == "__main__":
         spans = extract_spans(infile)
         spans = filter_spans(spans, config)
         for span in sorted(spans, key=lambda x: (int(x.start), -int(x.end)) if x.xml_obj is not None else (0, 9999)):
-            outstring = span.create_conllu(config["include_tags"], config["include_tags"]["span_modifications"])
+            outstring = span.create_conllu(config, config.span_modifications)
             print(outstring)
\ No newline at end of file
@@ -9,6 +9,12 @@ For a future TEI conversion script we can largely use the same script with some
 import os
 import re
 from lxml import etree as et
+try:
+    from . import text_encoding
+    from .corrections import fix_att_full_coverage_on_export
+except ImportError:
+    import text_encoding
+    from corrections import fix_att_full_coverage_on_export
 
 XML_VALIDATION_LINK = "https://dhbern.github.io/BeNASch/static/benasch.rng"
 # Put in this list all nodes by xpath syntax to be converted (from root)
@@ -24,28 +30,6 @@ ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
 ATTRIBUTES_TO_EXCLUDE = ["head_text", "text", "start", "end", "head_start", "head_end"]
 
 
-def fix_att_full_coverage(root):
-    """
-    If a att.xy covers exactly the same span as a reference in the same place,
-    there must be an error, as at least one of the two has a head missing.
-    Most likely, the att.xy should have been a desc.xy, but changing it now is too late,
-    so just drop a warning, remove the Attribute that is problematic and move on.
-    Also give the head positions to the reference.
-    NOTE: Kind of depreciated as validation is done separately now?
-    """
-    ref_spans = root.findall("./Mentions/Reference")
-    att_spans = root.findall("./Mentions/Attribute")
-    for ref in ref_spans:
-        for att in att_spans:
-            if ref.get("start") == att.get("start") and ref.get("end") == att.get("end"):
-                print("ERROR: A reference and an attribute cover each other fully, meaning a head is missing. Attribute will be deleted and Reference fixed, please investigate.")
-                print(att.get("head_text"))
-                ref.set("head_start", att.get("head_start"))
-                ref.set("head_end", att.get("head_end"))
-                att.getparent().remove(att)
-    return root
-
-
 def add_attributes(elem, node):
     if "_ALL_" in ATTRIBUTES_TO_INCLUDE:
         for att, value in node.attrib.items():
@@ -78,33 +62,16 @@ def sort_function(elem):
     return (node_length, get_node_priority(elem))
 
 
-def process_document(docpath):
-    oldroot = et.parse(docpath).getroot()
-    tokens = oldroot.findall(".//T")
+def has_head(node):
+    return "head_start" in node.attrib and node.get("head_start")
 
-    # only for a debug thing, delete after!
-    head_elems = oldroot.findall(".//Reference[@entity_type='head']")
-    for elem in head_elems:
-        del elem
-
-    # Fix the attribute instead of desc error
-    oldroot = fix_att_full_coverage(oldroot)
-
-    # sort all valid elements by their position, then priority (1. end index, 2. start index, 3. tag)
-    nodes = []
-    for c in TO_CONVERT:
-        no = oldroot.findall(c)
-        nodes.extend(no)
 
-    toproot = et.Element("XML")
-    metadata = oldroot.find("Metadata")
-    if metadata is not None:
-        metadata.tag = "Header"
-        toproot.append(metadata)
-
-    root = et.SubElement(toproot, "Body")
-
-    nodes = sorted(nodes, key=lambda x: sort_function(x))
+def build_inline_legacy(root, tokens, nodes, add_attributes=add_attributes, has_head=has_head):
+    """
+    Builds the inline tree below root, shortest nodes first. Every node climbs up from each of its tokens,
+    which makes this O(nodes * tokens), but it also handles invalid annotations (e.g. crossing spans).
+    nodes must already be sorted by sort_function.
+    """
     for token in tokens:
         root.append(token)
 
@@ -115,7 +82,7 @@ def process_document(docpath):
         for token in incl_tokens:
             child = token
             parent = child.getparent()
-            while parent.tag != "Body" and parent != elem:
+            while parent.tag != root.tag and parent != elem:
                 child = parent
                 parent = child.getparent()
             if parent != elem:
@@ -123,7 +90,7 @@ def process_document(docpath):
                 elem.append(child)
         
         # if element contains a head, we need to append that
-        if "head_start" in node.attrib and node.get("head_start"):
+        if has_head(node):
             incl_tokens = tokens[int(node.get("head_start")):int(node.get("head_end"))]
             head_elem = et.SubElement(elem, "Head")
             # print(et.tostring(elem))
@@ -137,6 +104,123 @@ def process_document(docpath):
                 print("A Head element could not be inserted at the right position in the XML tree. This probably indicates an invalid annotation.")
                 print(et.tostring(elem)) 
 
+
+def build_inline_stack(root, tokens, nodes, add_attributes=add_attributes, has_head=has_head):
+    """
+    Builds the same tree as build_inline_legacy with a single sweep over the tokens.
+    The nodes are sorted by (start, -end) and kept on a stack while they are open, nodes with the same span
+    are nested in the order of build_inline_legacy (the node processed later becomes the outer one).
+    Returns False without printing anything if the annotations are not properly nested
+    (crossing spans or heads which are not direct children of their node), then the tree is unfinished
+    and build_inline_legacy has to be used.
+    nodes must already be sorted by sort_function.
+    """
+    spans = []
+    empty = []
+    for i, node in enumerate(nodes):
+        start, end = int(node.get("start")), int(node.get("end"))
+        if start < 0 or end > len(tokens):
+            return False
+        if start >= end:
+            # nodes without tokens end up behind all tokens
+            empty.append((i, node))
+        else:
+            spans.append((start, end, i, node))
+    spans.sort(key=lambda x: (x[0], -x[1], -x[2]))
+
+    # check for crossing spans before anything is built
+    open_ends = []
+    for start, end, _, _ in spans:
+        while open_ends and open_ends[-1] <= start:
+            open_ends.pop()
+        if open_ends and end > open_ends[-1]:
+            return False
+        open_ends.append(end)
+
+    elems = {}
+    stack = []
+    next_span = 0
+    for i, token in enumerate(tokens):
+        while stack and stack[-1][1] <= i:
+            stack.pop()
+        while next_span < len(spans) and spans[next_span][0] == i:
+            _, end, j, node = spans[next_span]
+            elem = et.SubElement(stack[-1][0] if stack else root, node.tag)
+            add_attributes(elem, node)
+            elems[j] = elem
+            stack.append((elem, end))
+            next_span += 1
+        (stack[-1][0] if stack else root).append(token)
+
+    for j, node in empty:
+        elem = et.SubElement(root, node.tag)
+        add_attributes(elem, node)
+        elems[j] = elem
+
+    # heads can only be placed if all their tokens are direct children of the node
+    heads = []
+    for j, node in enumerate(nodes):
+        if not has_head(node):
+            continue
+        head_tokens = tokens[int(node.get("head_start")):int(node.get("head_end"))]
+        if not head_tokens or any(token.getparent() != elems[j] for token in head_tokens):
+            return False
+        heads.append(head_tokens)
+    for head_tokens in heads:
+        head_elem = et.Element("Head")
+        head_tokens[0].addprevious(head_elem)
+        for token in head_tokens:
+            head_elem.append(token)
+    return True
+
+
+def build_inline(root, tokens, nodes, add_attributes=add_attributes, has_head=has_head):
+    """
+    Puts the tokens below root and nests the nodes (Mentions, Descriptors, Values ...) around them, including their heads.
+    Uses the fast stack-based builder and only falls back to the legacy builder for invalid annotations.
+    """
+    nodes = sorted(nodes, key=lambda x: sort_function(x))
+    if not build_inline_stack(root, tokens, nodes, add_attributes, has_head):
+        root.clear()
+        build_inline_legacy(root, tokens, nodes, add_attributes, has_head)
+
+
+def process_document(docpath):
+    return process_root(text_encoding.parse(docpath))
+
+
+def process_root(oldroot):
+    """
+    Same as process_document for an already parsed Standard XML document.
+    NOTE: oldroot is modified (the tokens are moved to the inline tree), pass a copy if you still need it.
+    A document in the compact encoding (see text_encoding.load) gets its <T> elements first.
+    """
+    text_encoding.expand_text(oldroot)
+    tokens = oldroot.findall(".//T")
+
+    # only for a debug thing, delete after!
+    head_elems = oldroot.findall(".//Reference[@entity_type='head']")
+    for elem in head_elems:
+        del elem
+
+    # Fix the attribute instead of desc error (done by the postprocessing, only for legacy documents)
+    fix_att_full_coverage_on_export(oldroot)
+
+    # sort all valid elements by their position, then priority (1. end index, 2. start index, 3. tag)
+    nodes = []
+    for c in TO_CONVERT:
+        no = oldroot.findall(c)
+        nodes.extend(no)
+
+    toproot = et.Element("XML")
+    metadata = oldroot.find("Metadata")
+    if metadata is not None:
+        metadata.tag = "Header"
+        toproot.append(metadata)
+
+    root = et.SubElement(toproot, "Body")
+    build_inline(root, tokens, nodes)
+
     # print(et.tostring(root, pretty_print=True))
 
     pi = et.ProcessingInstruction('xml-model', f'href="{XML_VALIDATION_LINK}" type="application/xml" schematypens="http://relaxng.org/ns/structure/1.0"') 
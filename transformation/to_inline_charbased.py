@@ -10,9 +10,13 @@ Mind you other scripts such as to_iob will expect the output from the newer scri
 For a future TEI conversion script we can largely use the same script with some simple tag conversion added on.
 """
 
-import os
-import re
 from lxml import etree as et
+try:
+    from . import text_encoding
+    from .corrections import fix_att_full_coverage_on_export
+except ImportError:
+    import text_encoding
+    from corrections import fix_att_full_coverage_on_export
 
 # Put in this list all nodes by xpath syntax to be converted (from root)
 # a node must contain a start and end attribute to be valid for conversion
@@ -26,26 +30,8 @@ ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
 # if including all attributes, those in here will be excluded
 ATTRIBUTES_TO_EXCLUDE = ["head_text", "text", "start", "end", "head_start", "head_end"]
 
-
-def fix_att_full_coverage(root):
-    """
-    If a att.xy covers exactly the same span as a reference in the same place,
-    there must be an error, as at least one of the two has a head missing.
-    Most likely, the att.xy should have been a desc.xy, but changing it now is too late,
-    so just drop a warning, remove the Attribute that is problematic and move on.
-    Also give the head positions to the reference.
-    """
-    ref_spans = root.findall("./Mentions/Reference")
-    att_spans = root.findall("./Mentions/Attribute")
-    for ref in ref_spans:
-        for att in att_spans:
-            if ref.get("start") == att.get("start") and ref.get("end") == att.get("end"):
-                print("ERROR: A reference and an attribute cover each other fully, meaning a head is missing. Attribute will be deleted and Reference fixed, please investigate.")
-                print(att.get("head_text"))
-                ref.set("head_start", att.get("head_start"))
-                ref.set("head_end", att.get("head_end"))
-                att.getparent().remove(att)
-    return root
+# written between two units of text (tokens), "" if the units are characters
+TOKEN_SEPARATOR = " "
 
 
 def get_node_priority(node, is_head):
@@ -55,44 +41,31 @@ def get_node_priority(node, is_head):
         return -1
     else:
         return 0
-    
 
-def get_attribute_string(node):
+
+def add_attributes(elem, node):
     if "_ALL_" in ATTRIBUTES_TO_INCLUDE:
-        attributes = node.attrib
-        for att in ATTRIBUTES_TO_EXCLUDE:
-            if att in attributes:
-                del attributes[att]
-        attributes = [f'{att}="{value}"' for att, value in attributes.items()]
+        for att, value in node.attrib.items():
+            if att in ATTRIBUTES_TO_EXCLUDE:
+                continue
+            elem.set(att, value)
     elif not ATTRIBUTES_TO_INCLUDE:
-        return ""
+        return
     else:
-        attributes = []
         for att in ATTRIBUTES_TO_INCLUDE:
             value = node.get(att)
             if value != None:
-                attributes.append(f'{att}="{value}"')
-
-    if not attributes:
-        return ""
+                elem.set(att, value)
 
-    return " " + " ".join(attributes)
 
-    
-def convert_tag(node, position, is_head):
-    if is_head:
-        if position == "head_end":
-            newstring = "</Head>"
-        else:
-            newstring = "<Head>"
-        return newstring
-
-    if position == "end":
-        newstring = "</" + node.tag + ">"
+def append_text(elem, text):
+    """
+    Adds text after everything that is already in elem.
+    """
+    if len(elem):
+        elem[-1].tail = (elem[-1].tail or "") + text
     else:
-        newstring = "<" + node.tag + get_attribute_string(node) + ">"
-
-    return newstring
+        elem.text = (elem.text or "") + text
 
 
 def write_document(docpath, node):
@@ -100,72 +73,77 @@ def write_document(docpath, node):
     tree.write(docpath, xml_declaration=True, pretty_print=True, encoding="utf8")
 
 
-def sort_function(elem):
-    node, pos, is_head = elem
-    if is_head:
-        start = "head_start"
-        end = "head_end"
-    else:
-        start = "start"
-        end = "end"
+def get_spans(nodes, text_length):
+    """
+    Returns (start, end, priority, index, node, is_head) for all nodes and their heads, in the order they are opened:
+    by start, longer spans first, at the same span the higher priority is outside, then the later node (as in to_inline).
+    """
+    spans = []
+    for index, n in enumerate(nodes):
+        if n.get("head_start"):
+            candidates = [(int(n.get("start")), int(n.get("end")), False), (int(n.get("head_start")), int(n.get("head_end")), True)]
+        else:
+            candidates = [(int(n.get("start")), int(n.get("end")), False)]
+        for start, end, is_head in candidates:
+            if end > text_length:
+                print("WARNING: Tag index was outside text length. This can happen when a header was annotated and removed.")
+                continue
+            spans.append((start, end, get_node_priority(n, is_head), index, n, is_head))
+    return sorted(spans, key=lambda s: (s[0], -s[1], -s[2], -s[3]))
 
-    if pos == "end":
-        return (-int(node.get(end)), int(node.get(start)), -get_node_priority(node, is_head))
-    else:
-        return (-int(node.get(start)), int(node.get(end)), get_node_priority(node, is_head))
+
+def build_text(units, spans, separator=TOKEN_SEPARATOR):
+    """
+    Merges the sorted spans with the text units in one pass, the elements are created directly with lxml.
+    At every position the elements ending there are closed first, then the separator is written,
+    then the elements starting there are opened and finally the unit itself is added.
+    Spans which cross each other cannot be nested, the inner one is closed early (with a warning).
+    """
+    textnode = et.Element("Text")
+    stack = [(textnode, len(units))]  # (element, end)
+    j = 0
+    for i in range(len(units) + 1):
+        while len(stack) > 1 and any(end <= i for _, end in stack[1:]):
+            elem, end = stack.pop()
+            if end > i:
+                print(f"WARNING: The <{elem.tag}> element ending at {end} crosses its parent, closing it at {i}.")
+
+        if 0 < i < len(units) and separator:
+            append_text(stack[-1][0], separator)
+
+        while j < len(spans) and spans[j][0] == i:
+            _, end, _, _, node, is_head = spans[j]
+            if is_head:
+                elem = et.SubElement(stack[-1][0], "Head")
+            else:
+                elem = et.SubElement(stack[-1][0], node.tag)
+                add_attributes(elem, node)
+            if end > i:
+                stack.append((elem, end))
+            j += 1
+
+        # after the last unit only the (empty) spans at the end of the text are left to open
+        if i < len(units):
+            append_text(stack[-1][0], units[i])
+
+    return textnode
 
 
 def process_document(docpath):
-    oldroot = et.parse(docpath).getroot()
-    # oldtext = oldroot.find("Text").text # DELETE
-    oldtokens = oldroot.findall(".//T")
+    oldroot = text_encoding.parse(docpath)
+    # to work character based, use the characters of the text here and set TOKEN_SEPARATOR to ""
+    units = [t.text or "" for t in oldroot.findall(".//T")]
 
-    # Fix the attribute instead of desc error
-    oldroot = fix_att_full_coverage(oldroot)
+    # Fix the attribute instead of desc error (done by the postprocessing, only for legacy documents)
+    fix_att_full_coverage_on_export(oldroot)
 
-    # sort all valid elements by their position, then priority (1. end index, 2. start index, 3. tag)
     nodes = []
     for c in TO_CONVERT:
-        no = oldroot.findall(c)
-        for n in no:
-            # add two elements, one for opening the bracket, one for closing it
-            nodes.append((n, "start", False))
-            nodes.append((n, "end", False))
-
-            # if there's heads, we also need to add those
-            if "head_start" in n.attrib:
-                nodes.append((n, "start", True))
-                nodes.append((n, "end", True))
-
-    nodes = sorted(nodes, key=lambda x: sort_function(x))
-    #for n in nodes:
-    #    print(n[0].get("head_text"), n[1])
-
-    for node, position, is_head in nodes:
-        #print(node, position, is_head)
-        if is_head:
-            position = "head_" + position
-        index = int(node.get(position))
-        if index > len(oldtokens):
-            print("WARNING: Tag index was outside text length. This can happen when a header was annotated and removed.")
-            continue
-        oldtokens = oldtokens[:index] + [convert_tag(node, position, is_head)] + oldtokens[index:]
-
-    oldtokens = ["<Text>"] + oldtokens + ["</Text>"]
-    oldtext = "".join(oldtokens)
-
-    oldtext = oldtext.replace("&", "&amp;")
-
-    try:
-        textnode = et.fromstring(oldtext)
-    except et.XMLSyntaxError as e:
-        print(e)
-        print(oldtext.encode("utf8"))
-        textnode = et.fromstring(oldtext, parser=et.XMLParser(recover=True))
+        nodes.extend(oldroot.findall(c))
 
-    return textnode
+    return build_text(units, get_spans(nodes, len(units)))
 
 
 if __name__ == "__main__":
     textnode = process_document("../outfiles/admin_test_inc.xml")
-    write_document("text.xml", textnode)
\ No newline at end of file
+    write_document("text.xml", textnode)
@@ -6,9 +6,21 @@ From this format, it should be particularly easy to further transform the format
 For a future TEI conversion script we can largely use the same script with some simple tag conversion added on.
 """
 
-import os
+import argparse
+import functools
 import re
+import time
 from lxml import etree as et
+try:
+    from . import text_encoding
+    from .corrections import fix_att_full_coverage_on_export
+    from .parallel import imap_ordered
+    from .to_inline import build_inline
+except ImportError:
+    import text_encoding
+    from corrections import fix_att_full_coverage_on_export
+    from parallel import imap_ordered
+    from to_inline import build_inline
 
 XML_VALIDATION_LINK = "https://dhbern.github.io/BeNASch/static/benasch.rng"
 # Put in this list all nodes by xpath syntax to be converted (from root)
@@ -23,30 +35,12 @@ ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
 # if including all attributes, those in here will be excluded anyways
 ATTRIBUTES_TO_EXCLUDE = ["head_text", "text", "start", "end", "head_start", "head_end"]
 
-
-def fix_att_full_coverage(root):
-    """
-    If a att.xy covers exactly the same span as a reference in the same place,
-    there must be an error, as at least one of the two has a head missing.
-    Most likely, the att.xy should have been a desc.xy, but changing it now is too late,
-    so just drop a warning, remove the Attribute that is problematic and move on.
-    Also give the head positions to the reference.
-    NOTE: Kind of depreciated as validation is done separately now?
-    """
-    ref_spans = root.findall("./Mentions/Reference")
-    att_spans = root.findall("./Mentions/Attribute")
-    for ref in ref_spans:
-        for att in att_spans:
-            if ref.get("start") == att.get("start") and ref.get("end") == att.get("end"):
-                print("ERROR: A reference and an attribute cover each other fully, meaning a head is missing. Attribute will be deleted and Reference fixed, please investigate.")
-                print(att.get("head_text"))
-                ref.set("head_start", att.get("head_start"))
-                ref.set("head_end", att.get("head_end"))
-                try:
-                    att.getparent().remove(att)
-                except:
-                    pass
-    return root
+# Settings for converting a whole corpus file (see convert_corpus)
+INFILE = "./hgb_corpus_std_24_07_26_full.xml"
+OUTFILE = "./hgb_corpus_24_07_26_inline_full.xml"
+WORKERS = 1  # number of worker processes, 1 converts in the main process
+WINDOW = 64  # max. number of documents per worker which are converted but not yet written
+PROGRESS_EVERY = 1000  # print the progress every n documents
 
 
 def add_attributes(elem, node):
@@ -69,20 +63,13 @@ def write_document(docpath, node):
     tree.write(docpath, xml_declaration=True, pretty_print=True, encoding="utf8")
 
 
-def get_node_priority(node):
-    if node.tag == "Descriptor":
-        return 1
-    else:
-        return 0
-
-
-def sort_function(elem):
-    node_length = int(elem.get("end")) - int(elem.get("start"))
-    return (node_length, get_node_priority(elem))
+def has_head(node):
+    return "head_start" in node.attrib and node.get("head_start") and node.get("no_head_found") is None
 
 
 def process_document(oldroot, remove_token_tags=False):
     #oldroot = et.parse(docpath).getroot()
+    oldroot = text_encoding.expand_text(oldroot)
     tokens = oldroot.findall(".//T")
 
     # only for a debug thing, delete after!
@@ -90,8 +77,8 @@ def process_document(oldroot, remove_token_tags=False):
     #for elem in head_elems:
     #    del elem
 
-    # Fix the attribute instead of desc error
-    oldroot = fix_att_full_coverage(oldroot)
+    # Fix the attribute instead of desc error (done by the postprocessing, only for legacy documents)
+    fix_att_full_coverage_on_export(oldroot)
 
     # sort all valid elements by their position, then priority (1. end index, 2. start index, 3. tag)
     nodes = []
@@ -106,39 +93,7 @@ def process_document(oldroot, remove_token_tags=False):
         toproot.append(metadata)
 
     root = et.SubElement(toproot, "Body")
-
-    nodes = sorted(nodes, key=lambda x: sort_function(x))
-    for token in tokens:
-        root.append(token)
-
-    for node in nodes:
-        incl_tokens = tokens[int(node.get("start")):int(node.get("end"))]
-        elem = et.SubElement(root, node.tag)
-        add_attributes(elem, node)
-        for token in incl_tokens:
-            child = token
-            parent = child.getparent()
-            while parent.tag != "Body" and parent != elem:
-                child = parent
-                parent = child.getparent()
-            if parent != elem:
-                root.insert(root.index(child), elem)
-                elem.append(child)
-        
-        # if element contains a head, we need to append that
-        if "head_start" in node.attrib and node.get("head_start") and node.get("no_head_found") is None:
-            incl_tokens = tokens[int(node.get("head_start")):int(node.get("head_end"))]
-            head_elem = et.SubElement(elem, "Head")
-            # print(et.tostring(elem))
-            # print(et.tostring(incl_tokens[0]))
-            try:
-                elem.insert(elem.index(incl_tokens[0]), head_elem)
-                for token in incl_tokens:
-                    head_elem.append(token)
-            except ValueError as er:
-                print(er)
-                print("A Head element could not be inserted at the right position in the XML tree. This probably indicates an invalid annotation.")
-                print(et.tostring(elem)) 
+    build_inline(root, tokens, nodes, add_attributes, has_head)
 
     # print(et.tostring(root, pretty_print=True))
 
@@ -155,24 +110,79 @@ def process_document(oldroot, remove_token_tags=False):
     return toproot
 
 
-if __name__ == "__main__":
-    #textnode = process_document("../outfolder_24_02_22/bhitz_HGB_Exp_3_001_HGB_1_002_037_012.xml")
-    #write_document("text.xml", textnode)
+def iter_documents(infile):
+    """
+    Yields the <Document> elements of a corpus file one after another.
+    Every document is cleared (together with everything before it) as soon as the caller is done with it,
+    so the memory use does not grow with the size of the corpus.
+    """
+    for _, element in et.iterparse(infile, events=("end",), tag="Document"):
+        yield element
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def convert_element(element, remove_token_tags=True):
+    """
+    Converts one <Document> and returns the serialized inline document.
+    """
+    inline = process_document(element, remove_token_tags=remove_token_tags)
+    return et.tostring(inline, encoding="UTF-8", pretty_print=True).decode("utf8")
+
+
+def convert_chunk(chunk, remove_token_tags=True):
+    """
+    Same as convert_element for a serialized <Document> (run in the worker processes).
+    """
+    return convert_element(et.fromstring(chunk), remove_token_tags=remove_token_tags)
+
 
-    import glob
-    import os
+def convert_corpus(infile, outfile, workers=WORKERS, window=WINDOW, remove_token_tags=True, progress_every=PROGRESS_EVERY):
+    """
+    Converts all documents of a Standard XML corpus file into one inline corpus file.
+    The documents are read one by one. With more than one worker they are converted by a process pool,
+    at most window * workers documents are in flight at any time (see parallel.imap_ordered).
+    The output keeps the order of the input.
+    """
+    start_time = time.time()
+    done = 0
+
+    def report():
+        if progress_every and done % progress_every == 0:
+            print(f"Finished {done} samples ({done / max(time.time() - start_time, 1e-9):.1f} docs/s).")
 
-    outfile = "./hgb_corpus_24_07_26_inline_full.xml"
-    in_root = et.iterparse("./hgb_corpus_std_24_07_26_full.xml")
-    i = 0
     with open(outfile, mode="w", encoding="utf8") as outf:
         outf.write("<?xml version='1.0' encoding='UTF-8'?>\n")
         outf.write("<Corpus>\n")
-        for action, element in in_root:
-            if element.tag == "Document":
-                inline = process_document(element, remove_token_tags=True)
-                outf.write(et.tostring(inline, encoding="UTF-8", pretty_print=True).decode("utf8"))
-                if i % 1000 == 0:
-                    print(f"Finished {i} samples.")
-                i += 1
+        if workers <= 1:
+            # the document is converted before iter_documents clears it
+            convert, documents = functools.partial(convert_element, remove_token_tags=remove_token_tags), iter_documents(infile)
+        else:
+            convert, documents = functools.partial(convert_chunk, remove_token_tags=remove_token_tags), (et.tostring(element) for element in iter_documents(infile))
+        for inline in imap_ordered(convert, documents, workers, window):
+            outf.write(inline)
+            done += 1
+            report()
         outf.write("</Corpus>\n")
+    print(f"Converted {done} documents in {time.time() - start_time:.1f}s.")
+    return done
+
+
+if __name__ == "__main__":
+    #textnode = process_document("../outfolder_24_02_22/bhitz_HGB_Exp_3_001_HGB_1_002_037_012.xml")
+    #write_document("text.xml", textnode)
+
+    parser = argparse.ArgumentParser(description="Convert a Standard XML corpus file to an inline XML corpus file.")
+    parser.add_argument("infile", nargs="?", default=INFILE)
+    parser.add_argument("outfile", nargs="?", default=OUTFILE)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of worker processes, 1 to convert in the main process")
+    parser.add_argument("--window", type=int, default=WINDOW, help="max. number of unwritten documents per worker")
+    parser.add_argument("--progress-every", type=int, default=PROGRESS_EVERY)
+    parser.add_argument("--keep-token-tags", action="store_true")
+    args = parser.parse_args()
+
+    convert_corpus(args.infile, args.outfile, workers=args.workers, window=args.window,
+                   remove_token_tags=not args.keep_token_tags, progress_every=args.progress_every)
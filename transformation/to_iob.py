@@ -12,8 +12,14 @@ Concrete examples that should be possible to be created:
 By default, this script ignores Lists when determining tag depth. To change this behaviour set the option ignore_lists = False in the orders.
 """
 
+import copy
 import csv
-import to_inline
+try:
+    from . import iob_encoder, text_encoding, to_inline
+    from .config_compiler import compile_iob_orders
+except ImportError:
+    import iob_encoder, text_encoding, to_inline
+    from config_compiler import compile_iob_orders
 from lxml import etree as et
 
 # Nodes without heads cannot contain other elements or they won't be processed properly!
@@ -34,6 +40,18 @@ def write_outfile(docpath, token_list, annotation_cols):
                 row.append(col[i])
             annotation_rows.append(row)
         writer.writerows(annotation_rows)
+
+
+def write_training_document(writer, name, token_list, annotation_cols):
+    """
+    Writes one document of the IOB training data to a tab separated csv writer:
+    the name as a comment (flair ignores these in ColumnCorpus), one row per token
+    with the annotation columns in reverse order, and an empty row at the end.
+    """
+    writer.writerow([f"# {name}"])
+    for token, labels in zip(token_list, zip(*annotation_cols[::-1])):
+        writer.writerow([token] + list(labels))
+    writer.writerow([])
         
 
 
@@ -79,7 +97,7 @@ def get_ancestors(node):
     """
     ancestors = []
     parent = node.getparent()
-    while parent.tag != "Text":
+    while parent.tag != "Body":
         if parent.tag != "Head":
             ancestors.append(parent)
         parent = parent.getparent()
@@ -106,9 +124,28 @@ def check_if_first(node, ancestor, is_head=False):
 
 
 def process_document(docpath, orders):
-    # first transform it to inline xml so we have an easy to process hierarchy
-    texttree = to_inline.process_document(docpath)
+    return process_root(text_encoding.load(docpath), orders)
+
 
+def process_root(root, orders):
+    """
+    Same as process_document for an already parsed Standard XML document, the document is not modified.
+    The annotations are encoded directly from the token offsets (see iob_encoder),
+    only documents which are not properly nested go the way over the inline tree.
+    """
+    orders = compile_iob_orders(orders)
+    encoded = iob_encoder.encode(root, orders)
+    if encoded is not None:
+        return encoded
+    # transform it to inline xml so we have an easy to process hierarchy
+    return process_inline(to_inline.process_root(copy.deepcopy(root)), orders)
+
+
+def process_inline(texttree, orders):
+    """
+    Same as process_document for an already created inline tree.
+    NOTE: The inline tree is modified (see tokenize_tree).
+    """
     #print(et.tostring(texttree))
     tokenize_tree(texttree)
     #print(et.tostring(texttree))
@@ -120,26 +157,7 @@ def process_document(docpath, orders):
 
     annotation_cols = []
 
-    for order in orders:
-        mode, depth, ordered_tags = order["mode"], order["depth"], order["tags"]
-        if "filter" in order:
-            filter = order["filter"]
-        else:
-            filter = {}
-        if "filter_strict" in order:
-            filter_strict = order["filter_strict"]
-        else:
-            filter_strict = {}
-        if "ignore_lists" in order and not order["ignore_lists"]:
-            ignore_lists = False
-        else:
-            ignore_lists = True
-        if "tag_granularity" in order:
-            # tag granularity controls to which level tags are used
-            # later i'd like also the option to set this per tag
-            tag_granularity = order["tag_granularity"]
-        else:
-            tag_granularity = -1
+    for order in compile_iob_orders(orders):
         annotations = []
 
         # mode: decide if text is taken from the full node or only the head node
@@ -150,69 +168,34 @@ def process_document(docpath, orders):
         # if depth == 1 (flat tags) we simply take the top tag
 
         for t, ancestors in zip(tokens, ancestors_list):
-            if ignore_lists:
+            if order.ignore_lists:
                 ancestors = [a for a in ancestors if a.tag != "List"]
-            if mode == "heads":
+            if order.heads:
                 ancestors = list(reversed(ancestors))
             tags = []
             to_filter = []
             p = None
-            if mode == "heads":
+            if order.heads:
                 is_head = True if t.getparent().tag == "Head" or t.getparent().tag in NODES_WITHOUT_HEADS else False
                 if not is_head:
                     tags = "O"
                     annotations.append(tags)
                     continue
-            for i in range(depth):
+            for i in range(order.depth):
                 if i >= len(ancestors):
                     continue
                 p = ancestors[i]
-                tag_dict = {}
-                filter_dict = {}
-                for o_t in ordered_tags:
-                    # check if any of the tags do return something
-                    split_o_t = o_t.split("|")
-                    for o in split_o_t:
-                        tag = p.get(o)
-                        if tag != None:
-                            break
-                    if tag != None:
-                        if tag_granularity != -1:
-                            tag = "_".join(tag.split("_")[:tag_granularity])
-                        if ordered_tags[o_t] and tag not in ordered_tags[o_t]:
-                            # only include the tags in the included_tags list
-                            continue
-                        tag_dict[o] = tag
-                for f_t in filter:
-                    # check if any of the tags do return something
-                    f_t = f_t.split("|")
-                    for o in f_t:
-                        tag = p.get(o)
-                        if tag != None:
-                            break
-                    if tag != None:
-                        filter_dict[o] = tag
+                tag_dict, filter_dict = order.get_tags(p.get)
                 if len(tag_dict) > 0:
                     to_filter.append(filter_dict)
                     tags.append(tag_dict)
-            is_filtered = False
-            if tags:
-                for f in filter_strict:
-                    if f not in to_filter[0] or to_filter[0][f] not in filter_strict[f]:
-                        is_filtered = True
-                        break
-                for f in filter:
-                    # NOTE: We only filter the first level of depth currently
-                    if f in to_filter[0] and to_filter[0][f] not in filter[f]:
-                        is_filtered = True
-                        break
-                if is_filtered:
-                    tags = "O"
-                    annotations.append(tags)
-                    continue
+            if tags and order.is_filtered(to_filter[0]):
+                tags = "O"
+                annotations.append(tags)
+                continue
             # attach B or I
             if tags:
-                if check_if_first(t, p, True if mode == "heads" else False):
+                if check_if_first(t, p, order.heads):
                     attach = "B-"
                 else:
                     attach = "I-"
@@ -8,25 +8,35 @@ This is a text !
 """
 
 from lxml import etree as et
+try:
+    from . import text_encoding
+    from .config_compiler import compile_nne_config
+except ImportError:
+    import text_encoding
+    from config_compiler import compile_nne_config
 import pprint as pp
 
 
 def process_document(docpath, config):
-    root = et.parse(docpath).getroot()
-    tokens = root.findall(".//T")
-    text = " ".join([t.text for t in tokens])
+    return process_root(text_encoding.load(docpath), config)
+
+
+def process_root(root, config):
+    """
+    Same as process_document for an already parsed Standard XML document, the document is not modified.
+    """
+    config = compile_nne_config(config)
+    text = " ".join(text_encoding.get_tokens(root))
+    # the elements of all tags are collected in one pass over the document (in document order)
+    elems_by_tag = {}
+    for elem in root.iterdescendants(*config.tags):
+        elems_by_tag.setdefault(elem.tag, []).append(elem)
     annotations = []
-    for tag in config["tags"]:
-        elems = root.findall(f".//{tag}")
-        for elem in elems:
-            tag_list = [("tag", config["tags"][tag]["tag"])]
-            for attr in config["tags"][tag]:
-                if attr == "tag":
-                    continue
-                tag_list.append((config["tags"][tag][attr]["prefix"], "_".join(elem.get(attr).split("_")[:config["tag_granularity"]])))
+    for tag in config.tags:
+        for elem in elems_by_tag.get(tag, []):
             start = elem.get("start")
             end = elem.get("end")
-            definite_tag = ";".join([":".join(t) for t in tag_list])
+            definite_tag = config.label(elem)
             annotation = f"{start},{end} {definite_tag}"
             annotations.append(annotation)
             
@@ -6,16 +6,22 @@ Example output:
 This is a text !
 3,4 text|0,1 this
 
-If we change the custom standoff xml to be based on tokens instead of character indices at some point,
-we could simplify this script a lot by not having to go over the inline script.
+Standard XML is based on tokens now, so the spans are computed directly from its offsets (see encode_offsets),
+only documents whose annotations are not properly nested still go over the inline tree.
 """
 
+import copy
 try:
-    from . import to_inline
+    from . import iob_encoder, text_encoding, to_inline
+    from .corrections import warn_att_full_coverage
 except ImportError:
-    import to_inline
+    import iob_encoder, text_encoding, to_inline
+    from corrections import warn_att_full_coverage
 from lxml import etree as et
 
+# all attributes are available for config["attribs"] (see to_inline.add_attributes)
+ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
+
 
 def tokenize_tree(root, parent=None):
     """
@@ -82,9 +88,154 @@ SPAN_TYPE_CONVERSION_DICT = {
 
 
 def process_document(docpath, config):
-    # first transform it to inline xml so we have an easy to process hierarchy
-    texttree = to_inline.process_document(docpath)
+    return process_root(text_encoding.load(docpath), config)
+
+
+def process_root(root, config):
+    """
+    Same as process_document for an already parsed Standard XML document, the document is not modified.
+    """
+    encoded = encode_offsets(root, config)
+    if encoded is not None:
+        return encoded
+    # transform it to inline xml so we have an easy to process hierarchy
+    return process_inline(to_inline.process_root(copy.deepcopy(root)), config)
+
+
+def get_attrib_labels(get, config):
+    """
+    The (attribute, label) pairs of config["attribs"] which the element has, get returns None for missing attributes.
+    """
+    labels = []
+    for attrib in config["attribs"]:
+        l = get(attrib)
+        if l is not None:
+            if config["tag_granularity"] != -1:
+                l = "_".join(l.split("_")[:config["tag_granularity"]])
+            labels.append((attrib, l))
+    return labels
+
+
+def append_labels(out_tags, start, end, labels, split_labels):
+    if split_labels:
+        out_tags.extend((start, end, f"{key}:{value}") for key, value in labels)
+    else:
+        out_tags.append((start, end, ".".join(value for _, value in labels)))
+
+
+def encode_offsets(root, config):
+    """
+    Returns the same as process_inline (the document is not modified), but computed from the token offsets:
+    the spans and their heads are nested with a stack (see iob_encoder) while the token list is built,
+    the pretagged markers are added when an element is opened or closed,
+    so the start and end of every element in the token list are known right away.
+    Returns None if the annotations are not properly nested or a node has no tokens,
+    then the inline tree has to be used.
+    """
+    if "Head" in config["tags"]:
+        return None
+    base_tokens = text_encoding.get_tokens(root)
+    for c in to_inline.TO_CONVERT:
+        for node in root.iterfind(c):
+            if int(node.get("start")) >= int(node.get("end")):
+                # the inline tree puts these behind all tokens
+                return None
+    spans = iob_encoder.get_spans(root, len(base_tokens))
+    if spans is None:
+        return None
+    if iob_encoder.get_head_owners(spans, iob_encoder.get_chains(spans, len(base_tokens))) is None:
+        return None
+    # the same warning as for the inline tree, where to_inline fixes these
+    warn_att_full_coverage(root)
+
+    pretagged_heads = config.get("assume_pretagged_heads")
+    pretagged_first_layer = config.get("assume_pretagged_first_layer")
+
+    token_list = []
+    span_ranges = [None] * len(spans)
+    head_ranges = []  # (span index, start, end) in the order of the heads
+    # open elements: [end offset, span index, is head, closing markers, below a span of config["tags"]]
+    stack = []
+    next_span = 0
+    for i in range(len(base_tokens) + 1):
+        while stack and stack[-1][0] <= i:
+            end, j, is_head, markers, _ = stack.pop()
+            token_list.extend(markers)
+            if is_head:
+                head_ranges[-1] = (j, head_ranges[-1][1], len(token_list))
+            else:
+                span_ranges[j] = (span_ranges[j][0], len(token_list))
+        if i == len(base_tokens):
+            break
+        while next_span < len(spans) and spans[next_span].start == i:
+            span = spans[next_span]
+            covered = bool(stack) and stack[-1][4]
+            markers = []
+            if pretagged_first_layer and not covered and span.tag in config["tags"]:
+                # once for every time the tag is given, just like the inline tree is pretagged once per tag
+                span_type = SPAN_TYPE_CONVERSION_DICT[span.tag]
+                markers = [f"</{span_type}>"] * config["tags"].count(span.tag)
+                token_list.extend([f"<{span_type}>"] * len(markers))
+            span_ranges[next_span] = (len(token_list) - len(markers), None)
+            stack.append([span.end, next_span, False, markers, covered or span.tag in config["tags"]])
+            next_span += 1
+        if stack and not stack[-1][2]:
+            j = stack[-1][1]
+            if spans[j].head is not None and spans[j].head[0] == i:
+                head_ranges.append((j, len(token_list), None))
+                markers = []
+                if pretagged_heads:
+                    token_list.append("<head>")
+                    markers = ["</head>"]
+                stack.append([spans[j].head[1], j, True, markers, stack[-1][4]])
+        token_list.append(base_tokens[i])
+
+    out_tags = []
+    split_labels = bool(config.get("split_labels"))
+
+    if config.get("add_heads2"):
+        for j, start, end in head_ranges:
+            node = spans[j].node
+            labels = [("h", "head")]
+            if config.get("add_span_type"):
+                labels.append(("span_type", SPAN_TYPE_CONVERSION_DICT[node.tag]))
+            labels.extend(get_attrib_labels(lambda name: iob_encoder.get_attribute(node, name, ATTRIBUTES_TO_INCLUDE), config))
+            append_labels(out_tags, start, end, labels, split_labels)
+
+    spans_by_tag = {}
+    for j, span in enumerate(spans):
+        spans_by_tag.setdefault(span.tag, []).append(j)
+    for tag in config["tags"]:
+        for j in spans_by_tag.get(tag, []):
+            node = spans[j].node
+            start, end = span_ranges[j]
+            labels = []
+            if config.get("add_heads2"):
+                labels.append(("h", "ctxt"))
+            if config.get("add_span_type"):
+                labels.append(("span_type", SPAN_TYPE_CONVERSION_DICT[node.tag]))
+            labels.extend(get_attrib_labels(lambda name: iob_encoder.get_attribute(node, name, ATTRIBUTES_TO_INCLUDE), config))
+            if not labels:
+                print("Warning: A tag was given but none of the given attributes could be found in the tag! Did you maybe forget to add the attribute?")
+            append_labels(out_tags, start, end, labels, split_labels)
+
+    if config.get("add_heads"):
+        for _, start, end in head_ranges:
+            append_labels(out_tags, start, end, [("h", "head")], split_labels)
 
+    if config.get("add_lists"):
+        for j in spans_by_tag.get("List", []):
+            start, end = span_ranges[j]
+            append_labels(out_tags, start, end, [("l", "list")], split_labels)
+
+    return token_list, out_tags
+
+
+def process_inline(texttree, config):
+    """
+    Same as process_document for an already created inline tree.
+    NOTE: The inline tree is modified (the text is split into <T> elements, pretagging).
+    """
     to_inline.ATTRIBUTES_TO_INCLUDE = ["_ALL_"]
     tokenize_tree(texttree)
 
@@ -103,11 +254,11 @@ def process_document(docpath, config):
             spans = texttree.findall(f".//{tag}")
             for span in spans:
                 parent = span.getparent()
-                while parent.tag != "Text" and parent.tag not in config["tags"]:
+                while parent.tag != "Body" and parent.tag not in config["tags"]:
                     # loop until you find either a valid tag or the body element, if lists are processed, those count as well (TODO!)
                     parent = parent.getparent()
-                if parent.tag == "Text":
-                    # only if the parent is a Text-Element we have a first-layer span
+                if parent.tag == "Body":
+                    # only if the parent is the Body we have a first-layer span
                     starthead = et.Element("T")
                     starthead.text = f"<{SPAN_TYPE_CONVERSION_DICT[span.tag]}>"
                     endhead = et.Element("T")
@@ -0,0 +1,60 @@
+"""
+Checks that starting the CLI stays cheap.
+Every module is imported in a fresh interpreter with `python -X importtime`, the cumulative import time
+is compared against its budget. Additionally `import cli` must not load any of the heavy modules,
+they should only be imported by the subcommand that needs them.
+
+Run from anywhere with
+python utils/import_benchmark.py
+Exits with 1 if a budget is exceeded.
+"""
+
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5  # we take the fastest run, the others are usually disturbed by the file cache
+BUDGETS_MS = {  # cumulative import time in milliseconds
+    "cli": 30,
+    "postprocess": 100,
+}
+FORBIDDEN_ON_STARTUP = ["lxml", "postprocess", "transformation", "numpy"]  # must not be imported by `import cli`
+
+
+def measure_import(module):
+    """
+    Returns the cumulative import time of module in ms (fastest of RUNS) and the modules it loaded.
+    """
+    times = []
+    loaded = []
+    for _ in range(RUNS):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        loaded = proc.stdout.split()
+        for line in proc.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:"):
+                continue
+            fields = [f.strip() for f in line[len("import time:"):].split("|")]
+            if fields[2] == module:
+                times.append(int(fields[1]) / 1000)
+    return min(times), loaded
+
+
+if __name__ == "__main__":
+    ok = True
+    for module, budget in BUDGETS_MS.items():
+        time_ms, loaded = measure_import(module)
+        status = "OK" if time_ms <= budget else "TOO SLOW"
+        ok = ok and time_ms <= budget
+        print(f"{module:<15} {time_ms:8.1f} ms (budget {budget} ms) {status}")
+
+        if module == "cli":
+            heavy = sorted(m for m in loaded if m.split(".")[0] in FORBIDDEN_ON_STARTUP)
+            if heavy:
+                ok = False
+                print(f"ERROR: `import cli` loads {', '.join(heavy)}, these should only be imported by the subcommands.")
+
+    sys.exit(0 if ok else 1)
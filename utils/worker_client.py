@@ -0,0 +1,109 @@
+"""
+Small client for postprocess_worker.py, mainly for testing.
+Sends the given XMI files to the worker and prints the responses as they come in.
+
+If --socket is given, the client connects to a running worker, otherwise it starts
+a worker itself and talks to it over stdin/stdout.
+
+python utils/worker_client.py --socket /tmp/postprocess.sock ./data/exported/test/*.xmi
+python utils/worker_client.py --bytes --check ./data/exported/test/*.xmi
+"""
+
+import argparse
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "postprocess_worker.py")
+
+
+def create_requests(infiles, send_bytes=False, check=False, outfolder=None, crossing_policy=None, text_encoding=None):
+    for i, infile in enumerate(infiles):
+        request = {"id": i}
+        if send_bytes:
+            with open(infile, mode="rb") as inf:
+                request["xmi_b64"] = base64.b64encode(inf.read()).decode("ascii")
+            request["name"] = os.path.basename(infile)
+        else:
+            request["path"] = os.path.abspath(infile)
+        if check:
+            request["check"] = True
+        if outfolder is not None:
+            request["outfolder"] = outfolder
+        if crossing_policy is not None:
+            request["crossing_policy"] = crossing_policy
+        if text_encoding is not None:
+            request["text_encoding"] = text_encoding
+        yield json.dumps(request) + "\n"
+
+
+def write_requests(write, requests, close):
+    """
+    Writes all requests and closes the sending side afterwards. Runs in its own thread,
+    so the responses are read while the requests are still being sent (otherwise both sides can block on full buffers).
+    """
+    try:
+        for request in requests:
+            write(request)
+    except (BrokenPipeError, OSError):
+        # the worker is gone, the reading side notices it as well
+        pass
+    finally:
+        try:
+            close()
+        except OSError:
+            pass
+
+
+def send_socket(path, requests):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        # tell the worker we're done once everything is sent, the answers still come in on the same connection
+        writer = threading.Thread(target=write_requests, args=(lambda request: sock.sendall(request.encode("utf8")), requests, lambda: sock.shutdown(socket.SHUT_WR)), daemon=True)
+        writer.start()
+        with sock.makefile("r", encoding="utf8") as responses:
+            for response in responses:
+                yield json.loads(response)
+        writer.join()
+
+
+def send_subprocess(requests, workers=None):
+    cmd = [sys.executable, WORKER_SCRIPT]
+    if workers is not None:
+        cmd += ["--workers", str(workers)]
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) as proc:
+        writer = threading.Thread(target=write_requests, args=(proc.stdin.write, requests, proc.stdin.close), daemon=True)
+        writer.start()
+        for response in proc.stdout:
+            yield json.loads(response)
+        writer.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send XMI files to postprocess_worker.py.")
+    parser.add_argument("infiles", nargs="+")
+    parser.add_argument("--socket", help="unix socket of a running worker, if not given a worker is started")
+    parser.add_argument("--workers", type=int, help="number of workers if a worker is started")
+    parser.add_argument("--bytes", action="store_true", help="send the file contents instead of the paths")
+    parser.add_argument("--check", action="store_true", help="only validate the documents")
+    parser.add_argument("--outfolder", help="where the worker should write the Standard XML")
+    parser.add_argument("--crossing-policy", help="how the worker repairs crossing spans, see postprocess.CROSSING_SPAN_POLICIES")
+    parser.add_argument("--text-encoding", help="how the worker writes the text, see postprocess.TEXT_ENCODINGS")
+    args = parser.parse_args()
+
+    outfolder = os.path.abspath(args.outfolder) if args.outfolder else None
+    requests = create_requests(args.infiles, args.bytes, args.check, outfolder, args.crossing_policy, args.text_encoding)
+    if args.socket:
+        responses = send_socket(args.socket, requests)
+    else:
+        responses = send_subprocess(requests, args.workers)
+
+    all_ok = True
+    for response in responses:
+        all_ok = all_ok and response["ok"]
+        print(json.dumps(response, ensure_ascii=False))
+    sys.exit(0 if all_ok else 1)